@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark waiting for new channels on idle server connections.
+
+Starts a server in a child process and opens --connections idle sessions
+to it, each on its own SSH connection. The server's threads and their idle
+wakeups per second (voluntary context switches, read from /proc, Linux
+only) are reported by thread name. paramiko's transport threads, which
+check their socket 10 times a second, and the sessions' reader threads are
+both named Thread. The latency of opening a
+session (a new channel and hello) on an existing connection is measured
+--channels times, and the time the server takes to close with all the
+connections open (until their threads have exited) is reported.
+
+Use: ./netconf-accept-bench.py --connections 100 --idle 5
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import re
+import sys
+import threading
+import time
+from sshutil.cache import SSHConnectionCache, SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+def get_wakeups ():
+    "Return {thread name: [threads, voluntary context switches]} of our threads"
+    groups = {}
+    for thread in threading.enumerate():
+        try:
+            with open("/proc/self/task/{}/status".format(thread.native_id)) as f:
+                for line in f:
+                    if line.startswith("voluntary_ctxt_switches:"):
+                        group = groups.setdefault(re.sub(r"[- ]\d.*", "", thread.name), [ 0, 0 ])
+                        group[0] += 1
+                        group[1] += int(line.split()[1])
+        except IOError:
+            # The thread exited.
+            pass
+    return groups
+
+
+def run_server (args, ready, conn):
+    logging.basicConfig(level=logging.ERROR)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       port=args.port,
+                                       host_key=args.host_key)
+    baseline = threading.active_count()
+    ready.set()
+    # Block rather than poll so we don't add wakeups.
+    while conn.recv() == "wakeups":
+        conn.send(get_wakeups())
+    # The connections are closed by their threads, time until these have
+    # exited.
+    start = time.time()
+    ncserver.close()
+    while threading.active_count() > baseline and time.time() - start < 30:
+        time.sleep(.001)
+    conn.send(time.time() - start)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark idle server connections waiting for channels")
+    parser.add_argument("--connections", type=int, default=100, help="Idle connections to open")
+    parser.add_argument("--channels", type=int, default=200, help="Sessions to time opening")
+    parser.add_argument("--idle", type=float, default=5, help="Seconds to count idle wakeups over")
+    parser.add_argument("--port", type=int, default=18520, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ready = multiprocessing.Event()
+    pconn, cconn = multiprocessing.Pipe()
+    sproc = multiprocessing.Process(target=run_server, args=(args, ready, cconn))
+    sproc.start()
+    ready.wait()
+
+    cache = SSHNoConnectionCache()
+    sessions = []
+    try:
+        for unused in range(args.connections):
+            sessions.append(client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                                     password=PASSWORD, cache=cache))
+        time.sleep(1)
+        pconn.send("wakeups")
+        before = pconn.recv()
+        time.sleep(args.idle)
+        pconn.send("wakeups")
+        after = pconn.recv()
+        print("{} idle connections: server threads {} idle wakeups {:.1f}/s".format(
+            args.connections,
+            sum(threads for threads, unused in after.values()),
+            sum(after[name][1] - before.get(name, [ 0, 0 ])[1] for name in after) / args.idle),
+              file=sys.stderr)
+        for name in sorted(after):
+            threads, wakeups = after[name]
+            print("  {:24} threads {:5d} idle wakeups {:8.1f}/s".format(
+                name, threads, (wakeups - before.get(name, [ 0, 0 ])[1]) / args.idle), file=sys.stderr)
+
+        pool = SSHConnectionCache("Accept Bench", max_channels=2)
+        first = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                         password=PASSWORD, cache=pool)
+        latencies = []
+        for unused in range(args.channels):
+            start = time.time()
+            session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                               password=PASSWORD, cache=pool)
+            latencies.append(time.time() - start)
+            session.close()
+        first.close()
+        pool.flush()
+        latencies.sort()
+        print("channel open + hello on an existing connection p50 {:.2f} ms p99 {:.2f} ms".format(
+            latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * .99)] * 1000),
+              file=sys.stderr)
+
+        pconn.send("close")
+        print("server close with {} connections {:.3f}s".format(args.connections, pconn.recv()),
+              file=sys.stderr)
+    finally:
+        if sproc.is_alive():
+            try:
+                pconn.send("close")
+            except (IOError, OSError):
+                pass
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark admission control during a connection storm.
+
+Starts a server in a child process with --max-sessions and --handshake-rate
+limits that sends a notification stamped with the time every --interval
+seconds to its subscribers. --subscribers sessions subscribe and the delay
+until each notification is received is measured. For --duration seconds
+each phase, --storm client processes open new connections as fast as they
+can: with no storm, with the storm, and with the storm while the server is
+in overload mode. The connections admitted and rejected (by reason) by the
+server, the storm's successful and failed connections, and the subscribers'
+notification delay percentiles are reported per phase.
+
+Use: ./netconf-admission-bench.py --storm 4 --handshake-rate 50
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from lxml import etree
+from sshutil.cache import SSHConnectionCache, SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+NOTIF = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">""" \
+        """<eventTime>2016-12-14T00:00:00Z</eventTime>""" \
+        """<bench-tick xmlns="urn:example:bench"><sent>{}</sent></bench-tick></notification>"""
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_create_subscription (self, session, unused_rpc, *unused_params):
+        session.subscription_active = True
+        return etree.Element("ok")
+
+
+def run_server (args, ready, stop, conn):
+    logging.basicConfig(level=logging.CRITICAL)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       max_sessions=args.max_sessions,
+                                       handshake_rate=args.handshake_rate)
+
+    def ticker ():
+        while not stop.wait(args.interval):
+            ncserver.trigger_notification(NOTIF.format(repr(time.time())))
+
+    thread = threading.Thread(target=ticker)
+    thread.daemon = True
+    thread.start()
+    ready.set()
+    while not stop.wait(.05):
+        if conn.poll():
+            overload = conn.recv()
+            if overload is True:
+                ncserver.set_overload("benchmark")
+            elif overload is False:
+                ncserver.clear_overload()
+            conn.send(ncserver.admission.get_stats())
+    ncserver.close()
+
+
+def run_storm (args, running, conn):
+    logging.basicConfig(level=logging.CRITICAL)
+    cache = SSHNoConnectionCache()
+    opened = failed = 0
+    while running.is_set():
+        try:
+            session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                               password=PASSWORD, cache=cache)
+            session.close()
+            opened += 1
+        except Exception:
+            failed += 1
+    conn.send((opened, failed))
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark admission control during a connection storm")
+    parser.add_argument("--storm", type=int, default=4, help="Storm client processes")
+    parser.add_argument("--subscribers", type=int, default=8, help="Subscribed sessions")
+    parser.add_argument("--max-sessions", type=int, default=64, help="Server connection limit")
+    parser.add_argument("--handshake-rate", type=float, default=50, help="Server handshakes per second")
+    parser.add_argument("--interval", type=float, default=.05, help="Seconds between notifications")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per phase")
+    parser.add_argument("--port", type=int, default=18580, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    pconn, cconn = multiprocessing.Pipe()
+    sproc = multiprocessing.Process(target=run_server, args=(args, ready, stop, cconn))
+    sproc.start()
+    ready.wait()
+
+    def server_stats (overload=None):
+        pconn.send(overload)
+        return pconn.recv()
+
+    # The storm is started once this process has session threads running.
+    mpctx = multiprocessing.get_context("spawn")
+    delays = []
+    lock = threading.Lock()
+
+    def tick (notif):
+        delay = time.time() - float(notif.findtext(".//{urn:example:bench}sent"))
+        with lock:
+            delays.append(delay)
+
+    cache = SSHConnectionCache("Admission Bench", max_channels=args.subscribers)
+    sessions = []
+    try:
+        for unused in range(args.subscribers):
+            session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                               password=PASSWORD, cache=cache)
+            session.subscribe(callback=tick)
+            sessions.append(session)
+
+        for name, storm, overload in (("no storm", False, None), ("storm", True, None),
+                                      ("overload", True, True)):
+            before = server_stats(overload)
+            running = mpctx.Event()
+            running.set()
+            procs = []
+            if storm:
+                for unused in range(args.storm):
+                    spconn, scconn = mpctx.Pipe()
+                    proc = mpctx.Process(target=run_storm, args=(args, running, scconn))
+                    proc.start()
+                    procs.append((proc, spconn))
+            with lock:
+                del delays[:]
+            time.sleep(args.duration)
+            running.clear()
+            opened = failed = 0
+            for proc, spconn in procs:
+                sopened, sfailed = spconn.recv()
+                opened += sopened
+                failed += sfailed
+                proc.join()
+            after = server_stats(False if overload else None)
+            with lock:
+                phase = sorted(delays)
+            counts = { key: after[key] - before[key] for key in after if key.startswith(("admitted", "rejected")) }
+            print("{:9} storm opened {:5d} failed {:5d} server admitted {:5d} rejected {:5d} "
+                  "(overload {} sessions {} rate {}) notification delay p50 {:6.2f} ms p99 {:6.2f} ms".format(
+                      name, opened, failed, counts["admitted"], counts["rejected"],
+                      counts["rejected_overload"], counts["rejected_sessions"], counts["rejected_rate"],
+                      phase[len(phase) // 2] * 1000 if phase else 0,
+                      phase[int(len(phase) * .99)] * 1000 if phase else 0),
+                  file=sys.stderr)
+    finally:
+        for session in sessions:
+            session.close()
+        cache.close()
+        stop.set()
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
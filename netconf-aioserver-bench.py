@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark the asyncio server against the threaded server.
+
+Starts a NetconfSSHServer and then an AsyncNetconfSSHServer in a child
+process. --sessions client sessions (sharing pooled SSH connections) each
+send --rpcs gets one at a time, the get round trip time percentiles and
+gets per second are reported. The sessions then subscribe and the server
+sends --notifications notifications to all of them, the notifications
+delivered per second are reported. The server's thread count is read from
+/proc (Linux).
+
+Use: ./netconf-aioserver-bench.py --sessions 32 --rpcs 200
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from lxml import etree
+from sshutil.cache import SSHConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+NOTIF = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">""" \
+        """<eventTime>2016-12-14T00:00:00Z</eventTime>""" \
+        """<vnf-alarm xmlns="urn:samsung:vnf-alarm-interface">""" \
+        """<event-time>2016-12-14T00:00:00Z</event-time><system-dn>NE=1</system-dn>""" \
+        """<alarm-severity>3</alarm-severity><alarm-info>link down</alarm-info></vnf-alarm></notification>"""
+
+
+class BenchMethods (server.NetconfMethods):
+    def __init__ (self):
+        self.server = None
+
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+    def rpc_create_subscription (self, session, unused_rpc, *unused_params):
+        session.subscription_active = True
+        return etree.Element("ok")
+
+    def rpc_flood (self, unused_session, rpc, *unused_params):
+        for unused in range(int(rpc.find("{*}flood").get("count"))):
+            self.server.trigger_notification(NOTIF)
+        return etree.Element("ok")
+
+
+def run_server (args, use_asyncio, ready, stop):
+    logging.basicConfig(level=logging.ERROR)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    methods = BenchMethods()
+    if use_asyncio:
+        import asyncio
+        from netconf.aioserver import AsyncNetconfSSHServer
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        ncserver = AsyncNetconfSSHServer(server_ctl=ctl,
+                                         server_methods=methods,
+                                         port=args.port,
+                                         host_key=args.host_key,
+                                         loop=loop)
+        methods.server = ncserver
+        threading.Thread(target=lambda: (stop.wait(), loop.call_soon_threadsafe(loop.stop))).start()
+        ready.set()
+        loop.run_forever()
+        ncserver.close()
+        loop.close()
+    else:
+        ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                           server_methods=methods,
+                                           port=args.port,
+                                           host_key=args.host_key)
+        methods.server = ncserver
+        ready.set()
+        stop.wait()
+        ncserver.close()
+
+
+def get_threads (pid):
+    with open("/proc/{}/status".format(pid)) as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_rpcs (args, session, rtts):
+    for unused in range(args.rpcs):
+        start = time.time()
+        session.send_rpc("<get/>")
+        rtts.append(time.time() - start)
+
+
+def bench_mode (args, name, pid):
+    cache = SSHConnectionCache("Server Bench", max_channels=args.max_channels)
+    sessions = [ client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                          password=PASSWORD, cache=cache)
+                 for unused in range(args.sessions) ]
+    try:
+        rtts = []
+        threads = [ threading.Thread(target=run_rpcs, args=(args, session, rtts)) for session in sessions ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        server_threads = get_threads(pid)
+        rtts.sort()
+
+        received = [ 0 ]
+        lock = threading.Lock()
+        done = threading.Event()
+        total = args.sessions * args.notifications
+
+        def count (unused_notif):
+            with lock:
+                received[0] += 1
+                if received[0] == total:
+                    done.set()
+
+        for session in sessions:
+            session.subscribe(callback=count)
+        nstart = time.time()
+        sessions[0].send_rpc('<flood count="{}"/>'.format(args.notifications))
+        done.wait(args.notifications / 100 + 30)
+        nelapsed = time.time() - nstart
+
+        print("{:8} server threads {:4d} get rtt p50 {:6.2f} ms p99 {:6.2f} ms {:8.1f} gets/s "
+              "notifications {:7d}/{:7d} {:9.1f}/s".format(
+                  name, server_threads, rtts[len(rtts) // 2] * 1000, rtts[int(len(rtts) * .99)] * 1000,
+                  len(rtts) / elapsed, received[0], total, received[0] / nelapsed),
+              file=sys.stderr)
+    finally:
+        for session in sessions:
+            session.close()
+        cache.close()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark the asyncio server against the threaded server")
+    parser.add_argument("--sessions", type=int, default=32, help="Client sessions")
+    parser.add_argument("--rpcs", type=int, default=200, help="Gets sent on each session")
+    parser.add_argument("--notifications", type=int, default=500, help="Notifications sent to each session")
+    parser.add_argument("--max-channels", type=int, default=8, help="Sessions per pooled connection")
+    parser.add_argument("--port", type=int, default=18390, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    for name, use_asyncio in (("threaded", False), ("asyncio", True)):
+        ready = multiprocessing.Event()
+        stop = multiprocessing.Event()
+        sproc = multiprocessing.Process(target=run_server, args=(args, use_asyncio, ready, stop))
+        sproc.start()
+        ready.wait()
+        try:
+            bench_mode(args, name, sproc.pid)
+        finally:
+            stop.set()
+            sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
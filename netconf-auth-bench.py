@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark password authentication with a slow backend.
+
+Starts a server in a child process using SSHAuthController whose password
+checks go to a stand-in for PAM that takes --delay seconds (e.g., an LDAP
+or RADIUS backed PAM module). --clients threads each make --logins new
+connections, first with the login cache disabled and then enabled. The
+logins per second and client connect latency, and the server's password
+check latency percentiles, cache hits and failures are reported.
+
+Use: ./netconf-auth-bench.py --clients 16 --delay .2
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from sshutil.auth import PasswordAuthenticator
+from sshutil.cache import SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+def run_server (args, cache_ttl, ready, stop, conn):
+    logging.basicConfig(level=logging.CRITICAL)
+
+    def check (username, password):
+        time.sleep(args.delay)
+        return username == USER and password == PASSWORD
+
+    ctl = server.SSHAuthController(users=[ USER ])
+    ctl.pam = PasswordAuthenticator(check,
+                                    workers=args.workers,
+                                    backlog=args.backlog,
+                                    timeout=args.timeout,
+                                    cache_ttl=cache_ttl)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       port=args.port,
+                                       host_key=args.host_key)
+    ready.set()
+    stop.wait()
+    conn.send(ctl.get_auth_stats())
+    ncserver.close()
+
+
+def run_logins (args, latencies, errors):
+    cache = SSHNoConnectionCache()
+    for unused in range(args.logins):
+        start = time.time()
+        try:
+            session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                               password=PASSWORD, cache=cache)
+            session.close()
+            latencies.append(time.time() - start)
+        except Exception:
+            errors.append(time.time() - start)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark password authentication with a slow backend")
+    parser.add_argument("--clients", type=int, default=16, help="Clients logging in in parallel")
+    parser.add_argument("--logins", type=int, default=10, help="Logins by each client")
+    parser.add_argument("--delay", type=float, default=.2, help="Seconds each backend check takes")
+    parser.add_argument("--workers", type=int, default=4, help="Server auth workers")
+    parser.add_argument("--backlog", type=int, default=32, help="Server auth backlog")
+    parser.add_argument("--timeout", type=float, default=5, help="Server auth timeout")
+    parser.add_argument("--cache-ttl", type=float, default=30, help="Server login cache TTL")
+    parser.add_argument("--port", type=int, default=18600, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    for name, cache_ttl in (("uncached", 0), ("cached", args.cache_ttl)):
+        ready = multiprocessing.Event()
+        stop = multiprocessing.Event()
+        pconn, cconn = multiprocessing.Pipe()
+        sproc = multiprocessing.Process(target=run_server, args=(args, cache_ttl, ready, stop, cconn))
+        sproc.start()
+        ready.wait()
+        try:
+            latencies = []
+            errors = []
+            threads = [ threading.Thread(target=run_logins, args=(args, latencies, errors))
+                        for unused in range(args.clients) ]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - start
+        finally:
+            stop.set()
+            stats = pconn.recv()
+            sproc.join()
+
+        latencies.sort()
+        lstats = stats["latency"]
+        print("{:9} {:6.1f} logins/s failed {:4d} connect p50 {:7.1f} ms p99 {:7.1f} ms | server check "
+              "p50 {} p99 {} cache hits {} backend {} timeouts {} rejected {}".format(
+                  name, len(latencies) / elapsed, len(errors),
+                  latencies[len(latencies) // 2] * 1000 if latencies else 0,
+                  latencies[int(len(latencies) * .99)] * 1000 if latencies else 0,
+                  "{:.3f}s".format(lstats["p50"]) if lstats["p50"] is not None else "-",
+                  "{:.3f}s".format(lstats["p99"]) if lstats["p99"] is not None else "-",
+                  stats["cache_hit"], stats["success"] + stats["failure"], stats["timeout"], stats["rejected"]),
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
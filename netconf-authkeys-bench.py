@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark authorized key lookups for users with many keys.
+
+Writes an authorized_keys file of mixed Ed25519, ECDSA and RSA keys and
+times indexing it, looking up present and absent keys, and a linear scan
+comparing against every key for reference.
+
+Use: ./netconf-authkeys-bench.py --keys 1000,5000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import time
+import paramiko as ssh
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from sshutil.authkeys import AuthorizedKeys
+
+
+def generate_public_keys (count):
+    "Return count OpenSSH public key lines, RSA keys are few as they are slow to generate"
+    lines = []
+    for idx in range(count):
+        if idx % 100 == 99:
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        elif idx % 2:
+            key = ec.generate_private_key(ec.SECP256R1())
+        else:
+            key = ed25519.Ed25519PrivateKey.generate()
+        public = key.public_key().public_bytes(serialization.Encoding.OpenSSH,
+                                               serialization.PublicFormat.OpenSSH)
+        lines.append(public.decode('ascii') + " user{}@bench".format(idx))
+    return lines
+
+
+def to_pkey (line):
+    "Return a paramiko key for an authorized_keys line (needs paramiko >= 3.2)"
+    ktype, data = line.split()[:2]
+    return ssh.PKey.from_type_string(ktype, base64.b64decode(data))
+
+
+def timeit (func, iterations):
+    start = time.time()
+    for unused in range(iterations):
+        func()
+    return (time.time() - start) / iterations
+
+
+def bench (count, iterations, keydir):
+    lines = generate_public_keys(count)
+    keyfile = os.path.join(keydir, "authorized_keys_{}".format(count))
+    with open(keyfile, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    index = AuthorizedKeys(lambda unused: keyfile)
+    start = time.time()
+    index.get_keys("bench")
+    build = time.time() - start
+
+    present = to_pkey(lines[-1])
+    absent = to_pkey(generate_public_keys(1)[0])
+    hit = timeit(lambda: index.is_authorized("bench", present), iterations)
+    miss = timeit(lambda: index.is_authorized("bench", absent), iterations)
+
+    # The previous approach: compare against every key in a list.
+    keys = [ to_pkey(line) for line in lines ]
+    scan = timeit(lambda: any(key == absent for key in keys), max(1, iterations // 100))
+
+    print("{:6d} keys: index build {:7.1f} ms, lookup hit {:6.1f} us, miss {:6.1f} us, "
+          "linear scan {:9.1f} us".format(count, build * 1000, hit * 1e6, miss * 1e6, scan * 1e6))
+    sys.stdout.flush()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark authorized key lookups")
+    parser.add_argument("--keys", default="10,1000,5000", help="Numbers of authorized keys to test")
+    parser.add_argument("--iterations", type=int, default=10000, help="Lookups to time")
+    args = parser.parse_args(*margs)
+
+    keydir = tempfile.mkdtemp()
+    try:
+        for count in args.keys.split(","):
+            bench(int(count), args.iterations, keydir)
+    finally:
+        shutil.rmtree(keydir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
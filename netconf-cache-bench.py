@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark a client cycling through many devices with a connection cache.
+
+Starts NETCONF servers on --devices ports in a child process. The client
+opens a session (a channel on a cached SSH connection) to each device in
+turn, does a get and closes it, for --rounds rounds. After each round the
+cache's hits, misses, evictions, expired and live sockets and the client's
+thread count are reported, then again once the unused connections have
+expired after --close-timeout. With --max-sockets below --devices the least
+recently used connections are evicted instead.
+
+Use: ./netconf-cache-bench.py --devices 50 --rounds 3 --close-timeout 2
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from lxml import etree
+from sshutil.cache import SSHConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+def run_servers (args, ready, stop):
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    servers = [ server.NetconfSSHServer(server_ctl=ctl,
+                                        server_methods=BenchMethods(),
+                                        port=args.port + idx,
+                                        host_key=args.host_key)
+                for idx in range(args.devices) ]
+    ready.set()
+    stop.wait()
+    for ncserver in servers:
+        ncserver.close()
+
+
+def report (label, cache, elapsed, peak_threads):
+    stats = cache.get_stats()
+    print("{:12} {:7.2f}s hits {:6d} misses {:6d} evictions {:6d} expired {:6d} "
+          "sockets {:5d} idle {:5d} timers {:5d} threads {:4d} (peak {:4d})".format(
+              label, elapsed, stats["hits"], stats["misses"], stats["evictions"], stats["expired"],
+              stats["sockets"], stats["idle"], stats["timers"], threading.active_count(), peak_threads),
+          file=sys.stderr)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark a connection cache cycling through devices")
+    parser.add_argument("--devices", type=int, default=50, help="Servers (ports) to cycle through")
+    parser.add_argument("--rounds", type=int, default=3, help="Sessions to each device")
+    parser.add_argument("--close-timeout", type=float, default=2,
+                        help="Seconds an unused connection is kept open")
+    parser.add_argument("--max-sockets", type=int, help="Cap on cached connections")
+    parser.add_argument("--port", type=int, default=18400, help="First server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    sproc = multiprocessing.Process(target=run_servers, args=(args, ready, stop))
+    sproc.start()
+    ready.wait()
+
+    cache = SSHConnectionCache("Cache Bench", close_timeout=args.close_timeout, max_sockets=args.max_sockets or 0)
+    try:
+        peak_threads = threading.active_count()
+        for rnd in range(args.rounds):
+            start = time.time()
+            for idx in range(args.devices):
+                session = client.NetconfSSHSession("localhost",
+                                                   port=args.port + idx,
+                                                   username=USER,
+                                                   password=PASSWORD,
+                                                   cache=cache)
+                session.send_rpc("<get/>")
+                session.close()
+                peak_threads = max(peak_threads, threading.active_count())
+            report("round {}".format(rnd + 1), cache, time.time() - start, peak_threads)
+
+        start = time.time()
+        while cache.get_stats()["sockets"] and time.time() - start < args.close_timeout + 5:
+            time.sleep(.1)
+        report("expired", cache, time.time() - start, peak_threads)
+    finally:
+        cache.close()
+        stop.set()
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
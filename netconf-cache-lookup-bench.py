@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark connection cache lookups with many cached connections.
+
+Starts SSH servers on --hosts ports in a child process and fills an
+SSHConnectionCache (one channel per connection so each use needs its own
+connection) with up to each of --per-host idle connections per host. At
+each size the time of a cache hit (get_ssh_socket and release_ssh_socket
+of an idle connection) is reported, from one thread and from --threads
+threads each using its own host. The cost of the socket health check the
+lookup used to do on every candidate connection is shown for reference,
+and LRU eviction is shown by then lowering the cap to half the connections.
+
+The number of keys (host:port@user) the cache holds is shown throughout,
+after --failed-connects lookups each to a different port with no server
+and after flushing the cache it should be back to the keys of the open
+connections.
+
+Use: ./netconf-cache-lookup-bench.py --hosts 10 --per-host 1 10 50
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+from sshutil.cache import SSHConnectionCache, socket_is_remote_closed
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+def run_servers (args, ready, stop):
+    logging.basicConfig(level=logging.CRITICAL)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    servers = [ server.NetconfSSHServer(server_ctl=ctl,
+                                        port=args.port + idx,
+                                        host_key=args.host_key)
+                for idx in range(args.hosts) ]
+    ready.set()
+    stop.wait()
+    for ncserver in servers:
+        ncserver.close()
+
+
+def fill (cache, ports, host="localhost"):
+    """Open a connection to each of ports at once and leave them idle in cache.
+
+    A session is opened on each, the server's handshake workers wait for the
+    first channel so the connection alone would hold one."""
+    sessions = [ client.NetconfSSHSession(host, port=port, username=USER, password=PASSWORD, cache=cache)
+                 for port in ports ]
+    for session in sessions:
+        session.close()
+
+
+def lookups (cache, port, count):
+    for unused in range(count):
+        sshsock = cache.get_ssh_socket("localhost", port, USER, PASSWORD, False)
+        cache.release_ssh_socket(sshsock, False)
+
+
+def time_threads (args, cache):
+    "Return the lookups per second of --threads threads each on its own host"
+    threads = [ threading.Thread(target=lookups, args=(cache, args.port + idx % args.hosts, args.lookups))
+                for idx in range(args.threads) ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return args.threads * args.lookups / (time.time() - start)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark connection cache lookups")
+    parser.add_argument("--hosts", type=int, default=10, help="Servers (ports)")
+    parser.add_argument("--per-host", type=int, nargs="+", default=[ 1, 10, 50 ],
+                        help="Idle connections per host to measure at")
+    parser.add_argument("--lookups", type=int, default=20000, help="Lookups per thread")
+    parser.add_argument("--threads", type=int, default=4, help="Threads looking up in parallel")
+    parser.add_argument("--failed-connects", type=int, default=50, help="Lookups of ports with no server")
+    parser.add_argument("--port", type=int, default=18620, help="First server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    sproc = multiprocessing.Process(target=run_servers, args=(args, ready, stop))
+    sproc.start()
+    ready.wait()
+
+    cache = SSHConnectionCache("Lookup Bench", close_timeout=3600, max_channels=1)
+    try:
+        for per_host in args.per_host:
+            # Each connection has one channel, so per_host sessions at once need as many connections.
+            fill(cache, [ args.port + idx for idx in range(args.hosts) for unused in range(per_host) ])
+            stats = cache.get_stats()
+
+            start = time.time()
+            lookups(cache, args.port, args.lookups)
+            single = (time.time() - start) * 1e6 / args.lookups
+            rate = time_threads(args, cache)
+
+            # Each candidate was checked this way by the lookup before.
+            sshsock = cache.get_ssh_socket("localhost", args.port, USER, PASSWORD, False)
+            start = time.time()
+            for unused in range(args.lookups):
+                socket_is_remote_closed(sshsock.sock)
+            check = (time.time() - start) * 1e6 / args.lookups
+            cache.release_ssh_socket(sshsock, False)
+
+            print("{:5d} connections ({:3d} per host) {:3d} keys hit {:6.2f} us {:3d} threads {:9.0f} lookups/s "
+                  "health check per candidate {:6.2f} us".format(
+                      stats["sockets"], per_host, stats["keys"], single, args.threads, rate, check),
+                  file=sys.stderr)
+
+        stats = cache.get_stats()
+        cache.max_sockets = stats["sockets"] // 2
+        # Evictions happen when a new connection is needed, 127.0.0.1 is not
+        # the key of any idle one.
+        start = time.time()
+        fill(cache, [ args.port ], "127.0.0.1")
+        elapsed = time.time() - start
+        after = cache.get_stats()
+        print("cap {} sockets: new connection evicted {} leaving {} sockets {} keys in {:.1f} ms".format(
+            cache.max_sockets, after["evictions"] - stats["evictions"], after["sockets"], after["keys"],
+            elapsed * 1000), file=sys.stderr)
+
+        # Each port is a key of its own while it is looked up.
+        failed = 0
+        for idx in range(args.failed_connects):
+            try:
+                cache.get_ssh_socket("localhost", args.port + args.hosts + idx, USER, PASSWORD, False)
+            except socket.error:
+                failed += 1
+        stats = cache.get_stats()
+        print("{} connects failed: {} sockets {} keys".format(failed, stats["sockets"], stats["keys"]),
+              file=sys.stderr)
+
+        cache.flush()
+        stats = cache.get_stats()
+        print("flushed: {} sockets {} keys".format(stats["sockets"], stats["keys"]), file=sys.stderr)
+    finally:
+        cache.close()
+        stop.set()
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
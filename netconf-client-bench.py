@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark NETCONF client session setup with and without connection pooling.
+
+Starts a server in this process and opens, uses and closes client sessions
+against it, once each with its own SSH connection and once sharing pooled
+connections. Sessions per second are reported for each.
+
+Use: ./netconf-client-bench.py --sessions 500 --concurrency 8
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import sys
+import threading
+import time
+from lxml import etree
+import sshutil.conn
+from sshutil.cache import SSHConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+def run_sessions (args, cache, count, errors):
+    for unused in range(count):
+        session = None
+        try:
+            session = client.NetconfSSHSession("localhost",
+                                               port=args.port,
+                                               username=USER,
+                                               password=PASSWORD,
+                                               cache=cache)
+            for unused in range(args.rpcs):
+                session.send_rpc("<get/>")
+        except Exception as error:
+            errors.append(error)
+        finally:
+            if session is not None:
+                session.close()
+
+
+def bench (args, name, cache):
+    errors = []
+    per_thread, extra = divmod(args.sessions, args.concurrency)
+    threads = [ threading.Thread(target=run_sessions,
+                                 args=(args, cache, per_thread + (1 if i < extra else 0), errors))
+                for i in range(args.concurrency) ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    done = args.sessions - len(errors)
+    print("{:10} {:8.1f} sessions/s {}".format(
+        name,
+        done / elapsed,
+        "errors {}: {}".format(len(errors), errors[0]) if errors else ""))
+    sys.stdout.flush()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark NETCONF client sessions")
+    parser.add_argument("--sessions", type=int, default=500, help="Sessions to open")
+    parser.add_argument("--concurrency", type=int, default=8, help="Sessions opened in parallel")
+    parser.add_argument("--rpcs", type=int, default=1, help="RPCs sent on each session")
+    parser.add_argument("--max-channels", type=int, default=8, help="Sessions per pooled connection")
+    parser.add_argument("--port", type=int, default=18310, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key)
+    try:
+        cache = SSHConnectionCache("Bench Cache", max_channels=args.max_channels)
+        bench(args, "unpooled", sshutil.conn.g_no_cache)
+        bench(args, "pooled", cache)
+        print("pool", cache.get_stats())
+        cache.flush()
+    finally:
+        ncserver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark client authentication round trips per connection.
+
+Starts an ssh-agent holding several keys and a paramiko server that only
+authorizes the last of them (and refuses passwords) then makes new
+connections. The authentication requests the server receives per
+connection, agent key fetches and connection rate are reported with the
+remembered authentication method and agent key cache flushed before each
+connection (as before they existed) and kept.
+
+Use: ./netconf-clientauth-bench.py --keys 5 --connections 50
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import paramiko as ssh
+import sshutil.cache
+
+USER = "bench"
+
+
+class CountingController (ssh.ServerInterface):
+    "Authorize only key, counting authentication requests"
+    def __init__ (self, key, counts):
+        self.key = key
+        self.counts = counts
+
+    def get_allowed_auths (self, username):
+        return "publickey,password"
+
+    def check_auth_password (self, username, password):
+        self.counts["password"] += 1
+        return ssh.AUTH_FAILED
+
+    def check_auth_publickey (self, username, key):
+        self.counts["publickey"] += 1
+        if key.asbytes() == self.key.asbytes():
+            return ssh.AUTH_SUCCESSFUL
+        return ssh.AUTH_FAILED
+
+    def check_channel_request (self, kind, chanid):
+        return ssh.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+def run_server (listener, host_key, key, counts):
+    while True:
+        sock, unused = listener.accept()
+        transport = ssh.Transport(sock)
+        transport.add_server_key(host_key)
+        transport.start_server(server=CountingController(key, counts))
+
+
+def start_agent (keydir, nkeys):
+    "Start an ssh-agent holding nkeys new keys, returns its pid and the last key"
+    output = subprocess.check_output(["ssh-agent", "-s", "-a", os.path.join(keydir, "agent")])
+    for line in output.decode('utf-8').split(";"):
+        name, sep, value = line.strip().partition("=")
+        if sep and name in ("SSH_AUTH_SOCK", "SSH_AGENT_PID"):
+            os.environ[name] = value
+    for idx in range(nkeys):
+        path = os.path.join(keydir, "key{}".format(idx))
+        subprocess.check_call(["ssh-keygen", "-q", "-t", "ed25519", "-N", "", "-f", path])
+        subprocess.check_call(["ssh-add", "-q", path], stderr=subprocess.DEVNULL)
+    return int(os.environ["SSH_AGENT_PID"]), ssh.Ed25519Key.from_private_key_file(path)
+
+
+def bench (args, name, port, counts, remember):
+    cache = sshutil.cache.SSHNoConnectionCache()
+    for key in counts:
+        counts[key] = 0
+    fetches = sshutil.cache.agent_keys.fetches
+    start = time.time()
+    for unused in range(args.connections):
+        if not remember:
+            sshutil.cache.auth_memo.flush()
+            sshutil.cache.agent_keys.invalidate()
+        sshsock = cache.get_ssh_socket("127.0.0.1", port, USER, args.password)
+        cache.release_ssh_socket(sshsock)
+    elapsed = time.time() - start
+    print("{:10} {:6.2f} auth requests/connection ({:.2f} password) {:4d} agent fetches "
+          "{:6.1f} connections/s".format(
+              name,
+              (counts["password"] + counts["publickey"]) / args.connections,
+              counts["password"] / args.connections,
+              sshutil.cache.agent_keys.fetches - fetches,
+              args.connections / elapsed))
+    sys.stdout.flush()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark client authentication round trips")
+    parser.add_argument("--keys", type=int, default=5, help="Keys in the agent, the last is authorized")
+    parser.add_argument("--connections", type=int, default=50, help="Connections per case")
+    parser.add_argument("--password", default="wrong", help="Password offered first (refused)")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    keydir = tempfile.mkdtemp()
+    agent_pid = None
+    try:
+        agent_pid, key = start_agent(keydir, args.keys)
+        counts = { "password": 0, "publickey": 0 }
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(16)
+        thread = threading.Thread(target=run_server,
+                                  args=(listener,
+                                        ssh.RSAKey.from_private_key_file(args.host_key),
+                                        key,
+                                        counts))
+        thread.daemon = True
+        thread.start()
+
+        port = listener.getsockname()[1]
+        bench(args, "flushed", port, counts, False)
+        bench(args, "remembered", port, counts, True)
+    finally:
+        if agent_pid is not None:
+            os.kill(agent_pid, 15)
+        shutil.rmtree(keydir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
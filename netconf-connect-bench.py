@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark connection setup when some of a host's addresses are unreachable.
+
+An unreachable address is stood in for by a local listener whose accept
+queue is full, the kernel drops further SYNs so connects to it hang as they
+would to a black-holed address. Connecting to address lists containing it
+is timed trying one address at a time (as open_os_socket used to, given
+--serial-timeout instead of the system's TCP timeout) and racing them with
+sshutil.connect. Address lookups are timed with and without the resolver
+cache.
+
+Use: ./netconf-connect-bench.py --count 20
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import socket
+import sys
+import time
+
+from sshutil import connect
+
+
+def black_hole ():
+    "Return a listener whose accept queue is full and the sockets filling it"
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    fillers = []
+    for unused in range(4):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex(listener.getsockname())
+        fillers.append(sock)
+    time.sleep(.2)
+    return listener, fillers
+
+
+def listener (family, addr):
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.bind((addr, 0))
+    sock.listen(128)
+    return sock
+
+
+def addrinfo (sock):
+    return (sock.family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", sock.getsockname())
+
+
+def serial_connect (addrinfos, timeout):
+    "Connect trying each address in turn, as open_os_socket used to"
+    error = None
+    for af, socktype, proto, unused_name, sa in addrinfos:
+        sock = socket.socket(af, socktype, proto)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(sa)
+            return sock
+        except socket.error as ex:
+            sock.close()
+            error = ex
+    raise error
+
+
+def drain (server):
+    "Accept and close the connections queued on server"
+    server.setblocking(False)
+    try:
+        while True:
+            server.accept()[0].close()
+    except socket.error:
+        pass
+
+
+def time_connect (func, count):
+    "Return the mean seconds per connection, draining the accepted sockets"
+    start = time.time()
+    for unused in range(count):
+        func().close()
+    return (time.time() - start) / count
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark connection setup")
+    parser.add_argument("--count", type=int, default=20, help="Connections per case")
+    parser.add_argument("--serial-timeout", type=float, default=3,
+                        help="Per address timeout when connecting serially")
+    parser.add_argument("--delay", type=float, default=connect.CONNECT_DELAY,
+                        help="Delay between raced connection attempts")
+    args = parser.parse_args(*margs)
+
+    hole, fillers = black_hole()
+    good4 = listener(socket.AF_INET, "127.0.0.1")
+    servers = [ good4 ]
+    cases = [
+        ("reachable", [ addrinfo(good4) ]),
+        ("unreachable first", [ addrinfo(hole), addrinfo(good4) ]),
+    ]
+    try:
+        good6 = listener(socket.AF_INET6, "::1")
+    except socket.error:
+        print("IPv6 not available, skipping mixed family case")
+    else:
+        servers.append(good6)
+        cases.append(("unreachable IPv4 then IPv6", [ addrinfo(hole), addrinfo(good4), addrinfo(good6) ]))
+
+    # Connections are closed unaccepted, drain them after each case.
+    for name, addrinfos in cases:
+        count = args.count if len(addrinfos) == 1 else max(1, args.count // 10)
+        serial = time_connect(lambda: serial_connect(addrinfos, args.serial_timeout), count)
+        raced = time_connect(lambda: connect.connect_addrinfo(addrinfos, delay=args.delay)[0],
+                             args.count)
+        print("{:28} serial {:8.2f} ms  raced {:8.2f} ms".format(name, serial * 1000, raced * 1000))
+        for server in servers:
+            drain(server)
+
+    resolver = connect.Resolver()
+    for name, lookup in (("getaddrinfo", lambda: socket.getaddrinfo("localhost", 830, socket.AF_UNSPEC,
+                                                                     socket.SOCK_STREAM)),
+                         ("cached resolver", lambda: resolver.getaddrinfo("localhost", 830))):
+        start = time.time()
+        for unused in range(args.count * 50):
+            lookup()
+        print("{:28} {:8.1f} us/lookup".format(name, (time.time() - start) * 1e6 / (args.count * 50)))
+
+    for sock in fillers + servers + [ hole ]:
+        sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
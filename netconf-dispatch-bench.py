@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Microbenchmark finding the server method for each RPC.
+
+For RPC tags in the base namespace, in a module namespace with a method
+registered for that namespace and with a local name only, the time per RPC
+to find the method is reported with the per-call string rewriting and
+getattr() the server used to do and with NetconfSSHServer.get_rpc_method().
+The cost of a client cycling through more than MAX_RPC_LOOKUP distinct
+unknown tags, which are not remembered, and the table's size after it are
+also shown.
+
+Use: ./netconf-dispatch-bench.py --count 200000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import sys
+import time
+from lxml import etree
+
+from netconf import qmap
+from netconf import server
+
+NS_A = "urn:example:a"
+NS_B = "urn:example:b"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+    def rpc_get_config (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+    @server.rpc_namespace(NS_A, "reset")
+    def rpc_a_reset (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("ok")
+
+    @server.rpc_namespace(NS_B, "reset")
+    def rpc_b_reset (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("ok")
+
+    def rpc_restart_device (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("ok")
+
+
+def old_dispatch (methods, tag):
+    "The lookup reader_handle_message used to do for each RPC"
+    rpcname = tag.replace(qmap('nc'), "")
+    rpcname = rpcname.rpartition("}")[-1]
+    method_name = "rpc_" + rpcname.replace('-', '_')
+    return getattr(methods, method_name, None)
+
+
+def time_per_call (func, tag, count):
+    start = time.time()
+    for unused in range(count):
+        func(tag)
+    return (time.time() - start) * 1e9 / count
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Microbenchmark per RPC method lookup")
+    parser.add_argument("--count", type=int, default=200000, help="Lookups per case")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    methods = BenchMethods()
+    ncserver = server.NetconfSSHServer(server_methods=methods, port=None, host_key=args.host_key)
+    try:
+        cases = [
+            ("base get", qmap('nc') + "get"),
+            ("base get-config", qmap('nc') + "get-config"),
+            ("module reset (a)", "{" + NS_A + "}reset"),
+            ("local name", "{urn:example:c}restart-device"),
+            ("unknown", "{urn:example:c}unknown"),
+        ]
+        for name, tag in cases:
+            old = time_per_call(lambda tag: old_dispatch(methods, tag), tag, args.count)
+            new = time_per_call(ncserver.get_rpc_method, tag, args.count)
+            print("{:18} per-call getattr {:7.1f} ns dispatch table {:7.1f} ns".format(name, old, new),
+                  file=sys.stderr)
+
+        # Namespaces must not collide (the old lookup found rpc_reset for both, or neither).
+        print("{:18} {} {}".format("reset a / b",
+                                   ncserver.get_rpc_method("{" + NS_A + "}reset").__name__,
+                                   ncserver.get_rpc_method("{" + NS_B + "}reset").__name__),
+              file=sys.stderr)
+
+        tags = [ "{urn:example:c}unknown-%d" % idx for idx in range(2 * server.MAX_RPC_LOOKUP) ]
+        start = time.time()
+        for idx in range(args.count):
+            ncserver.get_rpc_method(tags[idx % len(tags)])
+        print("{:18} {:7.1f} ns per lookup, table size {} (max {})".format(
+            "distinct tags", (time.time() - start) * 1e9 / args.count, len(ncserver.rpc_lookup),
+            server.MAX_RPC_LOOKUP), file=sys.stderr)
+    finally:
+        ncserver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark polling a fleet of devices with the threaded and asyncio clients.
+
+Starts a server in this process standing in for every device and runs a get
+on each of --devices sessions, --concurrency at a time, with a thread per
+session (NetconfSSHSession) and with run_fleet (AsyncNetconfSession). The
+time taken and the most threads alive are reported.
+
+Use: ./netconf-fleet-bench.py --devices 1000 --concurrency 200
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import asyncio
+import concurrent.futures
+import logging
+import sys
+import threading
+import time
+from lxml import etree
+
+from netconf import aioclient
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+class ThreadSampler (object):
+    "Record the most threads alive while running"
+    def __init__ (self):
+        self.peak = threading.active_count()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _sample (self):
+        while self.running:
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(.01)
+
+    def stop (self):
+        self.running = False
+        self.thread.join()
+        return self.peak
+
+
+def poll_threaded (args):
+    def poll (unused):
+        session = client.NetconfSSHSession("localhost", port=args.port, username=USER, password=PASSWORD)
+        try:
+            return session.send_rpc("<get/>")[1]
+        finally:
+            session.close()
+
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as executor:
+        return list(executor.map(poll, range(args.devices)))
+
+
+def poll_async (args):
+    async def poll (session):
+        return (await session.rpc("<get/>"))[1]
+
+    # Every "device" is our server.
+    hosts = [ ("localhost", args.port) ] * args.devices
+    results = asyncio.run(aioclient.run_fleet(hosts,
+                                              poll,
+                                              concurrency=args.concurrency,
+                                              username=USER,
+                                              password=PASSWORD))
+    errors = [ x for x in results if isinstance(x, Exception) ]
+    if errors:
+        print("errors {}: {}".format(len(errors), errors[0]), file=sys.stderr)
+    return results
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark polling a fleet of devices")
+    parser.add_argument("--devices", type=int, default=1000, help="Sessions to poll")
+    parser.add_argument("--concurrency", type=int, default=200, help="Sessions polled in parallel")
+    parser.add_argument("--port", type=int, default=18350, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       reactor=True,
+                                       # Don't shed the burst of new channels.
+                                       handshake_backlog=2 * args.concurrency)
+    try:
+        for name, func in (("threaded", poll_threaded), ("asyncio", poll_async)):
+            sampler = ThreadSampler()
+            start = time.time()
+            results = func(args)
+            elapsed = time.time() - start
+            peak = sampler.stop()
+            print("{:10} {:6d} devices {:6.2f} s {:8.1f} devices/s  peak threads {}".format(
+                name, len(results), elapsed, len(results) / elapsed, peak), file=sys.stderr)
+    finally:
+        ncserver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark SSH server handshakes by host key type and algorithm choice.
+
+For each combination of host key, key exchange, cipher and MAC a server is
+run in a child process and clients connect, authenticate, open a channel and
+disconnect. Connections per second and the server CPU time used per
+handshake are reported.
+
+Use: ./netconf-handshake-bench.py --connections 200
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import paramiko as ssh
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from sshutil import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+def generate_host_keys (keydir):
+    "Write one host key of each type to keydir, returns {name: path}"
+    keys = {
+        "ed25519": ed25519.Ed25519PrivateKey.generate(),
+        "ecdsa": ec.generate_private_key(ec.SECP256R1()),
+        "rsa": rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    }
+    paths = {}
+    for name, key in keys.items():
+        paths[name] = os.path.join(keydir, "host_{}_key".format(name))
+        with open(paths[name], "wb") as keyfile:
+            keyfile.write(key.private_bytes(serialization.Encoding.PEM,
+                                            serialization.PrivateFormat.OpenSSH,
+                                            serialization.NoEncryption()))
+    return paths
+
+
+def run_server (conn, host_key, kex, cipher, mac):
+    """Run a server in this (child) process, reporting its CPU time used
+    between the "start" and "stop" commands received on conn"""
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    sshd = server.SSHServer(server_ctl=ctl,
+                            port=0,
+                            host_key=host_key,
+                            handshake_workers=16,
+                            kex_algorithms=[ kex ] if kex else None,
+                            ciphers=[ cipher ] if cipher else None,
+                            macs=[ mac ] if mac else None,
+                            reap_interval=0)
+    conn.send(sshd.port)
+    while True:
+        cmd = conn.recv()
+        times = os.times()
+        conn.send(times[0] + times[1])
+        if cmd == "stop":
+            break
+    sshd.close()
+
+
+def connect (port, kex, cipher, mac):
+    sock = socket.create_connection(("localhost", port))
+    transport = ssh.Transport(sock)
+    options = transport.get_security_options()
+    if kex:
+        options.kex = [ kex ]
+    if cipher:
+        options.ciphers = [ cipher ]
+    if mac:
+        options.digests = [ mac ]
+    try:
+        transport.start_client()
+        transport.auth_password(USER, PASSWORD)
+        transport.open_session().close()
+    finally:
+        transport.close()
+
+
+def run_clients (port, count, concurrency, kex, cipher, mac):
+    errors = []
+    per_thread, extra = divmod(count, concurrency)
+
+    def client_thread (n):
+        for unused in range(n):
+            try:
+                connect(port, kex, cipher, mac)
+            except Exception as error:
+                errors.append(error)
+
+    threads = [ threading.Thread(target=client_thread, args=(per_thread + (1 if i < extra else 0),))
+                for i in range(concurrency) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def bench (args, key_name, key_path, kex, cipher, mac):
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=run_server, args=(child, key_path, kex, cipher, mac))
+    proc.start()
+    try:
+        port = parent.recv()
+        # Warm up, e.g., the first handshake loads the crypto backends.
+        run_clients(port, args.concurrency, args.concurrency, kex, cipher, mac)
+
+        parent.send("start")
+        cpu_start = parent.recv()
+        start = time.time()
+        errors = run_clients(port, args.connections, args.concurrency, kex, cipher, mac)
+        elapsed = time.time() - start
+        parent.send("stop")
+        cpu = parent.recv() - cpu_start
+    finally:
+        proc.join()
+
+    done = args.connections - len(errors)
+    print("{:8} {:30} {:24} {:30} {:8.1f} conn/s {:7.2f} ms cpu/handshake {}".format(
+        key_name,
+        kex or "default",
+        cipher or "default",
+        mac or "default",
+        done / elapsed,
+        1000 * cpu / done if done else 0,
+        "errors {}: {}".format(len(errors), errors[0]) if errors else ""))
+    sys.stdout.flush()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark SSH server handshakes")
+    parser.add_argument("--connections", type=int, default=200, help="Connections per combination")
+    parser.add_argument("--concurrency", type=int, default=8, help="Connections made in parallel")
+    parser.add_argument("--keys", default="ed25519,ecdsa,rsa", help="Host key types to test")
+    parser.add_argument("--kex", default="curve25519-sha256@libssh.org,ecdh-sha2-nistp256,"
+                        "diffie-hellman-group14-sha256", help="Key exchange algorithms to test")
+    parser.add_argument("--ciphers", default="aes128-ctr,aes128-gcm@openssh.com",
+                        help="Ciphers to test")
+    parser.add_argument("--macs", default="hmac-sha2-256", help="MACs to test")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+    # Clients closing as soon as a channel opens make paramiko log resets.
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    keydir = tempfile.mkdtemp()
+    try:
+        key_paths = generate_host_keys(keydir)
+        for key_name, kex, cipher, mac in itertools.product(args.keys.split(","),
+                                                            args.kex.split(","),
+                                                            args.ciphers.split(","),
+                                                            args.macs.split(",")):
+            bench(args, key_name, key_paths[key_name], kex, cipher, mac)
+    finally:
+        shutil.rmtree(keydir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
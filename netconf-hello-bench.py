@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark hello message handling per session.
+
+The server hello (with --capabilities capabilities added by the server
+methods, as netconf-proxy.py does) is built the way send_hello used to,
+building and serializing the elements for each session, and by splicing
+the session-id into the hello serialized once by the server. The peer's
+hello is parsed for --sessions sessions storing the capabilities in a set
+per session (as before) and interned, and the memory held by the sets is
+reported. Finally a server runs in a child process and the latency of
+opening sessions on a pooled connection is reported.
+
+Use: ./netconf-hello-bench.py --sessions 10000 --capabilities 20
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import gc
+import io
+import logging
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from lxml import etree
+from lxml.builder import E
+from sshutil.cache import SSHConnectionCache
+
+from netconf import NSMAP, base, client, server
+from netconf.util import elm
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def __init__ (self, count):
+        self.count = count
+
+    def nc_append_capabilities (self, capabilities):
+        for idx in range(self.count):
+            elem = etree.Element("capability")
+            elem.text = "urn:example:module-{}?module=module-{}&amp;revision=2016-12-14".format(idx, idx)
+            capabilities.append(elem)
+
+
+def old_hello (methods, session_id):
+    "Build the server hello the way send_hello used to for each session"
+    msg = elm("hello", attrib={'xmlns': NSMAP['nc']})
+    caps = E.capabilities(*[E.capability(x) for x in base.HELLO_CAPABILITIES])
+    methods.nc_append_capabilities(caps)
+    msg.append(caps)
+    msg.append(E("session-id", str(session_id)))
+    return etree.tostring(msg).decode('utf-8')
+
+
+def old_capabilities (reply):
+    "Parse the capabilities into a set per session as _open_session used to"
+    root = etree.parse(io.BytesIO(reply.encode('utf-8'))).getroot()
+    capabilities = set()
+    for cap in root.xpath("/nc:hello/nc:capabilities/nc:capability", namespaces=NSMAP):
+        capabilities.add(cap.text)
+    return capabilities
+
+
+def new_capabilities (reply):
+    return base.parse_hello(reply, False)[0]
+
+
+def time_capabilities (func, hellos):
+    "Return the time per hello and bytes held by the capabilities of all hellos"
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    kept = [ func(hello) for hello in hellos ]
+    elapsed = time.time() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return elapsed * 1e6 / len(hellos), size
+
+
+def run_server (args, ready, stop):
+    logging.basicConfig(level=logging.ERROR)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(args.capabilities),
+                                       port=args.port,
+                                       host_key=args.host_key)
+    ready.set()
+    stop.wait()
+    ncserver.close()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark hello message handling")
+    parser.add_argument("--sessions", type=int, default=10000, help="Hellos to build and parse")
+    parser.add_argument("--capabilities", type=int, default=20, help="Capabilities the server adds")
+    parser.add_argument("--opens", type=int, default=200, help="Sessions to open to the server")
+    parser.add_argument("--port", type=int, default=18540, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    methods = BenchMethods(args.capabilities)
+    start = time.time()
+    for sid in range(args.sessions):
+        old_hello(methods, sid)
+    old = (time.time() - start) * 1e6 / args.sessions
+    template = base.hello_template(base.HELLO_CAPABILITIES, methods)
+    start = time.time()
+    for sid in range(args.sessions):
+        base.hello_message(template, sid)
+    new = (time.time() - start) * 1e6 / args.sessions
+    print("server hello       per session build {:7.2f} us  precomputed {:7.2f} us".format(old, new),
+          file=sys.stderr)
+
+    # Every session from the same kind of server sends the same capabilities.
+    hellos = [ base.hello_message(template, sid + 1) for sid in range(args.sessions) ]
+    old_time, old_size = time_capabilities(old_capabilities, hellos)
+    new_time, new_size = time_capabilities(new_capabilities, hellos)
+    print("peer capabilities  set per session {:7.2f} us {:8.1f} KB  interned {:7.2f} us {:8.1f} KB".format(
+        old_time, old_size / 1024, new_time, new_size / 1024), file=sys.stderr)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    sproc = multiprocessing.Process(target=run_server, args=(args, ready, stop))
+    sproc.start()
+    ready.wait()
+    cache = SSHConnectionCache("Hello Bench", max_channels=4)
+    try:
+        first = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                         password=PASSWORD, cache=cache)
+        latencies = []
+        for unused in range(args.opens):
+            start = time.time()
+            session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                               password=PASSWORD, cache=cache)
+            latencies.append(time.time() - start)
+            session.close()
+        first.close()
+        latencies.sort()
+        print("session open       p50 {:.2f} ms p99 {:.2f} ms".format(
+            latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * .99)] * 1000),
+              file=sys.stderr)
+    finally:
+        cache.close()
+        stop.set()
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark the server with many idle sessions, thread per session vs reactor.
+
+Starts a server in a child process, with a reader thread per session and
+then with reactor=True, and opens idle sessions to it (from asyncio clients
+sharing --channels per SSH connection) up to each of --sessions. At each
+step the server's threads, RSS and CPU use while idle are read from /proc,
+and the round trip time of gets on --samples of the idle sessions is
+measured. Needs Linux.
+
+Each session's channel uses a pipe on each side in reactor mode, so 10k
+sessions need a file descriptor limit above 20k, the soft limit is raised to
+the hard limit.
+
+Use: ./netconf-idle-bench.py --sessions 1000 5000 10000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from lxml import etree
+from sshutil.cache import SSHConnectionCache
+
+from netconf import aioclient
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+def run_server (args, reactor, ready, stop):
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       reactor=reactor,
+                                       handshake_backlog=2 * args.concurrency)
+    ready.set()
+    stop.wait()
+    ncserver.close()
+
+
+def get_process_stats (pid):
+    "Return (threads, RSS in MB, CPU seconds) of process pid"
+    threads = rss = 0
+    with open("/proc/{}/status".format(pid)) as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                threads = int(line.split()[1])
+            elif line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+    with open("/proc/{}/stat".format(pid)) as f:
+        # Skip the command name which may contain spaces.
+        fields = f.read().rpartition(")")[2].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return threads, rss, cpu
+
+
+async def bench_mode (args, name, pid, loop, executor):
+    cache = SSHConnectionCache("Idle Bench", close_timeout=1, max_channels=args.channels)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sessions = []
+
+    async def open_session ():
+        async with semaphore:
+            sessions.append(await aioclient.AsyncNetconfSession.connect("localhost",
+                                                                        port=args.port,
+                                                                        username=USER,
+                                                                        password=PASSWORD,
+                                                                        cache=cache,
+                                                                        loop=loop,
+                                                                        executor=executor))
+
+    try:
+        for count in args.sessions:
+            start = time.time()
+            new = count - len(sessions)
+            await asyncio.gather(*[ open_session() for unused in range(new) ])
+            opened = time.time() - start
+
+            await asyncio.sleep(args.idle)
+            unused, unused, cpu_before = get_process_stats(pid)
+            await asyncio.sleep(args.idle)
+            threads, rss, cpu_after = get_process_stats(pid)
+            idle_cpu = (cpu_after - cpu_before) / args.idle
+
+            rtts = []
+            for session in random.sample(sessions, min(args.samples, len(sessions))):
+                start = time.time()
+                await session.rpc("<get/>")
+                rtts.append(time.time() - start)
+            rtts.sort()
+            print("{:8} {:6d} sessions opened {:6.1f}/s server threads {:6d} rss {:7.1f} MB "
+                  "idle cpu {:5.1f}% get rtt p50 {:6.2f} ms p99 {:6.2f} ms".format(
+                      name, count, new / opened if opened else 0, threads, rss, idle_cpu * 100,
+                      rtts[len(rtts) // 2] * 1000, rtts[int(len(rtts) * .99)] * 1000),
+                  file=sys.stderr)
+    finally:
+        await asyncio.gather(*[ session.close() for session in sessions ], return_exceptions=True)
+        cache.flush()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark many idle server sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[ 1000, 2500, 5000 ],
+                        help="Idle session counts to measure at")
+    parser.add_argument("--channels", type=int, default=64, help="Sessions per client SSH connection")
+    parser.add_argument("--concurrency", type=int, default=50, help="Sessions opened in parallel")
+    parser.add_argument("--samples", type=int, default=200, help="Idle sessions to time a get on")
+    parser.add_argument("--idle", type=float, default=2, help="Seconds to measure idle CPU over")
+    parser.add_argument("--port", type=int, default=18380, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    unused, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    for name, reactor in (("threaded", False), ("reactor", True)):
+        # Fork the server before this process starts any threads.
+        ready = multiprocessing.Event()
+        stop = multiprocessing.Event()
+        sproc = multiprocessing.Process(target=run_server, args=(args, reactor, ready, stop))
+        sproc.start()
+        ready.wait()
+        loop = asyncio.new_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(args.concurrency)
+        try:
+            loop.run_until_complete(bench_mode(args, name, sproc.pid, loop, executor))
+        finally:
+            executor.shutdown()
+            loop.close()
+            stop.set()
+            sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark NETCONF connections made through a jump host.
+
+Starts a NETCONF server and a minimal SSH jump host (which accepts any
+public key and forwards direct-tcpip channels) in this process. New
+connections (not pooled) are opened directly, through a ProxyCommand
+forwarding process (standing in for "ssh -W", without its own handshake) and
+through the jump host with jumphost=. Connections per second and processes
+spawned are reported.
+
+Use: ./netconf-jump-bench.py --sessions 100
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import paramiko as ssh
+import sshutil.cache
+import sshutil.conn
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class JumpHostController (ssh.ServerInterface):
+    def get_allowed_auths (self, username):
+        return "publickey"
+
+    def check_auth_publickey (self, username, key):
+        return ssh.AUTH_SUCCESSFUL
+
+    def check_channel_request (self, kind, chanid):
+        return ssh.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request (self, chanid, origin, destination):
+        return ssh.OPEN_SUCCEEDED
+
+
+def forward (chan, sock):
+    "Copy data between chan and sock until either closes"
+    try:
+        while True:
+            rfds, unused, unused = select.select([chan, sock], [], [])
+            if chan in rfds:
+                data = chan.recv(32768)
+                if not data:
+                    break
+                sock.sendall(data)
+            if sock in rfds:
+                data = sock.recv(32768)
+                if not data:
+                    break
+                chan.sendall(data)
+    except (socket.error, EOFError):
+        pass
+    finally:
+        chan.close()
+        sock.close()
+
+
+def jump_host_connection (client_sock, host_key, target):
+    transport = ssh.Transport(client_sock)
+    transport.add_server_key(host_key)
+    transport.start_server(server=JumpHostController())
+    while transport.is_active():
+        chan = transport.accept(1)
+        if chan is None:
+            continue
+        sock = socket.create_connection(target)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        thread = threading.Thread(target=forward, args=(chan, sock))
+        thread.daemon = True
+        thread.start()
+
+
+def run_jump_host (listener, host_key, target):
+    "Accept jump host connections on listener forwarding channels to target"
+    while True:
+        client_sock, unused = listener.accept()
+        client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        thread = threading.Thread(target=jump_host_connection, args=(client_sock, host_key, target))
+        thread.daemon = True
+        thread.start()
+
+
+def proxy_forward (host, port):
+    "Forward stdin/stdout to host:port, used as the ProxyCommand"
+    sock = socket.create_connection((host, int(port)))
+    stdin, stdout = sys.stdin.fileno(), sys.stdout.fileno()
+    while True:
+        rfds, unused, unused = select.select([stdin, sock], [], [])
+        if stdin in rfds:
+            data = os.read(stdin, 32768)
+            if not data:
+                break
+            sock.sendall(data)
+        if sock in rfds:
+            data = sock.recv(32768)
+            if not data:
+                break
+            os.write(stdout, data)
+    return 0
+
+
+def bench (args, name, count, **kwargs):
+    errors = []
+    start = time.time()
+    for unused in range(count):
+        try:
+            session = client.NetconfSSHSession("localhost",
+                                               port=args.port,
+                                               username=USER,
+                                               password=PASSWORD,
+                                               cache=sshutil.conn.g_no_cache,
+                                               **kwargs)
+            session.close()
+        except Exception as error:
+            errors.append(error)
+    elapsed = time.time() - start
+    done = count - len(errors)
+    print("{:12} {:8.1f} connections/s  processes spawned {:5d} {}".format(
+        name,
+        done / elapsed,
+        count if "proxycmd" in kwargs else 0,
+        "errors {}: {}".format(len(errors), errors[0]) if errors else ""))
+    sys.stdout.flush()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark connections through a jump host")
+    parser.add_argument("--sessions", type=int, default=100, help="Connections per case")
+    parser.add_argument("--port", type=int, default=18320, help="NETCONF server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    parser.add_argument("--forward", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(*margs)
+    if args.forward:
+        return proxy_forward(*args.forward)
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=server.NetconfMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key)
+
+    host_key = ssh.RSAKey.from_private_key_file(args.host_key)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(64)
+    thread = threading.Thread(target=run_jump_host,
+                              args=(listener, host_key, ("127.0.0.1", args.port)))
+    thread.daemon = True
+    thread.start()
+    jumphost = "{}@127.0.0.1:{}".format(USER, listener.getsockname()[1])
+
+    # The jump host accepts any key, give the client one to offer.
+    sshutil.cache.private_key = ssh.Ed25519Key.from_private_key_file(args.client_key) \
+        if getattr(args, "client_key", None) else ssh.RSAKey.generate(2048)
+
+    try:
+        bench(args, "direct", args.sessions)
+        bench(args, "proxycommand", args.sessions,
+              proxycmd="{} {} --forward %h %p".format(sys.executable, os.path.abspath(__file__)))
+        bench(args, "jumphost", args.sessions, jumphost=jumphost)
+        print("jump host cache", sshutil.cache.get_jump_cache().get_stats())
+    finally:
+        ncserver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
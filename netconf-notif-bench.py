@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark consuming a flood of notifications on a client session.
+
+Starts a server in this process, subscribes a client session and sends
+vnf-alarm notifications as fast as the server can. They are consumed with a
+callback, by iterating a queue (with a slow consumer, dropping the oldest)
+and by iterating a queue that blocks the session when full. Notifications
+received per second and dropped are reported, along with the cost of the
+pretty printed serialization the client used to do for each notification.
+
+Use: ./netconf-notif-bench.py --notifications 20000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import sys
+import threading
+import time
+from lxml import etree
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+NOTIF = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">""" \
+        """<eventTime>2016-12-14T00:00:00Z</eventTime>""" \
+        """<vnf-alarm xmlns="urn:samsung:vnf-alarm-interface">""" \
+        """<event-time>2016-12-14T00:00:00Z</event-time><system-dn>NE=1</system-dn>""" \
+        """<alarm-group>1</alarm-group><alarm-type>2</alarm-type><alarm-severity>3</alarm-severity>""" \
+        """<alarm-info>link down</alarm-info></vnf-alarm></notification>"""
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_create_subscription (self, session, unused_rpc, *unused_params):
+        session.subscription_active = True
+        return etree.Element("ok")
+
+
+def flood (ncserver, count):
+    for unused in range(count):
+        ncserver.trigger_notification(NOTIF)
+
+
+def bench (args, ncserver, name, consume, **kwargs):
+    session = client.NetconfSSHSession("localhost", port=args.port, username=USER, password=PASSWORD)
+    received = [ 0 ]
+    done = threading.Event()
+
+    def count (unused_notif):
+        received[0] += 1
+        if received[0] == args.notifications:
+            done.set()
+
+    if consume == "callback":
+        subscription = session.subscribe(events=[ "vnf-alarm" ], callback=count, **kwargs)
+    else:
+        subscription = session.subscribe(events=[ "vnf-alarm" ], **kwargs)
+
+        def reader ():
+            for notif in subscription:
+                count(notif)
+                if args.slow:
+                    time.sleep(args.slow)
+
+        thread = threading.Thread(target=reader)
+        thread.daemon = True
+        thread.start()
+
+    start = time.time()
+    flood(ncserver, args.notifications)
+    sent = time.time() - start
+    # Wait for the consumer to catch up with what it will get.
+    done.wait(2 if kwargs.get("overflow", client.OVERFLOW_DROP_OLDEST) != client.OVERFLOW_BLOCK else None)
+    elapsed = time.time() - start
+    stats = subscription.get_stats()
+    print("{:28} sent {:8.1f}/s consumed {:6d} {:8.1f}/s dropped {:6d}".format(
+        name, args.notifications / sent, received[0], received[0] / elapsed, stats["dropped"]),
+          file=sys.stderr)
+    session.close()
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark consuming a notification flood")
+    parser.add_argument("--notifications", type=int, default=20000, help="Notifications to send")
+    parser.add_argument("--queue-size", type=int, default=1000, help="Subscription queue size")
+    parser.add_argument("--slow", type=float, default=.0005, help="Seconds the slow consumer takes each")
+    parser.add_argument("--port", type=int, default=18360, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key)
+    try:
+        bench(args, ncserver, "callback", "callback")
+        bench(args, ncserver, "queue drop-oldest (slow)", "iterate",
+              queue_size=args.queue_size, overflow=client.OVERFLOW_DROP_OLDEST)
+        slow, args.slow = args.slow, 0
+        bench(args, ncserver, "queue block", "iterate",
+              queue_size=args.queue_size, overflow=client.OVERFLOW_BLOCK)
+        args.slow = slow
+        bench(args, ncserver, "queue block (slow)", "iterate",
+              queue_size=args.queue_size, overflow=client.OVERFLOW_BLOCK)
+    finally:
+        ncserver.close()
+
+    tree = etree.fromstring(NOTIF)
+    start = time.time()
+    for unused in range(args.notifications):
+        etree.tostring(tree, pretty_print=True)
+    print("old pretty print per notification {:.1f} us".format(
+        (time.time() - start) * 1e6 / args.notifications), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark pipelined NETCONF RPCs on one client session.
+
+Starts a server in this process and sends RPCs on a single session waiting
+for each reply in turn, sending all of them before waiting on their futures,
+and sending all of them in one write. RPCs per second are reported.
+
+Use: ./netconf-pipeline-bench.py --rpcs 10000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import sys
+import time
+from concurrent import futures
+from lxml import etree
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+def report (name, count, elapsed, errors=0):
+    print("{:12} {:6d} rpcs {:9.1f} rpcs/s {}".format(
+        name, count, count / elapsed, "errors {}".format(errors) if errors else ""), file=sys.stderr)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark pipelined NETCONF RPCs")
+    parser.add_argument("--rpcs", type=int, default=10000, help="Outstanding RPCs when pipelining")
+    parser.add_argument("--sequential", type=int, default=1000, help="RPCs sent one at a time")
+    parser.add_argument("--timeout", type=float, default=120, help="Reply deadline of each RPC")
+    parser.add_argument("--port", type=int, default=18330, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key)
+    session = client.NetconfSSHSession("localhost", port=args.port, username=USER, password=PASSWORD)
+    try:
+        start = time.time()
+        for unused in range(args.sequential):
+            session.send_rpc("<get/>", timeout=args.timeout)
+        report("sequential", args.sequential, time.time() - start)
+
+        start = time.time()
+        pending = [ session.send_rpc_async("<get/>", timeout=args.timeout) for unused in range(args.rpcs) ]
+        done, unused = futures.wait(pending)
+        report("pipelined", args.rpcs, time.time() - start, sum(1 for f in done if f.exception()))
+
+        start = time.time()
+        pending = session.send_rpcs_async([ "<get/>" ] * args.rpcs, timeout=args.timeout)
+        done, unused = futures.wait(pending)
+        report("batched", args.rpcs, time.time() - start, sum(1 for f in done if f.exception()))
+
+        # Cancelled and timed out requests leave nothing behind.
+        pending = session.send_rpcs_async([ "<get/>" ] * 100, timeout=0)
+        futures.wait(pending)
+        print("timed out {} outstanding {}".format(
+            sum(1 for f in pending if isinstance(f.exception(), client.ReplyTimeoutError)),
+            len(session.rpc_out)), file=sys.stderr)
+    finally:
+        session.close()
+        ncserver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,7 +26,9 @@ import subprocess
 import shlex
 import argparse
 import datetime
+import multiprocessing
 import pickle
+import tempfile
 
 
 # **********************************
@@ -50,6 +52,7 @@ except ImportError:
     from xml.etree import ElementTree as etree
 
 from netconf import server
+from netconf.bus import NotificationBus, NotificationBusSubscriber
 
 # **********************************
 # Global definitions
@@ -57,16 +60,29 @@ from netconf import server
 
 netconf_server = None # pylint: disable=C0103
 
+notification_bus = None # pylint: disable=C0103
+
 logger = logging.getLogger(__name__) # pylint: disable=C0103
 
+# The vnf-alarm of each trap received
 snmp_traps_store = [] # pylint: disable=C0103
 
+STORE_FILE = "store_netconf_proxy.pckl"
+# (inode, size, mtime) of the store when last read
+store_stat = None # pylint: disable=C0103
+
 #Default object id of the VNFI
 objectid = "7401f9d7-2d5e-4cfe-8ae1-d2adebf085fb"
 #Default object name and location of the VNFI
 objectname = "FUPC0"
 
 NC_PORT = 830
+# Seconds without traffic before an SSH keepalive is sent, to find dead peers.
+NC_KEEPALIVE = 60
+# With more than one worker each worker process accepts Netconf sessions on
+# NC_PORT and this process publishes the notifications to them on NC_BUS_PATH.
+NC_WORKERS = 1
+NC_BUS_PATH = "/tmp/netconf-proxy.bus"
 USER = "replace_with_user"
 PASSWORD = "replace_with_password"
 SERVER_DEBUG = False
@@ -110,6 +126,9 @@ def snmp_trap_receiver(transport_dispatcher, transport_domain, transport_address
 
             # TODO: Missing mapping from SNMP to Netconf Values
 
+            # A worker process may have changed these with edit-config.
+            load_stored_values()
+
             d = datetime.datetime.utcnow()
             msec = d.strftime("%f")[0:3]
 
@@ -126,9 +145,7 @@ def snmp_trap_receiver(transport_dispatcher, transport_domain, transport_address
                       "sequencenumber": "0",
                       "notificationtype": "NotifyNewAlarm"}
 
-            notif = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">"""\
-                    """<eventTime>%(time)s</eventTime>""" \
-                    """<vnf-alarm xmlns="urn:samsung:vnf-alarm-interface">""" \
+            alarm = """<vnf-alarm xmlns="urn:samsung:vnf-alarm-interface">""" \
                     """<event-time>%(time)s</event-time>""" \
                     """<system-dn>%(systemdn)s</system-dn>""" \
                     """<alarm-group>%(alarmgroup)s</alarm-group>""" \
@@ -141,12 +158,17 @@ def snmp_trap_receiver(transport_dispatcher, transport_domain, transport_address
                     """<object-type>%(objecttype)s</object-type>""" \
                     """<sequence-number>%(sequencenumber)s</sequence-number>""" \
                     """<notification-type>%(notificationtype)s</notification-type>""" \
-                    """</vnf-alarm>""" \
-                    """</notification>""" % values
+                    """</vnf-alarm>""" % values
 
-            snmp_traps_store.append(values)
+            notif = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">"""\
+                    """<eventTime>%s</eventTime>%s</notification>""" % (values["time"], alarm)
 
-            netconf_server.trigger_notification(notif)
+            snmp_traps_store.append(alarm)
+
+            if notification_bus is not None:
+                notification_bus.publish(notif)
+            else:
+                netconf_server.trigger_notification(notif)
 
     return whole_msg
 
@@ -214,24 +236,9 @@ class NetconfMethods(server.NetconfMethods):
 
         data.append(vnfi)
 
-        for trap in snmp_traps_store:
+        for alarm in snmp_traps_store:
 
-            notif = """<vnf-alarm xmlns="urn:samsung:vnf-alarm-interface">""" \
-                    """<event-time>%(time)s</event-time>""" \
-                    """<system-dn>%(systemdn)s</system-dn>""" \
-                    """<alarm-group>%(alarmgroup)s</alarm-group>""" \
-                    """<alarm-type>%(alarmtype)s</alarm-type>""" \
-                    """<alarm-severity>%(alarmseverity)s</alarm-severity>""" \
-                    """<alarm-info>%(alarminfo)s</alarm-info>""" \
-                    """<alarm-location>%(alarmlocation)s</alarm-location>""" \
-                    """<alarm-code>%(alarmcode)s</alarm-code>""" \
-                    """<object-id>%(objectid)s</object-id>""" \
-                    """<object-type>%(objecttype)s</object-type>""" \
-                    """<sequence-number>%(sequencenumber)s</sequence-number>""" \
-                    """<notification-type>%(notificationtype)s</notification-type>""" \
-                    """</vnf-alarm>""" % trap
-
-            trap = etree.fromstring(notif)
+            trap = etree.fromstring(alarm)
 
             vnfi.append(trap)
 
@@ -268,12 +275,11 @@ class NetconfMethods(server.NetconfMethods):
             logger.debug("edit-config request did not include object-id")
 
         #Store data in case there is a reboot
-        with open("store_netconf_proxy.pckl", "wb") as file:
-            pickle.dump([objectid,objectname],file)
-
+        save_stored_values()
 
         return etree.Element("ok")
 
+    @server.nonreentrant
     def rpc_create_subscription(self, unused_session, rpc, *unused_params):
 
         logger.info("rpc_create-subscription")
@@ -288,11 +294,152 @@ class NetconfMethods(server.NetconfMethods):
 
         return etree.Element("ok")
 
+# **********************************
+# Stored values and worker processes
+# **********************************
+
+
+def save_stored_values():
+
+    """Write objectid and objectname to the store, readers (possibly in other
+    processes) see either the previous or the new values, never a partial write"""
+
+    fd, tmpname = tempfile.mkstemp(prefix=os.path.basename(STORE_FILE) + ".",
+                                   dir=os.path.dirname(os.path.abspath(STORE_FILE)))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump([objectid, objectname], file)
+        os.replace(tmpname, STORE_FILE)
+    except:
+        os.unlink(tmpname)
+        raise
+
+
+def load_stored_values():
+
+    """Read objectid and objectname stored by edit-config if the store has
+    changed since last read, returns False if there is no store. If the store
+    can't be read the last values read are kept"""
+
+    global objectid
+    global objectname
+    global store_stat
+
+    try:
+        st = os.stat(STORE_FILE)
+    except OSError:
+        return False
+    # Each save replaces the file, so a new inode catches writes within the
+    # mtime granularity.
+    stat = (st.st_ino, st.st_size, st.st_mtime)
+    if stat != store_stat:
+        try:
+            with open(STORE_FILE, "rb") as file:
+                values = pickle.load(file)
+            newid, newname = values
+        except Exception as error:
+            logger.warning("Keeping last values, %s could not be read: %s", STORE_FILE, str(error))
+            return True
+        objectid, objectname = newid, newname
+        store_stat = stat
+        logger.debug("Read values from %s: %s, %s", STORE_FILE, objectid, objectname)
+    return True
+
+
+def bus_notification(notif):
+
+    """Called in a worker process with each notification published on the bus"""
+
+    alarm = etree.fromstring(notif).find("{urn:samsung:vnf-alarm-interface}vnf-alarm")
+    if alarm is not None:
+        snmp_traps_store.append(etree.tounicode(alarm))
+    netconf_server.trigger_notification(notif)
+
+
+def run_worker(use_asyncio, debug):
+
+    """Run a Netconf server in a worker process, sharing NC_PORT with the other workers"""
+
+    global SERVER_DEBUG # pylint: disable=C0103
+
+    # The worker is spawned, it has none of the parent's setup.
+    logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
+    SERVER_DEBUG = debug
+    load_stored_values()
+
+    subscriber = NotificationBusSubscriber(NC_BUS_PATH, bus_notification, debug=SERVER_DEBUG)
+    if use_asyncio:
+        import asyncio
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+        setup_netconf(event_loop, reuse_port=True)
+        event_loop.run_forever()
+    else:
+        setup_netconf(reuse_port=True)
+        netconf_server.join()
+    subscriber.close()
+
+
+def start_workers(count, use_asyncio):
+
+    """Start count Netconf worker processes and the bus notifications are published on"""
+
+    global notification_bus # pylint: disable=C0103
+
+    # Spawn rather than fork the workers, a forked child would inherit the
+    # state (e.g., held locks) of whatever threads importing the server
+    # modules started in this process, but not the threads.
+    mpctx = multiprocessing.get_context("spawn")
+    workers = []
+    for idx in range(count):
+        worker = mpctx.Process(target=run_worker,
+                               name="netconf-worker-{}".format(idx),
+                               args=(use_asyncio, SERVER_DEBUG))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+    logger.info("Started %d Netconf worker processes", count)
+
+    notification_bus = NotificationBus(NC_BUS_PATH, debug=SERVER_DEBUG)
+    return workers
+
 # **********************************
 # Setup SNMP
 # **********************************
 
 
+def setup_snmp_asyncio(loop):
+
+    """Configure SNMP server listener on the asyncio event loop"""
+
+    # Only available with python 3
+    from pysnmp.carrier.asyncio.dispatch import AsyncioDispatcher
+    from pysnmp.carrier.asyncio.dgram import udp as aioudp, udp6 as aioudp6
+
+    transport_dispatcher = AsyncioDispatcher(loop=loop)
+
+    transport_dispatcher.registerRecvCbFun(snmp_trap_receiver)
+
+    # UDP/IPv4
+    transport_dispatcher.registerTransport(
+        aioudp.domainName, aioudp.UdpAsyncioTransport(loop=loop).openServerMode(('0.0.0.0', 162))
+    )
+
+    # UDP/IPv6
+    transport_dispatcher.registerTransport(
+        aioudp6.domainName, aioudp6.Udp6AsyncioTransport(loop=loop).openServerMode(('::1', 162))
+    )
+
+    transport_dispatcher.jobStarted(1)
+
+    try:
+        # SNMP, the Netconf sessions and notifications all run on this loop.
+        loop.run_forever()
+    except:
+        transport_dispatcher.closeDispatcher()
+        raise
+
+
 def setup_snmp():
 
     """Configure SNMP server listener"""
@@ -325,9 +472,10 @@ def setup_snmp():
 # Setup Netconf
 # **********************************
 
-def setup_netconf():
+def setup_netconf(loop=None, reuse_port=False):
 
-    "Configure Netconf server listener"
+    """Configure Netconf server listener, if loop is given it is driven by that asyncio loop.
+    If reuse_port is True other processes may listen on the same port"""
 
     global netconf_server # pylint: disable=C0103
 
@@ -336,11 +484,24 @@ def setup_netconf():
     else:
         server_ctl = server.SSHUserPassController(username=USER,
                                                   password=PASSWORD)
-        netconf_server = server.NetconfSSHServer(server_ctl=server_ctl,
-                                                 server_methods=NetconfMethods(),
-                                                 port=NC_PORT,
-                                                 host_key="keys/host_key",
-                                                 debug=SERVER_DEBUG)
+        if loop is not None:
+            from netconf.aioserver import AsyncNetconfSSHServer
+            netconf_server = AsyncNetconfSSHServer(server_ctl=server_ctl,
+                                                   server_methods=NetconfMethods(),
+                                                   port=NC_PORT,
+                                                   host_key="keys/host_key",
+                                                   debug=SERVER_DEBUG,
+                                                   keepalive=NC_KEEPALIVE,
+                                                   reuse_port=reuse_port,
+                                                   loop=loop)
+        else:
+            netconf_server = server.NetconfSSHServer(server_ctl=server_ctl,
+                                                     server_methods=NetconfMethods(),
+                                                     port=NC_PORT,
+                                                     host_key="keys/host_key",
+                                                     debug=SERVER_DEBUG,
+                                                     keepalive=NC_KEEPALIVE,
+                                                     reuse_port=reuse_port)
 
 # **********************************
 # Set ip from /meta.js file
@@ -400,6 +561,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Netconf Server with SNMP trap listening capabilities")
     parser.add_argument("-s","--skip_ip_set", action="store_true", help="Do not set ip from /meta.js")
     parser.add_argument("-d","--debug", action="store_true", help="Activate debug logs")
+    parser.add_argument("-a","--asyncio", action="store_true",
+                        help="Run SNMP and Netconf on one asyncio event loop (python 3)")
+    parser.add_argument("-w","--workers", type=int, default=NC_WORKERS,
+                        help="Number of Netconf worker processes sharing the Netconf port")
     args =  parser.parse_args()
 
     if args.debug:
@@ -418,16 +583,36 @@ if __name__ == "__main__":
 
     # Recover data in case there was a reboot
     try:
-        with open("store_netconf_proxy.pckl", "rb") as file:
-            objectid, objectname = pickle.load(file)
-        logger.debug("Read previous values from store_netconf_proxy.pckl: "+str(objectid)+", "+str(objectname))
+        if not load_stored_values():
+            logger.warning(STORE_FILE + " file does not exist. This could be first time execution")
     except:
-        logger.warning("store_netconf_proxy.pckl file does not exist. This could be first time execution")
+        logger.warning(STORE_FILE + " file could not be read.")
+
+    if args.workers > 1:
+        start_workers(args.workers, args.asyncio)
 
-    setup_netconf()
+        if args.asyncio:
+            import asyncio
+            logger.info("Listening Snmp (asyncio), Netconf in %d workers", args.workers)
+            event_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(event_loop)
+            setup_snmp_asyncio(event_loop)
+        else:
+            logger.info("Listening Snmp, Netconf in %d workers", args.workers)
+            setup_snmp()
+    elif args.asyncio:
+        import asyncio
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+        setup_netconf(event_loop)
+
+        logger.info("Listening Netconf - Snmp (asyncio)")
+        setup_snmp_asyncio(event_loop)
+    else:
+        setup_netconf()
 
-    # Start the loop for SNMP / Netconf
-    logger.info("Listening Netconf - Snmp")
-    setup_snmp()
+        # Start the loop for SNMP / Netconf
+        logger.info("Listening Netconf - Snmp")
+        setup_snmp()
 
 
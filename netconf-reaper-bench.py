@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark the server's idle session reaper.
+
+Starts a server in this process with --idle-timeout and --reap-interval.
+Three client processes each open --sessions sessions: one keeps sending
+gets (live), one is stopped with SIGSTOP (a frozen peer, its sessions go
+idle and are reaped) and one is killed with SIGKILL (its connections drop,
+the sessions should be removed as they close, those the reaper finds
+closed are counted as leaked). Every second the server's live, reaped and
+leaked session counts, its connections and threads are reported until only
+the live sessions remain.
+
+Use: ./netconf-reaper-bench.py --sessions 100 --idle-timeout 5
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from lxml import etree
+from sshutil.cache import SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+def run_client (args, active, ready):
+    logging.basicConfig(level=logging.CRITICAL)
+    cache = SSHNoConnectionCache()
+    sessions = [ client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                          password=PASSWORD, cache=cache)
+                 for unused in range(args.sessions) ]
+    ready.set()
+    while True:
+        if active:
+            for session in sessions:
+                session.send_rpc("<get/>")
+        time.sleep(args.idle_timeout / 4)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark the idle session reaper")
+    parser.add_argument("--sessions", type=int, default=100, help="Sessions opened by each client")
+    parser.add_argument("--idle-timeout", type=float, default=5, help="Server idle session timeout")
+    parser.add_argument("--reap-interval", type=float, default=1, help="Server reap interval")
+    parser.add_argument("--keepalive", type=int, default=0, help="Server SSH keepalive interval")
+    parser.add_argument("--port", type=int, default=18500, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       keepalive=args.keepalive,
+                                       idle_timeout=args.idle_timeout,
+                                       reap_interval=args.reap_interval)
+    # Spawn the clients, this process already runs the server threads.
+    mpctx = multiprocessing.get_context("spawn")
+    clients = {}
+    try:
+        for name, active in (("live", True), ("frozen", False), ("killed", False)):
+            ready = mpctx.Event()
+            clients[name] = mpctx.Process(target=run_client, args=(args, active, ready))
+            clients[name].start()
+            ready.wait()
+        os.kill(clients["frozen"].pid, signal.SIGSTOP)
+        os.kill(clients["killed"].pid, signal.SIGKILL)
+
+        start = time.time()
+        while True:
+            stats = ncserver.get_session_stats()
+            print("{:6.1f}s live {:5d} reaped {:5d} leaked {:5d} connections {:5d} threads {:5d}".format(
+                time.time() - start, stats["live"], stats["reaped"], stats["leaked"],
+                stats["connections"], threading.active_count()), file=sys.stderr)
+            if stats["connections"] <= args.sessions or time.time() - start > 3 * args.idle_timeout + 10:
+                break
+            time.sleep(1)
+    finally:
+        for proc in clients.values():
+            if proc.is_alive():
+                os.kill(proc.pid, signal.SIGKILL)
+            proc.join()
+        ncserver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Soak test the NETCONF server session lifecycle.
+
+Starts a server in this process, opens and closes many client sessions
+(each on its own SSH connection) against it and checks the open
+connections, sessions, threads and file descriptors return to where they
+started.
+
+Use: ./netconf-soak.py --sessions 100000 --concurrency 16
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import sys
+import threading
+import time
+from lxml import etree
+from sshutil.cache import SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+
+logger = logging.getLogger(__name__) # pylint: disable=C0103
+
+USER = "soak"
+PASSWORD = "soak"
+
+
+class SoakMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, unused_rpc, *unused_params):
+        return etree.Element("data")
+
+
+def soak_sessions (args, count, errors):
+    for unused in range(count):
+        session = None
+        try:
+            session = client.NetconfSSHSession("localhost",
+                                               port=args.port,
+                                               username=USER,
+                                               password=PASSWORD,
+                                               cache=args.cache)
+            if args.rpc:
+                session.send_rpc("<get/>")
+        except Exception as error:
+            logger.error("Session failed: %s", str(error))
+            errors.append(error)
+        finally:
+            if session is not None:
+                session.close()
+
+
+def wait_baseline (ncserver, baseline, timeout):
+    "Wait for the registry counts to return to baseline, returns the last stats"
+    deadline = time.time() + timeout
+    while True:
+        stats = ncserver.registry.get_stats()
+        if all(stats[k] is None or stats[k] <= baseline[k] for k in baseline):
+            return stats
+        if time.time() > deadline:
+            return stats
+        time.sleep(.1)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Soak test NETCONF session open and close")
+    parser.add_argument("--sessions", type=int, default=100000, help="Sessions to open and close")
+    parser.add_argument("--concurrency", type=int, default=16, help="Sessions opened in parallel")
+    parser.add_argument("--port", type=int, default=18300, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    parser.add_argument("--reactor", action="store_true", help="Read sessions with a reactor")
+    parser.add_argument("--rpc", action="store_true", help="Send a get on each session")
+    parser.add_argument("--report", type=int, default=1000, help="Sessions between reports")
+    parser.add_argument("--settle", type=float, default=30, help="Seconds to wait for baseline")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=SoakMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       debug=args.debug,
+                                       reactor=args.reactor)
+    # Each session has its own connection so connections churn too.
+    args.cache = SSHNoConnectionCache()
+    keys = ("connections", "sessions", "threads", "fds")
+    stats = ncserver.registry.get_stats()
+    baseline = { k: stats[k] for k in keys }
+    print("baseline", baseline)
+
+    errors = []
+    done = 0
+    start = time.time()
+    while done < args.sessions:
+        batch = min(args.report, args.sessions - done)
+        per_thread, extra = divmod(batch, args.concurrency)
+        threads = [ threading.Thread(target=soak_sessions,
+                                     args=(args, per_thread + (1 if i < extra else 0), errors))
+                    for i in range(args.concurrency) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done += batch
+        stats = ncserver.registry.get_stats()
+        print("{:8d} sessions {:6.1f}/s errors {} open: {}".format(
+            done,
+            done / (time.time() - start),
+            len(errors),
+            " ".join("{}={}".format(k, stats[k]) for k in keys)))
+
+    stats = wait_baseline(ncserver, baseline, args.settle)
+    print("final", stats)
+    ncserver.close()
+
+    leaked = [ k for k in keys if stats[k] is not None and stats[k] > baseline[k] ]
+    if leaked:
+        print("LEAKED:", ", ".join("{} {} -> {}".format(k, baseline[k], stats[k]) for k in leaked))
+        return 1
+    print("OK: counts returned to baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark new connections while other clients stall their handshakes.
+
+Starts a server in a child process with --workers handshake workers. New
+NETCONF connections are timed alone and then while --stallers clients
+connect and stall: half send nothing after connecting (stalling the SSH
+handshake) and half authenticate and start the netconf subsystem but never
+send a hello. Stalled clients are replaced as the server drops them after
+--handshake-timeout and --hello-timeout. The connection latency seen by
+the other clients is reported, with the server's handshake rate, handshake
+and session open latency histograms and handshake counters. Each stalled
+client holds a handshake worker, with as many stallers as workers other
+clients wait for the timeouts to free one.
+
+Use: ./netconf-stall-bench.py --connections 100 --stallers 4
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+import paramiko as ssh
+from sshutil.cache import SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+
+
+def run_server (args, ready, stop, conn):
+    logging.basicConfig(level=logging.CRITICAL)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       handshake_workers=args.workers,
+                                       handshake_timeout=args.handshake_timeout,
+                                       hello_timeout=args.hello_timeout)
+    ready.set()
+    while not stop.wait(.1):
+        if conn.poll():
+            conn.recv()
+            conn.send(ncserver.get_stats())
+    ncserver.close()
+
+
+def stall_tcp (args, running):
+    "Connect and send nothing until the server drops us"
+    while running.is_set():
+        sock = socket.create_connection(("localhost", args.port))
+        try:
+            sock.settimeout(args.handshake_timeout + 5)
+            sock.recv(4096)
+            while running.is_set() and sock.recv(4096):
+                pass
+        except socket.error:
+            pass
+        finally:
+            sock.close()
+
+
+def stall_hello (args, running):
+    "Authenticate and start the netconf subsystem but never send a hello"
+    while running.is_set():
+        transport = None
+        try:
+            transport = ssh.Transport(socket.create_connection(("localhost", args.port)))
+            transport.connect(username=USER, password=PASSWORD)
+            chan = transport.open_session()
+            chan.invoke_subsystem("netconf")
+            chan.settimeout(args.hello_timeout + 5)
+            while running.is_set() and chan.recv(4096):
+                pass
+        except (socket.error, ssh.SSHException, EOFError):
+            pass
+        finally:
+            if transport is not None:
+                transport.close()
+
+
+def time_connections (args):
+    cache = SSHNoConnectionCache()
+    latencies = []
+    start = time.time()
+    for unused in range(args.connections):
+        cstart = time.time()
+        session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                           password=PASSWORD, cache=cache)
+        latencies.append(time.time() - cstart)
+        session.close()
+    elapsed = time.time() - start
+    latencies.sort()
+    return (args.connections / elapsed,
+            latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * .99)])
+
+
+def report (name, result, stats):
+    rate, p50, p99 = result
+    print("{:10} {:6.1f} conn/s latency p50 {:7.2f} ms p99 {:7.2f} ms".format(
+        name, rate, p50 * 1000, p99 * 1000), file=sys.stderr)
+
+    def hist (hstats):
+        return "p50 {} p90 {} p99 {} max {:.3f}s".format(
+            *([ "{:.3f}s".format(hstats[p]) if hstats[p] is not None else "-" for p in ("p50", "p90", "p99") ] +
+              [ hstats["max"] ]))
+
+    print("           server handshakes {:.1f}/s latency {}".format(
+        stats["handshake_meter"]["per_second"], hist(stats["handshake_latency"])), file=sys.stderr)
+    print("           server session open latency {}".format(hist(stats["session_open_latency"])),
+          file=sys.stderr)
+    print("           server handshake counters {} pending {}".format(
+        stats["handshakes"], stats["handshake_pending"]), file=sys.stderr)
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark connections while other clients stall")
+    parser.add_argument("--connections", type=int, default=100, help="Connections to time")
+    parser.add_argument("--stallers", type=int, default=4, help="Stalling clients")
+    parser.add_argument("--workers", type=int, default=8, help="Server handshake workers")
+    parser.add_argument("--handshake-timeout", type=float, default=5, help="Server SSH handshake timeout")
+    parser.add_argument("--hello-timeout", type=float, default=5, help="Server hello timeout")
+    parser.add_argument("--port", type=int, default=18560, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    pconn, cconn = multiprocessing.Pipe()
+    sproc = multiprocessing.Process(target=run_server, args=(args, ready, stop, cconn))
+    sproc.start()
+    ready.wait()
+
+    def get_stats ():
+        pconn.send(None)
+        return pconn.recv()
+
+    running = threading.Event()
+    running.set()
+    try:
+        report("alone", time_connections(args), get_stats())
+
+        stallers = [ threading.Thread(target=stall_tcp if idx % 2 else stall_hello, args=(args, running))
+                     for idx in range(args.stallers) ]
+        for thread in stallers:
+            thread.daemon = True
+            thread.start()
+        # Let the stallers occupy the server first.
+        time.sleep(1)
+        report("stalled", time_connections(args), get_stats())
+    finally:
+        running.clear()
+        stop.set()
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
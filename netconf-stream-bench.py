@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark client memory use receiving large rpc-replies.
+
+Starts a server in a child process whose get returns the given numbers of
+vnf-alarm elements. Each reply is received by a new client process with
+send_rpc (the whole reply) and with send_rpc_stream (each vnf-alarm passed
+to a callback), and the client's peak RSS growth over the call is reported.
+Needs Linux (the peak RSS is read from and reset with /proc/self).
+
+Use: ./netconf-stream-bench.py --alarms 10000 50000 200000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+from lxml import etree
+
+from netconf import client
+from netconf import server
+
+USER = "bench"
+PASSWORD = "bench"
+ALARM_NS = "urn:samsung:vnf-alarm-interface"
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_get (self, unused_session, rpc, *unused_params):
+        count = int(rpc.find("{*}get").get("alarms", 0))
+        data = etree.Element("data")
+        alarms = etree.SubElement(data, "alarms", nsmap={ None: ALARM_NS })
+        for idx in range(count):
+            alarm = etree.SubElement(alarms, "{%s}vnf-alarm" % ALARM_NS)
+            etree.SubElement(alarm, "{%s}event-time" % ALARM_NS).text = "2016-12-14T00:00:00Z"
+            etree.SubElement(alarm, "{%s}system-dn" % ALARM_NS).text = "NE={}".format(idx)
+            etree.SubElement(alarm, "{%s}alarm-severity" % ALARM_NS).text = "3"
+            etree.SubElement(alarm, "{%s}alarm-info" % ALARM_NS).text = "link down"
+        return data
+
+
+def run_server (args, ready, stop):
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key)
+    ready.set()
+    stop.wait()
+    ncserver.close()
+
+
+def get_status_kb (field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_client (args, alarms, mode, conn):
+    session = client.NetconfSSHSession("localhost", port=args.port, username=USER, password=PASSWORD)
+    rpc = '<get alarms="{}"/>'.format(alarms)
+    severities = [ 0 ]
+
+    def callback (alarm):
+        severities[0] += int(alarm.findtext("{*}alarm-severity"))
+
+    # Reset the peak RSS to the current RSS.
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = get_status_kb("VmRSS")
+    start = time.time()
+    if mode == "stream":
+        count = session.send_rpc_stream(rpc, "vnf-alarm", callback)
+        size = None
+    else:
+        unused_tree, reply, msg = session.send_rpc(rpc)
+        count = len(reply.find("{*}data/{%s}alarms" % ALARM_NS))
+        size = len(msg)
+    elapsed = time.time() - start
+    peak = get_status_kb("VmHWM") - before
+    session.close()
+    conn.send((count, size, elapsed, peak))
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark client memory use receiving large replies")
+    parser.add_argument("--alarms", type=int, nargs="+", default=[ 10000, 50000, 200000 ],
+                        help="Number of vnf-alarm elements in each reply")
+    parser.add_argument("--port", type=int, default=18370, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    sproc = multiprocessing.Process(target=run_server, args=(args, ready, stop))
+    sproc.start()
+    ready.wait()
+    try:
+        for alarms in args.alarms:
+            size = None
+            for mode in ("full", "stream"):
+                pconn, cconn = multiprocessing.Pipe()
+                cproc = multiprocessing.Process(target=run_client, args=(args, alarms, mode, cconn))
+                cproc.start()
+                count, msize, elapsed, peak = pconn.recv()
+                cproc.join()
+                size = msize if msize is not None else size
+                print("{:8d} alarms {:8.1f} MB reply {:6} peak RSS +{:8.1f} MB {:6.2f}s {:9.0f} alarms/s".format(
+                    count, size / 1e6, mode, peak / 1024, elapsed, count / elapsed), file=sys.stderr)
+    finally:
+        stop.set()
+        sproc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmark handshake rate and notification throughput with worker processes.
+
+Runs the netconf-proxy.py multi-process mode without SNMP: --workers
+processes each accept sessions on the same port (SO_REUSEPORT) and fan
+out the notifications this process publishes once on a NotificationBus.
+For each worker count, --clients processes open --sessions new SSH
+connections each (SSH connect and hello per session) and the sessions per
+second are reported. Then --subscribers sessions subscribe, --notifications
+are published and the notifications delivered per second (to all
+subscribers) are reported. Workers and clients are spawned, not forked.
+
+The gain is bounded by the CPUs available, which are reported.
+
+Use: ./netconf-workers-bench.py --workers 1 2 4 --clients 4
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from lxml import etree
+from sshutil.cache import SSHNoConnectionCache
+
+from netconf import client
+from netconf import server
+from netconf.bus import NotificationBus, NotificationBusSubscriber
+
+USER = "bench"
+PASSWORD = "bench"
+
+NOTIF = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">""" \
+        """<eventTime>2016-12-14T00:00:00Z</eventTime>""" \
+        """<vnf-alarm xmlns="urn:samsung:vnf-alarm-interface">""" \
+        """<event-time>2016-12-14T00:00:00Z</event-time><system-dn>NE=1</system-dn>""" \
+        """<alarm-group>1</alarm-group><alarm-type>2</alarm-type><alarm-severity>3</alarm-severity>""" \
+        """<alarm-info>link down</alarm-info></vnf-alarm></notification>"""
+
+
+class BenchMethods (server.NetconfMethods):
+    def rpc_create_subscription (self, session, unused_rpc, *unused_params):
+        session.subscription_active = True
+        return etree.Element("ok")
+
+
+def run_worker (args, stop):
+    logging.basicConfig(level=logging.ERROR)
+    ctl = server.SSHUserPassController(username=USER, password=PASSWORD)
+    ncserver = server.NetconfSSHServer(server_ctl=ctl,
+                                       server_methods=BenchMethods(),
+                                       port=args.port,
+                                       host_key=args.host_key,
+                                       reuse_port=True)
+    subscriber = NotificationBusSubscriber(args.bus_path, ncserver.trigger_notification)
+    stop.wait()
+    subscriber.close()
+    ncserver.close()
+
+
+def run_client (args, start, conn):
+    logging.basicConfig(level=logging.ERROR)
+    cache = SSHNoConnectionCache()
+    start.wait()
+    for unused in range(args.sessions):
+        session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                           password=PASSWORD, cache=cache)
+        session.close()
+    conn.send(time.time())
+
+
+def bench_handshakes (args, mpctx):
+    start = mpctx.Event()
+    pipes = []
+    procs = []
+    for unused in range(args.clients):
+        pconn, cconn = mpctx.Pipe()
+        proc = mpctx.Process(target=run_client, args=(args, start, cconn))
+        proc.start()
+        pipes.append(pconn)
+        procs.append(proc)
+    # Let the clients finish importing before timing.
+    time.sleep(2)
+    begin = time.time()
+    start.set()
+    end = max(pconn.recv() for pconn in pipes)
+    for proc in procs:
+        proc.join()
+    return args.clients * args.sessions / (end - begin)
+
+
+def bench_notifications (args, bus):
+    received = [ 0 ]
+    lock = threading.Lock()
+    done = threading.Event()
+    total = args.subscribers * args.notifications
+
+    def count (unused_notif):
+        with lock:
+            received[0] += 1
+            if received[0] == total:
+                done.set()
+
+    sessions = []
+    for unused in range(args.subscribers):
+        session = client.NetconfSSHSession("localhost", port=args.port, username=USER,
+                                           password=PASSWORD, cache=SSHNoConnectionCache())
+        session.subscribe(callback=count)
+        sessions.append(session)
+
+    begin = time.time()
+    for unused in range(args.notifications):
+        bus.publish(NOTIF)
+    done.wait(args.notifications / 100 + 30)
+    elapsed = time.time() - begin
+    for session in sessions:
+        session.close()
+    return received[0], total, received[0] / elapsed
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Benchmark Netconf worker processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[ 1, 2, 4 ],
+                        help="Worker process counts to measure")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes opening sessions")
+    parser.add_argument("--sessions", type=int, default=50, help="Sessions each client opens")
+    parser.add_argument("--subscribers", type=int, default=8, help="Subscribed sessions")
+    parser.add_argument("--notifications", type=int, default=2000, help="Notifications to publish")
+    parser.add_argument("--port", type=int, default=18480, help="Server port")
+    parser.add_argument("--host-key", default="keys/host_key", help="Server host key")
+    parser.add_argument("--bus-path", default="/tmp/netconf-workers-bench.bus", help="Notification bus path")
+    args = parser.parse_args(*margs)
+
+    logging.basicConfig(level=logging.ERROR)
+    mpctx = multiprocessing.get_context("spawn")
+    print("{} CPUs".format(len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()),
+          file=sys.stderr)
+
+    for count in args.workers:
+        bus = NotificationBus(args.bus_path)
+        stop = mpctx.Event()
+        workers = [ mpctx.Process(target=run_worker, args=(args, stop)) for unused in range(count) ]
+        for worker in workers:
+            worker.start()
+        try:
+            while bus.get_stats()["subscribers"] < count:
+                time.sleep(.1)
+            rate = bench_handshakes(args, mpctx)
+            received, total, notif_rate = bench_notifications(args, bus)
+            print("{:3d} workers handshakes {:8.1f}/s notifications delivered {:7d}/{:7d} {:9.1f}/s".format(
+                count, rate, received, total, notif_rate), file=sys.stderr)
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+            bus.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
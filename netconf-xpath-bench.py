@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Microbenchmark the XPath lookups done for each message.
+
+For the expressions the client and server evaluate on every hello, rpc,
+rpc-reply, notification and rpc-error, the time per evaluation is reported
+with the expression compiled each time (tree.xpath(), as the call sites
+used to) and with the evaluator from get_xpath(). The cost of a registry
+miss is shown by cycling through more distinct filter expressions than
+XPATH_REGISTRY_SIZE, the registry stays at that size.
+
+Use: ./netconf-xpath-bench.py --count 20000
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import argparse
+import sys
+import time
+from lxml import etree
+
+import netconf
+from netconf import NSMAP, get_xpath
+
+HELLO = """<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>""" + \
+        "".join("<capability>urn:example:capability:{}</capability>".format(idx) for idx in range(20)) + \
+        """</capabilities><session-id>4</session-id></hello>"""
+RPC = """<rpc message-id="1" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><get/></rpc>"""
+REPLY = """<rpc-reply message-id="1" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><data/></rpc-reply>"""
+NOTIF = """<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">""" \
+        """<eventTime>2016-12-14T00:00:00Z</eventTime></notification>"""
+ERROR = """<rpc-reply message-id="1" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><rpc-error>""" \
+        """<error-type>rpc</error-type><error-tag>operation-failed</error-tag>""" \
+        """<error-severity>error</error-severity></rpc-error></rpc-reply>"""
+
+CASES = [
+    ("hello capabilities", HELLO, "/nc:hello/nc:capabilities/nc:capability"),
+    ("hello session-id", HELLO, "/nc:hello/nc:session-id"),
+    ("server rpc", RPC, "/nc:rpc"),
+    ("client rpc-reply", REPLY, "/nc:rpc-reply"),
+    ("client notification", NOTIF, "/*[name()='notification']"),
+    ("rpc-error", ERROR, "/nc:rpc-reply/nc:rpc-error"),
+]
+
+
+def time_per_call (func, count):
+    start = time.time()
+    for unused in range(count):
+        func()
+    return (time.time() - start) * 1e6 / count
+
+
+def main (*margs):
+    parser = argparse.ArgumentParser("Microbenchmark per message XPath lookups")
+    parser.add_argument("--count", type=int, default=20000, help="Evaluations per case")
+    args = parser.parse_args(*margs)
+
+    total_string = total_registry = 0
+    for name, xml, expr in CASES:
+        tree = etree.fromstring(xml)
+        string = time_per_call(lambda: tree.xpath(expr, namespaces=NSMAP), args.count)
+        registry = time_per_call(lambda: get_xpath(expr)(tree), args.count)
+        total_string += string
+        total_registry += registry
+        print("{:22} string {:6.2f} us registry {:6.2f} us saving {:5.1f}%".format(
+            name, string, registry, 100 * (string - registry) / string), file=sys.stderr)
+    print("{:22} string {:6.2f} us registry {:6.2f} us".format("all", total_string, total_registry),
+          file=sys.stderr)
+
+    # Distinct caller supplied filter expressions, more than the registry keeps.
+    tree = etree.fromstring(REPLY)
+    exprs = [ "nc:data/interface[name='eth{}']".format(idx) for idx in range(2 * netconf.XPATH_REGISTRY_SIZE) ]
+    count = max(len(exprs), args.count // 10)
+    start = time.time()
+    for idx in range(count):
+        get_xpath(exprs[idx % len(exprs)])(tree)
+    miss = (time.time() - start) * 1e6 / count
+    print("{:22} {:6.2f} us per lookup, registry size {} (max {})".format(
+        "filter misses", miss, len(netconf.XPATH_REGISTRY), netconf.XPATH_REGISTRY_SIZE), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
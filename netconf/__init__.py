@@ -17,16 +17,34 @@
 # limitations under the License.
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
-from lxml.etree import register_namespace
+import collections
+import threading
+from lxml.etree import register_namespace, XPath
 
 MAXSSHBUF = 16 * 1024
 NSMAP = { }
 
+# Compiled XPath evaluators keyed by expression, built against NSMAP. Filter
+# expressions come from callers so only the most recently used
+# XPATH_REGISTRY_SIZE are kept.
+XPATH_REGISTRY = collections.OrderedDict()
+XPATH_REGISTRY_SIZE = 1024
+
+# "{namespace}" tag prefixes keyed by prefix, built from NSMAP. Only prefixes
+# in NSMAP are added so it is no larger than NSMAP.
+QMAP_REGISTRY = { }
+
+# Protects XPATH_REGISTRY and QMAP_REGISTRY.
+_registry_lock = threading.Lock()
+
 
 def nsmap_add (prefix, namespace):
     "Add a prefix namespace mapping to the modules mapping dictionary"
     NSMAP[prefix] = namespace
     register_namespace(prefix, namespace)
+    with _registry_lock:
+        XPATH_REGISTRY.clear()
+        QMAP_REGISTRY.clear()
 
 
 def nsmap_update (nsdict):
@@ -34,10 +52,37 @@ def nsmap_update (nsdict):
     NSMAP.update(nsdict)
     for key, val in nsdict.items():
         register_namespace(key, val)
+    with _registry_lock:
+        XPATH_REGISTRY.clear()
+        QMAP_REGISTRY.clear()
+
+
+def get_xpath (expr):
+    """Return a compiled XPath evaluator for expr using the modules namespace mapping.
+
+    Evaluators are compiled once and shared process wide, the registry is
+    cleared whenever the namespace mapping changes and holds at most
+    XPATH_REGISTRY_SIZE evaluators, the least recently used are dropped.
+    """
+    with _registry_lock:
+        evaluator = XPATH_REGISTRY.pop(expr, None)
+        if evaluator is None:
+            evaluator = XPath(expr, namespaces=NSMAP)
+            while len(XPATH_REGISTRY) >= XPATH_REGISTRY_SIZE:
+                XPATH_REGISTRY.popitem(last=False)
+        XPATH_REGISTRY[expr] = evaluator
+        return evaluator
 
 
 def qmap (key):
-    return "{" + NSMAP[key] + "}"
+    "Return the {namespace} tag prefix for the namespace prefix key"
+    try:
+        return QMAP_REGISTRY[key]
+    except KeyError:
+        value = "{" + NSMAP[key] + "}"
+        with _registry_lock:
+            QMAP_REGISTRY[key] = value
+        return value
 
 
 # Add base spec namespace
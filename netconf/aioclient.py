@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A NETCONF client driven by an asyncio event loop (python 3 only).
+
+Session channels are read by callbacks on the loop and decoded with the same
+NetconfFramingDecoder as the threaded client, so no thread is used per
+session. Connecting (the SSH handshake and authentication) and sends that
+would block on a full SSH window are run in an executor.
+
+Example, getting the running config of many devices at most 100 at a time::
+
+    async def get_config (session):
+        tree, reply, msg = await session.rpc("<get-config><source><running/></source></get-config>")
+        return reply
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run_fleet(hosts, get_config, concurrency=100, username="admin"))
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import asyncio
+import concurrent.futures
+import getpass
+import io
+import logging
+from lxml import etree
+import sshutil.conn
+from sshutil.reactor import AsyncioChannelReactor
+
+from netconf import get_xpath
+from netconf.base import NC_BASE_11, XML_HEADER, NetconfFramingDecoder
+from netconf.base import client_hello_message, frame_pdu, parse_hello
+from netconf.client import get_default_cache
+from netconf.error import ReplyTimeoutError, RPCError, SessionError
+
+logger = logging.getLogger(__name__)
+
+# Notifications queued for a session before the oldest are dropped.
+NOTIFICATION_QUEUE_SIZE = 1000
+
+
+class AsyncNetconfSession (object):
+    """A NETCONF client session whose I/O is driven by an asyncio event loop.
+
+    Create sessions with the connect() coroutine. Replies are returned by
+    the rpc() coroutine, notifications received are iterated with
+    ``async for notif in session.notifications()``.
+    """
+    def __init__ (self, stream, loop=None, executor=None, debug=False):
+        """stream is a connected SSHClientSession to the netconf subsystem."""
+        self.stream = stream
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.executor = executor
+        self.debug = debug
+        self.decoder = NetconfFramingDecoder()
+        self.reactor = AsyncioChannelReactor(self.loop, debug)
+        self.send_lock = asyncio.Lock()
+        self.new_framing = False
+        self.capabilities = frozenset()
+        self.session_id = None
+        self.message_id = 0
+        self.rpc_out = {}
+        self.hello = self.loop.create_future()
+        self.notifs = asyncio.Queue(NOTIFICATION_QUEUE_SIZE)
+        self.notifs_dropped = 0
+        self.closed = False
+
+    def __str__ (self):
+        return "AsyncNetconfSession(sid:{})".format(self.session_id)
+
+    @classmethod
+    async def connect (cls,
+                       host,
+                       port=830,
+                       username=None,
+                       password=None,
+                       debug=False,
+                       cache=None,
+                       proxycmd=None,
+                       jumphost=None,
+                       loop=None,
+                       executor=None,
+                       hello_timeout=30):
+        """Open a session to host, see NetconfSSHSession for the connection
+        arguments. executor runs the blocking SSH connection setup, by default
+        the loop's default executor."""
+        loop = loop if loop is not None else asyncio.get_event_loop()
+        if cache is None:
+            cache = get_default_cache()
+        if username is None:
+            username = getpass.getuser()
+        stream = await loop.run_in_executor(executor,
+                                            lambda: sshutil.conn.SSHClientSession(host,
+                                                                                  port,
+                                                                                  "netconf",
+                                                                                  username,
+                                                                                  password,
+                                                                                  debug,
+                                                                                  cache=cache,
+                                                                                  proxycmd=proxycmd,
+                                                                                  jumphost=jumphost))
+        session = cls(stream, loop, executor, debug)
+        try:
+            await session._open_session(hello_timeout)
+        except BaseException:
+            await session.close()
+            raise
+        return session
+
+    async def _open_session (self, hello_timeout):
+        self.reactor.register(self.stream.chan, self._data_received)
+        await self._send([ client_hello_message() ])
+        try:
+            reply = await asyncio.wait_for(self.hello, hello_timeout)
+        except asyncio.TimeoutError:
+            raise SessionError("Timeout waiting for hello")
+        self.capabilities, self.session_id = parse_hello(reply, False)
+        self.new_framing = NC_BASE_11 in self.capabilities
+        self._process_messages()
+        if self.debug:
+            logger.debug("%s: Opened version %s session.", str(self), "1.1" if self.new_framing else "1.0")
+
+    async def __aenter__ (self):
+        return self
+
+    async def __aexit__ (self, *unused):
+        await self.close()
+
+    def is_active (self):
+        return not self.closed and self.stream.is_active()
+
+    async def close (self):
+        "Send a close-session (without waiting for the reply) and close the session"
+        if self.closed:
+            return
+        if self.session_id is not None and self.stream.is_active():
+            try:
+                await self._send([ self._rpc_message("<close-session/>") ])
+            except Exception as error:
+                if self.debug:
+                    logger.debug("%s: Error sending close-session, ignoring: %s", str(self), str(error))
+        self._closed("Session closed while waiting for reply")
+        self.reactor.unregister(self.stream.chan)
+        # Closing may close the SSH connection which blocks.
+        await self.loop.run_in_executor(self.executor, self.stream.close)
+
+    async def rpc (self, rpc, timeout=None):
+        """Send rpc and return its reply as (tree, reply, msg) like
+        NetconfClientSession.send_rpc.
+
+        Raises RPCError for an rpc-error reply, ReplyTimeoutError if no reply
+        is received within timeout seconds and SessionError if the session
+        closes. A cancelled call's reply is dropped when received.
+        """
+        if self.closed:
+            raise SessionError("Session closed")
+        msg_id = self.message_id
+        self.message_id += 1
+        future = self.loop.create_future()
+        self.rpc_out[msg_id] = future
+        try:
+            await self._send([ self._rpc_message(rpc, msg_id) ])
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ReplyTimeoutError("No reply to message-id {} within {} seconds".format(msg_id, timeout))
+        finally:
+            self.rpc_out.pop(msg_id, None)
+
+    async def notifications (self):
+        """Iterate the notifications received (as lxml element trees) until
+        the session closes."""
+        while True:
+            notif = await self.notifs.get()
+            if notif is None:
+                # Let other iterators see the close too.
+                self.notifs.put_nowait(None)
+                return
+            yield notif
+
+    def _rpc_message (self, rpc, msg_id=None):
+        if msg_id is None:
+            msg_id = self.message_id
+            self.message_id += 1
+        return """<rpc message-id="{}"
+            xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">{}</rpc>""".format(msg_id, rpc)
+
+    async def _send (self, msgs):
+        data = "".join(frame_pdu(XML_HEADER + msg, self.new_framing) for msg in msgs).encode('utf-8')
+        chan = self.stream.chan
+        async with self.send_lock:
+            # Send what the SSH window allows from the loop, block in the
+            # executor for the rest.
+            while data and chan.send_ready():
+                data = data[chan.send(data):]
+            if data:
+                await self.loop.run_in_executor(self.executor, chan.sendall, data)
+
+    def _data_received (self, data):
+        "Called from the loop with data read from the channel"
+        if not data:
+            self._closed("Session closed while waiting for reply")
+            return
+        self.decoder.feed(data)
+        self._process_messages()
+
+    def _process_messages (self):
+        decoder = self.decoder
+        try:
+            while True:
+                # The framing of what follows the hello isn't known until
+                # _open_session has parsed it.
+                if self.hello.done() and self.session_id is None:
+                    return
+                decoder.new_framing = self.new_framing
+                msg = decoder.next_message()
+                if msg is None:
+                    return
+                if not self.hello.done():
+                    self.hello.set_result(msg)
+                else:
+                    self._handle_message(msg)
+        except Exception as error:
+            logger.error("%s: Unexpected exception handling message: %s", str(self), str(error))
+            self._closed("Invalid message from server: {}".format(error))
+
+    def _handle_message (self, msg):
+        try:
+            tree = etree.parse(io.BytesIO(msg.encode('utf-8')))
+        except etree.XMLSyntaxError:
+            raise SessionError(msg, "Invalid XML from server.")
+
+        replies = get_xpath("/nc:rpc-reply")(tree)
+        if not replies:
+            if not get_xpath("/*[name()='notification']")(tree):
+                raise SessionError(msg, "No rpc-reply or notification found")
+            if self.notifs.full():
+                self.notifs.get_nowait()
+                self.notifs_dropped += 1
+            self.notifs.put_nowait(tree)
+            return
+
+        for reply in replies:
+            try:
+                msg_id = int(reply.get('message-id'))
+            except (TypeError, ValueError):
+                raise SessionError(msg, "No valid message-id attribute found")
+            future = self.rpc_out.pop(msg_id, None)
+            if future is None or future.done():
+                if self.debug:
+                    logger.debug("Ignoring unwanted reply for message-id %s", str(msg_id))
+                continue
+            error = get_xpath("nc:rpc-error")(reply)
+            if error:
+                future.set_exception(RPCError(msg, tree, error[0]))
+            else:
+                future.set_result((tree, reply, msg))
+
+    def _closed (self, reason):
+        if self.closed:
+            return
+        self.closed = True
+        if not self.hello.done():
+            self.hello.set_exception(SessionError("Session closed before hello"))
+        rpc_out, self.rpc_out = self.rpc_out, {}
+        for future in rpc_out.values():
+            if not future.done():
+                future.set_exception(SessionError(reason))
+        if self.notifs.full():
+            self.notifs.get_nowait()
+        self.notifs.put_nowait(None)
+
+
+async def run_fleet (hosts, operation, concurrency=100, loop=None, executor=None, **kwargs):
+    """Run the coroutine function operation(session) on a session to each of
+    hosts, with at most concurrency sessions open at a time.
+
+    hosts are host names or (host, port) tuples, kwargs are passed to
+    AsyncNetconfSession.connect. Returns a list with the result of operation
+    for each host in order, or the exception raised connecting or by
+    operation. Unless given an executor one of concurrency threads is used
+    to connect.
+    """
+    loop = loop if loop is not None else asyncio.get_event_loop()
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_host (host):
+        if isinstance(host, tuple):
+            host, port = host
+            args = dict(kwargs, port=port)
+        else:
+            args = kwargs
+        async with semaphore:
+            try:
+                session = await AsyncNetconfSession.connect(host, loop=loop, executor=executor, **args)
+            except Exception as error:
+                return error
+            try:
+                return await operation(session)
+            except Exception as error:
+                return error
+            finally:
+                await session.close()
+
+    try:
+        return await asyncio.gather(*[ run_host(host) for host in hosts ])
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
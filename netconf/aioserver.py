@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A NETCONF server accepting connections and reading sessions on an
+asyncio event loop (python 3 only).
+
+New connections are accepted and all session channels are read by
+callbacks on the loop, and the subscribers to each notification are picked
+on it, so the loop can also carry other work such as SNMP trap reception.
+The rest is not on the loop: SSH handshakes and session setup run on the
+server's handshake thread pool, each connection keeps its paramiko
+transport thread and a thread waiting for the connection to end, the rpc_*
+methods run in an executor and notifications are sent from a thread of
+their own.
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import threading
+import traceback
+from sshutil.reactor import AsyncioChannelReactor
+
+from netconf.error import ChannelClosed
+from netconf.server import NetconfSSHServer
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncNetconfSSHServer (NetconfSSHServer):
+    """A netconf server accepting connections and reading its sessions'
+    channels on an asyncio event loop, see the module documentation for what
+    still runs in threads.
+
+    The server methods use the same rpc_X contract as NetconfSSHServer. The
+    caller is responsible for running the loop (e.g., loop.run_forever()).
+    """
+    def __init__ (self,
+                  server_ctl=None,
+                  server_methods=None,
+                  port=830,
+                  host_key=None,
+                  debug=False,
+                  loop=None,
+                  executor=None,
+                  message_workers=4,
+                  **kwargs):
+        """
+        loop is the event loop to use, by default the running loop or if there
+        is none a new loop, which is set as the current loop for the caller to
+        run.
+        executor is the concurrent.futures executor rpc methods are run in, by
+        default a ThreadPoolExecutor of message_workers threads. Other keyword
+        arguments are passed to NetconfSSHServer.
+        """
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+        self.loop = loop
+        self.executor = executor
+        self.listen_sockets = []
+        self.closed = False
+        self.closed_event = threading.Event()
+        # A single thread sends notifications so they are sent in order.
+        self.notify_executor = concurrent.futures.ThreadPoolExecutor(1)
+        super(AsyncNetconfSSHServer, self).__init__(server_ctl,
+                                                    server_methods,
+                                                    port,
+                                                    host_key,
+                                                    debug,
+                                                    reactor=True,
+                                                    message_workers=message_workers,
+                                                    **kwargs)
+
+    def __str__ (self):
+        return "AsyncNetconfSSHServer(port={})".format(self.port)
+
+    def _create_reactor (self, message_workers, debug):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(message_workers)
+        return AsyncioChannelReactor(self.loop, debug), self.executor
+
+    def _start_accept (self, pname, protosocket):
+        if self.debug:
+            logger.debug("%s: Accepting %s connections on the event loop", str(self), pname)
+        protosocket.setblocking(False)
+        self.listen_sockets.append(protosocket)
+        self.loop.call_soon_threadsafe(self.loop.add_reader,
+                                       protosocket.fileno(),
+                                       self._accept_ready,
+                                       protosocket)
+
+    def _accept_ready (self, proto_sock):
+        try:
+            client, addr = proto_sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as error:
+            logger.error("%s: Error accepting connection: %s", str(self), str(error))
+            return
+        client.setblocking(True)
+        self._accept_client(client, addr)
+
+    def _close_listeners (self):
+        for sock in self.listen_sockets:
+            self.loop.remove_reader(sock.fileno())
+            sock.close()
+        self.listen_sockets = []
+
+    def close (self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        sockets = self.sockets
+
+        logger.info("%s: Closing", str(self))
+        self.timer.close()
+        self.loop.call_soon_threadsafe(self._close_listeners)
+        for sock in sockets:
+            if self.debug:
+                logger.debug("%s: closing server socket %s", str(self), str(sock))
+            sock.close()
+        self.reactor.close()
+        self.notify_executor.shutdown(wait=False)
+        self.close_wsocket.close()
+        self.close_rsocket.close()
+        self.closed_event.set()
+
+    def join (self):
+        "Wait on server to terminate"
+        self.closed_event.wait()
+
+    def trigger_notification (self, notif):
+        """Send notif to all sessions with an active subscription.
+
+        May be called from any thread, subscribers are selected on the loop
+        and the notification sent from the notification thread.
+        """
+        self.loop.call_soon_threadsafe(self._fanout_notification, notif)
+
+    def _fanout_notification (self, notif):
+        sessions = [ session
+                     for session in self.registry.get_sessions()
+                     if session.subscription_active ]
+        if self.debug:
+            logger.debug("%s: Notification for %d subscribers", str(self), len(sessions))
+        if sessions and not self.closed:
+            self.notify_executor.submit(self._send_notification, sessions, notif)
+
+    def _send_notification (self, sessions, notif):
+        for session in sessions:
+            if not session.is_active() or not session.subscription_active:
+                continue
+            # A session may be closed by another thread at any point, an
+            # error with one session must not stop the others getting notif.
+            try:
+                session.send_message(notif)
+            except (ChannelClosed, EOFError, socket.error) as error:
+                logger.info("%s: Error sending notification to %s: %s",
+                            str(self),
+                            str(session),
+                            str(error))
+            except Exception as error:
+                logger.error("%s: Unexpected exception sending notification to %s: %s: %s",
+                             str(self),
+                             str(session),
+                             str(error),
+                             traceback.format_exc())
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -21,11 +21,12 @@ import logging
 import io
 import socket
 import threading
+import time
 import traceback
 from lxml import etree
 from lxml.builder import E
 
-from netconf import NSMAP, MAXSSHBUF
+from netconf import NSMAP, MAXSSHBUF, get_xpath
 from netconf.error import ChannelClosed, FramingError, SessionError
 from netconf.util import elm
 
@@ -34,6 +35,14 @@ logger = logging.getLogger(__name__)
 NC_BASE_10 = "urn:ietf:params:netconf:base:1.0"
 NC_BASE_11 = "urn:ietf:params:netconf:base:1.1"
 XML_HEADER = """<?xml version="1.0" encoding="UTF-8"?>"""
+HELLO_CAPABILITIES = (NC_BASE_10, NC_BASE_11)
+
+# Limit on the number of distinct peer capability sets we will share.
+MAX_CAPABILITY_SETS = 1024
+
+_capability_sets = {}
+_capability_sets_lock = threading.Lock()
+_client_hello_templates = {}
 
 
 def chunkit (msg, maxsend):
@@ -50,6 +59,88 @@ def chunkit (msg, maxsend):
     yield msg
 
 
+def frame_pdu (msg, new_framing):
+    "Return msg framed for sending with 1.1 (chunked) or 1.0 (end of message) framing"
+    if new_framing:
+        return "\n#{}\n{}\n##\n".format(len(msg), msg)
+    return msg + "]]>]]>"
+
+
+def client_hello_message (caplist=HELLO_CAPABILITIES):
+    "Return the hello message of a client with the capabilities in caplist"
+    # Clients always send the same hello so only serialize it once.
+    caplist = tuple(caplist)
+    template = _client_hello_templates.get(caplist)
+    if template is None:
+        template = hello_template(caplist)
+        _client_hello_templates[caplist] = template
+    return hello_message(template)
+
+
+def parse_hello (reply, is_server):
+    """Return the capabilities (see intern_capabilities) and session-id (None
+    for a server) from the hello message reply of our peer, if it is a
+    server is_server is False."""
+    tree = etree.parse(io.BytesIO(reply.encode('utf-8')))
+    root = tree.getroot()
+    caps = get_xpath("/nc:hello/nc:capabilities/nc:capability")(root)
+    capabilities = intern_capabilities(cap.text for cap in caps)
+    if NC_BASE_11 not in capabilities and NC_BASE_10 not in capabilities:
+        raise SessionError("Server doesn't implement 1.0 or 1.1 of netconf")
+
+    session_id = None
+    try:
+        session_id = get_xpath("/nc:hello/nc:session-id")(root)[0].text
+        # If we are a server it is a failure to receive a session id.
+        if is_server:
+            raise SessionError("Client sent a session-id")
+        session_id = int(session_id)
+    except (KeyError, IndexError, AttributeError):
+        if not is_server:
+            raise SessionError("Server didn't supply session-id")
+    except ValueError:
+        raise SessionError("Server supplied non integer session-id: {}", session_id)
+    return capabilities, session_id
+
+
+def hello_template (caplist, methods=None):
+    """Serialize a hello message returning the text before and after the
+    position of the session-id element, see hello_message.
+
+    If methods is given its nc_append_capabilities is called to add the
+    server capabilities.
+    """
+    msg = elm("hello", attrib={'xmlns': NSMAP['nc']})
+    caps = E.capabilities(*[E.capability(x) for x in caplist])
+    if methods is not None:
+        methods.nc_append_capabilities(caps)
+    msg.append(caps)
+    msg = etree.tostring(msg).decode('utf-8')
+    idx = msg.rindex("</hello>")
+    return msg[:idx], msg[idx:]
+
+
+def hello_message (template, session_id=None):
+    "Return a hello message from a template splicing in the session-id if not None"
+    head, tail = template
+    if session_id is None:
+        return head + tail
+    return "{}<session-id>{}</session-id>{}".format(head, session_id, tail)
+
+
+def intern_capabilities (caps):
+    """Return caps as a frozenset shared with any other session that received
+    the same capabilities"""
+    caps = frozenset(caps)
+    with _capability_sets_lock:
+        try:
+            return _capability_sets[caps]
+        except KeyError:
+            if len(_capability_sets) < MAX_CAPABILITY_SETS:
+                _capability_sets[caps] = caps
+            return caps
+
+
 class NetconfTransportMixin (object):
     def connect (self):
         raise NotImplementedError()
@@ -62,10 +153,157 @@ class NetconfPacketTransport (object):
     def send_pdu (self, content, new_framing):
         raise NotImplementedError()
 
+    def send_pdus (self, contents, new_framing):
+        raise NotImplementedError()
+
     def receive_pdu (self, new_framing):
         raise NotImplementedError()
 
 
+class NetconfFramingDecoder (object):
+    """Decode netconf PDUs from a stream of received data -- doesn't perform any I/O"""
+    def __init__ (self, new_framing=False):
+        self.new_framing = new_framing
+        self.rbuffer = b""
+        self.chunks = []
+        self.searchfrom = 0
+        # Bytes of the current chunk not yet returned by next_fragment.
+        self.chunk_left = 0
+
+    def feed (self, data):
+        "Add received data to be decoded"
+        self.rbuffer += data
+
+    def next_message (self):
+        """Return the next complete message or None if more data is required"""
+        if self.new_framing:
+            return self._next_11()
+        else:
+            return self._next_10()
+
+    def next_fragment (self):
+        """Return (data, end) with the next received data of the current
+        message, end is True if data completes it, or None if more data is
+        required. Unlike next_message a large message is returned as it is
+        received (so it can be parsed incrementally)."""
+        if self.new_framing:
+            if self.chunks:
+                # Chunks of this message already taken by next_message.
+                data = b"".join(self.chunks)
+                self.chunks = []
+                return data, False
+            return self._fragment_11()
+        else:
+            self.searchfrom = 0
+            return self._fragment_10()
+
+    def _chunk_header (self):
+        """Return (chunk length, header length) of the 1.1 chunk header at
+        the start of the buffer, a chunk length of 0 for the end of message,
+        or None if more data is required"""
+        rbuffer = self.rbuffer
+        if len(rbuffer) < 4:
+            return None
+
+        if rbuffer[:2] != b"\n#":
+            raise FramingError(rbuffer)
+
+        # Check for last chunk.
+        if rbuffer[2:4] == b"#\n":
+            return 0, 4
+
+        # Get chunk length, at most 10 digits
+        idx = rbuffer.find(b"\n", 2, 14)
+        if idx == -1:
+            if len(rbuffer) >= 14:
+                raise FramingError(rbuffer)
+            return None
+
+        lenstr = rbuffer[2:idx]
+        try:
+            chunklen = int(lenstr)
+            if not (4294967295 >= chunklen > 0):
+                raise FramingError("Unacceptable chunk length: {}".format(chunklen))
+        except ValueError:
+            raise FramingError("Frame length not integer: {}".format(lenstr))
+        return chunklen, idx + 1
+
+    def next_chunk (self):
+        """Return the next 1.1 framing chunk, an empty bytes object at the end
+        of a message, or None if more data is required"""
+        header = self._chunk_header()
+        if header is None:
+            return None
+        chunklen, start = header
+
+        end = start + chunklen
+        if len(self.rbuffer) < end:
+            return None
+        chunk = self.rbuffer[start:end]
+        self.rbuffer = self.rbuffer[end:]
+        return chunk
+
+    def _fragment_10 (self):
+        eomidx = self.rbuffer.find(b"]]>]]>")
+        if eomidx != -1:
+            data = self.rbuffer[:eomidx]
+            self.rbuffer = self.rbuffer[eomidx + 6:]
+            return data, True
+
+        # Keep what may be the start of the end of message marker.
+        keep = max(0, len(self.rbuffer) - 5)
+        if not keep:
+            return None
+        data = self.rbuffer[:keep]
+        self.rbuffer = self.rbuffer[keep:]
+        return data, False
+
+    def _fragment_11 (self):
+        if not self.chunk_left:
+            header = self._chunk_header()
+            if header is None:
+                return None
+            chunklen, start = header
+            self.rbuffer = self.rbuffer[start:]
+            if not chunklen:
+                return b"", True
+            self.chunk_left = chunklen
+
+        data = self.rbuffer[:self.chunk_left]
+        if not data:
+            return None
+        self.rbuffer = self.rbuffer[len(data):]
+        self.chunk_left -= len(data)
+        # Save a call if the end of message follows.
+        if not self.chunk_left and self.rbuffer[:4] == b"\n##\n":
+            self.rbuffer = self.rbuffer[4:]
+            return data, True
+        return data, False
+
+    def _next_10 (self):
+        eomidx = self.rbuffer.find(b"]]>]]>", self.searchfrom)
+        if eomidx == -1:
+            self.searchfrom = max(0, len(self.rbuffer) - 5)
+            return None
+
+        msg = self.rbuffer[:eomidx]
+        self.rbuffer = self.rbuffer[eomidx + 6:]
+        self.searchfrom = 0
+        return msg.decode('utf-8')
+
+    def _next_11 (self):
+        chunk = self.next_chunk()
+        while chunk:
+            self.chunks.append(chunk)
+            chunk = self.next_chunk()
+        if chunk is None:
+            return None
+
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data.decode('utf-8')
+
+
 class NetconfFramingTransport (NetconfPacketTransport):
     """Packetize an ssh stream into netconf PDUs -- doesn't need to be SSH specific"""
     def __init__ (self, stream, max_chunk, debug):
@@ -73,7 +311,7 @@ class NetconfFramingTransport (NetconfPacketTransport):
         self.stream = stream
         self.max_chunk = max_chunk
         self.debug = debug
-        self.rbuffer = b""
+        self.decoder = NetconfFramingDecoder()
 
     def __del__ (self):
         self.close()
@@ -99,42 +337,27 @@ class NetconfFramingTransport (NetconfPacketTransport):
 
     def receive_pdu (self, new_framing):
         assert self.stream is not None
-        if new_framing:
-            return self._receive_11()
-        else:
-            return self._receive_10()
+        self.decoder.new_framing = new_framing
+        return self._receive(self.decoder.next_message)
 
-    def send_pdu (self, msg, new_framing):
-        assert self.stream is not None
-        # Apparently ssh has a bug that requires minimum of 64 bytes?
-        # This may not be sufficient to fix this.
-        if new_framing:
-            msg = "\n#{}\n{}\n##\n".format(len(msg), msg)
-        else:
-            msg += "]]>]]>"
-        for chunk in chunkit(msg, self.max_chunk - 64):
-            self.stream.sendall(chunk)
-
-    def _receive_10 (self):
-        searchfrom = 0
-        while True:
-            eomidx = self.rbuffer.find(b"]]>]]>", searchfrom)
-            if eomidx != -1:
-                break
-            searchfrom = max(0, len(self.rbuffer) - 5)
-            buf = self.stream.recv(self.max_chunk)
-            self.rbuffer += buf
-
-        msg = self.rbuffer[:eomidx]
-        self.rbuffer = self.rbuffer[eomidx + 6:]
-        return msg.decode('utf-8')
+    def buffered_pdu (self, new_framing):
+        "Return the next message if it has already been received, otherwise None"
+        self.decoder.new_framing = new_framing
+        return self.decoder.next_message()
 
-    def _receive_chunk (self):
-        blen = len(self.rbuffer)
-        while blen < 4:
+    def receive_fragment (self, new_framing):
+        """Return (data, end) with the next data of the message being
+        received, see NetconfFramingDecoder.next_fragment"""
+        assert self.stream is not None
+        self.decoder.new_framing = new_framing
+        return self._receive(self.decoder.next_fragment)
+
+    def _receive (self, decode):
+        "Read from the stream until decode() returns something"
+        decoder = self.decoder
+        msg = decode()
+        while msg is None:
             buf = self.stream.recv(self.max_chunk)
-            self.rbuffer += buf
-            blen = len(self.rbuffer)
             if self.stream is None:
                 if self.debug:
                     logger.debug("Channel closed: stream is None")
@@ -143,57 +366,24 @@ class NetconfFramingTransport (NetconfPacketTransport):
                 if self.debug:
                     logger.debug("Channel closed: Zero bytes read")
                 raise ChannelClosed(self)
+            decoder.feed(buf)
+            msg = decode()
+        return msg
 
-        if self.rbuffer[:2] != b"\n#":
-            raise FramingError(self.rbuffer)
-        self.rbuffer = self.rbuffer[2:]
-
-        # Get chunk length or termination indicator
-        idx = -1
-        searchfrom = 0
-        while True:
-            idx = self.rbuffer.find(b"\n", searchfrom)
-            if 12 > idx > 0:
-                break
-            if idx > 12 or len(self.rbuffer) > 12:
-                raise FramingError(self.rbuffer)
-            searchfrom = len(self.rbuffer)
-            self.rbuffer += self.stream.recv(self.max_chunk)
-
-        # Check for last chunk.
-        if self.rbuffer[0:2] == b"#\n":
-            self.rbuffer = self.rbuffer[2:]
-            return None
-
-        lenstr = self.rbuffer[:idx]
-        self.rbuffer = bytes(self.rbuffer[idx + 1:])
-
-        try:
-            chunklen = int(lenstr)
-            if not (4294967295 >= chunklen > 0):
-                raise FramingError("Unacceptable chunk length: {}".format(chunklen))
-        except ValueError:
-            raise FramingError("Frame length not integer: {}".format(lenstr.encode('utf-8')))
-
-        while True:
-            blen = len(self.rbuffer)
-            if blen >= chunklen:
-                chunk = self.rbuffer[:chunklen]
-                self.rbuffer = self.rbuffer[chunklen:]
-                return chunk
-            self.rbuffer += self.stream.recv(self.max_chunk)
-
-    def _iter_receive_chunks (self):
+    def send_pdu (self, msg, new_framing):
         assert self.stream is not None
-        chunk = self._receive_chunk()
-        while chunk:
-            yield chunk
-            chunk = self._receive_chunk()
+        # Apparently ssh has a bug that requires minimum of 64 bytes?
+        # This may not be sufficient to fix this.
+        msg = frame_pdu(msg, new_framing)
+        for chunk in chunkit(msg, self.max_chunk - 64):
+            self.stream.sendall(chunk)
 
-    def _receive_11 (self):
+    def send_pdus (self, msgs, new_framing):
+        "Frame msgs and send them together"
         assert self.stream is not None
-        data = b"".join([x for x in self._iter_receive_chunks()])
-        return data.decode('utf-8')
+        data = "".join(frame_pdu(msg, new_framing) for msg in msgs)
+        for chunk in chunkit(data, self.max_chunk - 64):
+            self.stream.sendall(chunk)
 
 
 class NetconfSession (object):
@@ -207,11 +397,13 @@ class NetconfSession (object):
         self.debug = debug
         self.pkt_stream = NetconfFramingTransport(stream, max_chunk, debug)
         self.new_framing = False
-        self.capabilities = set()
+        self.capabilities = frozenset()
         self.reader_thread = None
         self.lock = threading.Lock()
         self.session_id = session_id
         self.session_open = False
+        # Time a message was last sent or received, used to find idle sessions.
+        self.last_activity = time.time()
 
     def __del__ (self):
         if hasattr(self, "session_open") and self.session_open:
@@ -227,34 +419,46 @@ class NetconfSession (object):
     def send_message (self, msg):
         with self.lock:
             pkt_stream = self.pkt_stream
+        if pkt_stream is None:
+            # Closed, possibly by another thread.
+            raise ChannelClosed(self)
         pkt_stream.send_pdu(XML_HEADER + msg, self.new_framing)
+        self.last_activity = time.time()
         #TODO: Remove this
         print("********************* SEND_MESSAGE: starts ********************************")
         print(msg)
         print("********************* SEND_MESSAGE: ends **********************************")
 
+    def send_messages (self, msgs):
+        "Send several messages with as few writes as possible"
+        with self.lock:
+            pkt_stream = self.pkt_stream
+        if pkt_stream is None:
+            raise ChannelClosed(self)
+        pkt_stream.send_pdus([ XML_HEADER + msg for msg in msgs ], self.new_framing)
+        self.last_activity = time.time()
+
     def _receive_message (self):
         # private method to receive a full message.
         with self.lock:
             if self.reader_thread and not self.reader_thread.keep_running:
                 return None
             pkt_stream = self.pkt_stream
-        return pkt_stream.receive_pdu(self.new_framing)
+        msg = pkt_stream.receive_pdu(self.new_framing)
+        self.last_activity = time.time()
+        return msg
 
     def send_hello (self, caplist, session_id=None):
-        msg = elm("hello", attrib={'xmlns': NSMAP['nc']})
-        caps = E.capabilities(*[E.capability(x) for x in caplist])
         if session_id is not None:
             assert hasattr(self, "methods")
-            self.methods.nc_append_capabilities(caps)       # pylint: disable=E1101
-        msg.append(caps)
+            template = hello_template(caplist, self.methods)    # pylint: disable=E1101
+            msg = hello_message(template, session_id)
+        else:
+            msg = client_hello_message(caplist)
 
         if self.debug:
             logger.debug("%s: Sending HELLO", str(self))
-        if session_id is not None:
-            msg.append(E("session-id", str(session_id)))
-        msg = etree.tostring(msg)
-        self.send_message(msg.decode('utf-8'))
+        self.send_message(msg)
 
     def close (self):
         if self.debug:
@@ -279,54 +483,33 @@ class NetconfSession (object):
                     # If we are blocked on reading this should unblock us
                     pkt_stream.close()
 
-    def _open_session (self, is_server):
+    def _open_session (self, is_server, hello_timeout=None):
         assert is_server or self.session_id is None
 
         # The transport should be connected at this point.
         try:
             # Send hello message.
-            self.send_hello((NC_BASE_10, NC_BASE_11), self.session_id)
+            self.send_hello(HELLO_CAPABILITIES, self.session_id)
 
-            # Get reply
+            # Get reply, bounding the wait if requested.
+            if hello_timeout:
+                self.pkt_stream.stream.settimeout(hello_timeout)
             reply = self._receive_message()
+            if hello_timeout:
+                self.pkt_stream.stream.settimeout(None)
             if self.debug:
                 logger.debug("Received HELLO")
 
-            # Parse reply
-            tree = etree.parse(io.BytesIO(reply.encode('utf-8')))
-            root = tree.getroot()
-            caps = root.xpath("//nc:hello/nc:capabilities/nc:capability",
-                              namespaces=NSMAP)
-
-            # Store capabilities
-            for cap in caps:
-                self.capabilities.add(cap.text)
-
+            # Parse reply storing capabilities and session ID.
+            self.capabilities, session_id = parse_hello(reply, is_server)
             if NC_BASE_11 in self.capabilities:
                 self.new_framing = True
-            elif NC_BASE_10 not in self.capabilities:
-                raise SessionError("Server doesn't implement 1.0 or 1.1 of netconf")
-
-            # Get session ID.
-            try:
-                session_id = root.xpath("//nc:hello/nc:session-id", namespaces=NSMAP)[0].text
-                # If we are a server it is a failure to receive a session id.
-                if is_server:
-                    raise SessionError("Client sent a session-id")
-                self.session_id = int(session_id)
-            except (KeyError, IndexError, AttributeError):
-                if not is_server:
-                    raise SessionError("Server didn't supply session-id")
-            except ValueError:
-                raise SessionError("Server supplied non integer session-id: {}", session_id)
+            if not is_server:
+                self.session_id = session_id
 
             self.session_open = True
 
-            # Create reader thread.
-            self.reader_thread = threading.Thread(target=self._read_message_thread)
-            self.reader_thread.daemon = True
-            self.reader_thread.keep_running = True
-            self.reader_thread.start()
+            self._start_reader()
 
             if self.debug:
                 logger.debug("%s: Opened version %s session.", str(self), "1.1" if self.new_framing else "1.0")
@@ -335,6 +518,13 @@ class NetconfSession (object):
             self.close()
             raise
 
+    def _start_reader (self):
+        # Create reader thread.
+        self.reader_thread = threading.Thread(target=self._read_message_thread)
+        self.reader_thread.daemon = True
+        self.reader_thread.keep_running = True
+        self.reader_thread.start()
+
     def reader_exits (self):
         # Called from reader thread when our reader thread exits
         raise NotImplementedError("reader_exits")
@@ -412,7 +602,7 @@ class NetconfSession (object):
             # Should we close the session cleanly or just disconnect?
             logger.error("%s Session error [closing session]: %s", str(self), str(error))
             self.close()
-        except socket.error as error:
+        except (socket.error, EOFError) as error:
             if self.debug:
                 logger.debug("Socket error in reader thread [exiting]: %s", str(error))
             self.close()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A notification bus between processes over a Unix socket.
+
+One process (e.g., the one receiving SNMP traps) publishes notifications on
+a NotificationBus, each server process runs a NotificationBusSubscriber that
+passes them to its own server to be sent to its subscribed sessions. A
+notification is encoded once and written to every subscriber as a length
+prefixed frame.
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import errno
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from sshutil.stats import Counters
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+def _recv_all (sock, length):
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise EOFError("Bus closed")
+        data += chunk
+    return data
+
+
+class NotificationBus (object):
+    """Publish notifications to the subscribers connected to the Unix socket path.
+
+    A subscriber that does not accept a notification within send_timeout
+    seconds is disconnected so a stuck process cannot stall the publisher.
+    """
+    def __init__ (self, path, send_timeout=5, debug=False):
+        self.path = path
+        self.send_timeout = send_timeout
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.running = True
+        self.counters = Counters("published", "sent", "dropped")
+
+        try:
+            os.unlink(path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        self.listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listen_socket.bind(path)
+        self.listen_socket.listen(16)
+
+        # Used to wake the accept thread on close.
+        self.close_rsocket, self.close_wsocket = socket.socketpair()
+
+        self.thread = threading.Thread(None, self._accept_thread, name="NotificationBus")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__ (self):
+        return "NotificationBus({})".format(self.path)
+
+    def publish (self, notif):
+        "Send the notification notif (a string) to all subscribers"
+        data = notif.encode('utf-8')
+        frame = FRAME_HEADER.pack(len(data)) + data
+        self.counters.incr("published")
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for sock in subscribers:
+            try:
+                sock.sendall(frame)
+                self.counters.incr("sent")
+            except (socket.error, socket.timeout) as error:
+                logger.warning("%s: Dropping subscriber: %s", str(self), str(error))
+                self._remove(sock)
+
+    # Allow the bus to be used where a server's trigger_notification is.
+    trigger_notification = publish
+
+    def get_stats (self):
+        stats = self.counters.get_stats()
+        with self.lock:
+            stats["subscribers"] = len(self.subscribers)
+        return stats
+
+    def close (self):
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            subscribers = self.subscribers
+            self.subscribers = []
+        self.close_wsocket.send(b"!")
+        self.thread.join()
+        for sock in subscribers:
+            sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _remove (self, sock):
+        with self.lock:
+            if sock not in self.subscribers:
+                return
+            self.subscribers.remove(sock)
+        self.counters.incr("dropped")
+        sock.close()
+
+    def _accept_thread (self):
+        try:
+            while True:
+                rfds, unused, unused = select.select([self.listen_socket, self.close_rsocket], [], [])
+                if self.close_rsocket in rfds:
+                    break
+                sock, unused = self.listen_socket.accept()
+                sock.settimeout(self.send_timeout)
+                with self.lock:
+                    self.subscribers.append(sock)
+                if self.debug:
+                    logger.debug("%s: New subscriber", str(self))
+        finally:
+            self.listen_socket.close()
+            self.close_rsocket.close()
+            self.close_wsocket.close()
+
+
+class NotificationBusSubscriber (object):
+    """Receive the notifications published on the bus at path.
+
+    callback(notif) is called from the subscriber thread with each
+    notification. The connection is retried every retry_interval seconds
+    until the bus is available, and again if it is lost.
+    """
+    def __init__ (self, path, callback, retry_interval=1, debug=False):
+        self.path = path
+        self.callback = callback
+        self.retry_interval = retry_interval
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.sock = None
+        self.running = True
+        self.received = 0
+
+        self.thread = threading.Thread(None, self._reader_thread, name="NotificationBusSubscriber")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__ (self):
+        return "NotificationBusSubscriber({})".format(self.path)
+
+    def close (self):
+        with self.lock:
+            self.running = False
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def _connect (self):
+        while True:
+            with self.lock:
+                if not self.running:
+                    return None
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except socket.error as error:
+                sock.close()
+                if self.debug:
+                    logger.debug("%s: Bus not available: %s", str(self), str(error))
+                time.sleep(self.retry_interval)
+                continue
+            with self.lock:
+                if self.running:
+                    self.sock = sock
+                    return sock
+            sock.close()
+            return None
+
+    def _reader_thread (self):
+        while True:
+            sock = self._connect()
+            if sock is None:
+                return
+            try:
+                while True:
+                    length, = FRAME_HEADER.unpack(_recv_all(sock, FRAME_HEADER.size))
+                    notif = _recv_all(sock, length).decode('utf-8')
+                    self.received += 1
+                    try:
+                        self.callback(notif)
+                    except Exception as error:
+                        logger.error("%s: Unexpected exception in callback: %s", str(self), str(error))
+            except (EOFError, socket.error) as error:
+                if self.debug:
+                    logger.debug("%s: Bus connection lost: %s", str(self), str(error))
+            finally:
+                with self.lock:
+                    self.sock = None
+                sock.close()
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -17,18 +17,246 @@
 # limitations under the License.
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import collections
 import logging
 import io
 import threading
+import time
 import socket
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import sshutil.conn
+from sshutil.cache import SSHConnectionCache
+from sshutil.stats import Counters
+from sshutil.timer import TimerQueue
 from lxml import etree
-from netconf import NSMAP
+from netconf import get_xpath
 from netconf.base import NetconfSession
-from netconf.error import RPCError, SessionError
+from netconf.error import ReplyTimeoutError, RPCError, SessionError
 
 logger = logging.getLogger(__name__)
 
+# Defaults for the connection cache shared by NetconfSSHSession clients.
+NC_CACHE_CLOSE_TIMEOUT = 5
+NC_CACHE_MAX_CHANNELS = 8
+
+# Default queue size and overflow policies of NotificationSubscription.
+NOTIFICATION_QUEUE_SIZE = 1000
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_BLOCK = "block"
+
+NC_NOTIFICATION_NS = "urn:ietf:params:xml:ns:netconf:notification:1.0"
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+_reply_timer = None
+_reply_timer_lock = threading.Lock()
+
+
+def get_reply_timer ():
+    "Return the timer queue expiring the RPC reply deadlines of all client sessions"
+    global _reply_timer                                     # pylint: disable=W0603
+    with _reply_timer_lock:
+        if _reply_timer is None:
+            _reply_timer = TimerQueue("NetconfReplyTimer")
+        return _reply_timer
+
+
+def get_default_cache ():
+    """Return the SSH connection cache NetconfSSHSession uses by default.
+
+    Sessions to the same host, port and user are opened as channels on a
+    shared connection, so only the first one pays for the TCP connect, SSH
+    handshake and authentication.
+    """
+    global _default_cache                                   # pylint: disable=W0603
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SSHConnectionCache("NETCONF Client Cache",
+                                                close_timeout=NC_CACHE_CLOSE_TIMEOUT,
+                                                max_channels=NC_CACHE_MAX_CHANNELS)
+        return _default_cache
+
+
+def configure_default_cache (**kwargs):
+    """Replace the default NetconfSSHSession connection cache with one
+    created with kwargs (see SSHConnectionCache, e.g., close_timeout,
+    max_channels and max_sockets), returns the new cache.
+
+    Sessions using the previous cache are unaffected, its unused
+    connections are closed.
+    """
+    global _default_cache                                   # pylint: disable=W0603
+    kwargs.setdefault("close_timeout", NC_CACHE_CLOSE_TIMEOUT)
+    kwargs.setdefault("max_channels", NC_CACHE_MAX_CHANNELS)
+    cache = SSHConnectionCache("NETCONF Client Cache", **kwargs)
+    with _default_cache_lock:
+        old, _default_cache = _default_cache, cache
+    if old is not None:
+        old.close()
+    return cache
+
+
+class NotificationSubscription (object):
+    """A consumer of the notifications received on a client session.
+
+    See NetconfClientSession.subscribe. Notifications (the lxml
+    <notification> elements) whose event element tag (either
+    "{namespace}name" or "name") is in events, or all if events is None,
+    are passed to callback from the session's reader thread or, without a
+    callback, queued to be read with get() or by iterating the
+    subscription. Iteration ends when the subscription or session is closed.
+
+    When queue_size notifications are queued overflow decides what happens
+    to a new one: OVERFLOW_DROP_OLDEST or OVERFLOW_DROP_NEWEST drop one,
+    OVERFLOW_BLOCK stops reading the session (so replies are also delayed)
+    until there is room, pushing back on the server.
+    """
+    def __init__ (self,
+                  session,
+                  events=None,
+                  callback=None,
+                  queue_size=NOTIFICATION_QUEUE_SIZE,
+                  overflow=OVERFLOW_DROP_OLDEST):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK):
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        self.session = session
+        self.events = frozenset(events) if events is not None else None
+        self.callback = callback
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.cv = threading.Condition()
+        self.queue = collections.deque()
+        self.closed = False
+        self.counters = Counters("received", "dropped")
+
+    def __str__ (self):
+        return "NotificationSubscription({}, events={})".format(str(self.session), self.events)
+
+    def __iter__ (self):
+        while True:
+            notif = self.get()
+            if notif is None:
+                return
+            yield notif
+
+    def matches (self, event):
+        "Return True if we want notifications of the event element event"
+        if self.events is None:
+            return True
+        return event.tag in self.events or etree.QName(event).localname in self.events
+
+    def get (self, timeout=None):
+        """Return the next notification waiting at most timeout seconds, or
+        None on timeout or if closed"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cv:
+            while not self.queue:
+                if self.closed:
+                    return None
+                if deadline is None:
+                    self.cv.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.cv.wait(remaining)
+            notif = self.queue.popleft()
+            if self.overflow == OVERFLOW_BLOCK:
+                self.cv.notify_all()
+            return notif
+
+    def deliver (self, notif):
+        "Called from the session reader with a matching notification"
+        self.counters.incr("received")
+        if self.callback is not None:
+            try:
+                self.callback(notif)
+            except Exception as error:
+                logger.error("%s: Unexpected exception in callback: %s", str(self), str(error))
+            return
+        with self.cv:
+            while len(self.queue) >= self.queue_size:
+                if self.closed or self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.counters.incr("dropped")
+                    return
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self.queue.popleft()
+                    self.counters.incr("dropped")
+                    break
+                self.cv.wait()
+            self.queue.append(notif)
+            self.cv.notify_all()
+
+    def close (self):
+        "Stop receiving notifications, queued ones may still be read"
+        self.session._unsubscribe(self)                  # pylint: disable=W0212
+        with self.cv:
+            self.closed = True
+            self.cv.notify_all()
+
+    def get_stats (self):
+        stats = self.counters.get_stats()
+        with self.cv:
+            stats["queued"] = len(self.queue)
+        return stats
+
+
+class _ReplyStream (object):
+    """Parse a reply as it is received, passing each element on path to
+    callback, see NetconfClientSession.send_rpc_stream_async"""
+    def __init__ (self, future, path, callback):
+        names = path.strip("/").split("/")
+        self.future = future
+        self.callback = callback
+        # Names of the ancestors to check, nearest first.
+        self.ancestors = names[-2::-1]
+        self.parser = etree.XMLPullParser(events=("end", ), tag="{*}" + names[-1])
+        self.count = 0
+        self.error = None
+
+    def _on_path (self, elem):
+        parent = elem.getparent()
+        for name in self.ancestors:
+            if parent is None or etree.QName(parent).localname != name:
+                return False
+            parent = parent.getparent()
+        return True
+
+    def feed (self, data):
+        if self.parser is None:
+            return
+        if self.future.done():
+            # Timed out or cancelled, skip the rest.
+            self.parser = None
+            return
+        try:
+            self.parser.feed(data)
+            for unused, elem in self.parser.read_events():
+                if not self._on_path(elem):
+                    continue
+                self.callback(elem)
+                self.count += 1
+                # Free the element, other elements are kept for close(). The
+                # root (path "rpc-reply") is the reply close() returns.
+                parent = elem.getparent()
+                if parent is not None:
+                    elem.clear()
+                    parent.remove(elem)
+        except Exception as error:
+            self.error = error
+            self.parser = None
+
+    def close (self):
+        """Return the reply element (less the elements passed to callback),
+        raises the exception raised by parsing or callback"""
+        if self.error is not None:
+            raise self.error
+        if self.parser is None:
+            return None
+        return self.parser.close()
+
 
 class NetconfClientSession (NetconfSession):
     """Netconf Protocol"""
@@ -36,10 +264,17 @@ class NetconfClientSession (NetconfSession):
         super(NetconfClientSession, self).__init__(stream, debug, None)
         self.message_id = 0
         self.closing = False
+        # Futures of the RPCs awaiting replies by message-id.
         self.rpc_out = {}
+        # (path, callback) of the rpc_out replies to parse as they arrive.
+        self.rpc_streams = {}
 
-        # Condition to handle rpc_out queue
+        # Protects message_id, rpc_out and rpc_streams
         self.cv = threading.Condition()
+        # Protects the following.
+        self.subscriptions_lock = threading.Lock()
+        self.subscriptions = ()
+        self.subscription_created = False
 
         super(NetconfClientSession, self)._open_session(False)
 
@@ -66,73 +301,308 @@ class NetconfClientSession (NetconfSession):
                 logger.debug("Got socket error sending close-session request, ignoring")
 
         super(NetconfClientSession, self).close()
+        self._fail_pending("Session closed while waiting for reply")
+        self._close_subscriptions()
 
         if self.debug:
             logger.debug("%s: Closed: %s", str(self), str(reply))
 
-    def send_rpc_async (self, rpc, noreply=False):
-
-        # Get the next message id
+    def send_rpc_async (self, rpc, noreply=False, timeout=None):
+        """Send rpc and return a concurrent.futures.Future for its reply.
+
+        The future's result is (tree, reply, msg) as returned by send_rpc,
+        it raises RPCError for an rpc-error reply, ReplyTimeoutError if no
+        reply is received within timeout seconds and SessionError if the
+        session closes first. A cancelled future's reply is dropped when
+        received. If noreply is True None is returned.
+        """
+        return self.send_rpcs_async([ rpc ], noreply, timeout)[0]
+
+    def send_rpcs_async (self, rpcs, noreply=False, timeout=None):
+        """Send the list rpcs in a single write, return a list of their
+        futures (see send_rpc_async)"""
+        return self._send_rpcs(rpcs, noreply, timeout)
+
+    def send_rpc_stream_async (self, rpc, path, callback, timeout=None):
+        """Send rpc and parse its reply as it is received, calling
+        callback(element) from the reader thread with each element on path.
+
+        path is the local name of the elements wanted (e.g., "vnf-alarm"),
+        optionally preceded by those of their ancestors (e.g.,
+        "alarms/vnf-alarm"). An element is cleared after callback returns
+        so the reply is never held in memory, copy what is needed. If path
+        is "rpc-reply" the whole reply is passed to callback once received.
+
+        Returns a future like send_rpc_async whose result is the number of
+        elements passed to callback, an exception raised by callback is
+        raised by the future and the rest of the reply skipped.
+        """
+        return self._send_rpcs([ rpc ], False, timeout, (path, callback))[0]
+
+    def send_rpc_stream (self, rpc, path, callback, timeout=None):
+        "See send_rpc_stream_async, returns the number of elements passed to callback"
+        return self.wait_reply(self.send_rpc_stream_async(rpc, path, callback, timeout))
+
+    def _send_rpcs (self, rpcs, noreply, timeout, stream=None):
+        futures = []
+        msgs = []
+
+        # Get the next message ids, and mark us as expecting replies before
+        # sending as a reply may be received before send_messages returns.
         with self.cv:
             assert self.session_id is not None
-            msg_id = self.message_id
-            self.message_id += 1
-
-        if self.debug:
-            logger.debug("%s: Sending RPC message-id: %s", str(self), str(msg_id))
-        self.send_message(
-            """<rpc message-id="{}"
+            for rpc in rpcs:
+                msg_id = self.message_id
+                self.message_id += 1
+                msgs.append("""<rpc message-id="{}"
             xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">{}</rpc>""".format(msg_id, rpc))
+                if noreply:
+                    futures.append(None)
+                    continue
+                future = Future()
+                future.message_id = msg_id
+                # Cancelled when the future completes, so replied RPCs don't
+                # leave timers queued for the rest of the timeout.
+                if timeout is not None:
+                    future.timer = get_reply_timer().schedule(timeout, self._reply_timeout, msg_id, timeout)
+                else:
+                    future.timer = None
+                self.rpc_out[msg_id] = future
+                if stream is not None:
+                    self.rpc_streams[msg_id] = stream
+                futures.append(future)
+
+        for future in futures:
+            if future is not None:
+                future.add_done_callback(self._reply_done)
 
-        if noreply:
-            return None
+        if self.debug:
+            logger.debug("%s: Sending %d RPC messages from message-id: %s",
+                         str(self), len(msgs), str(self.message_id - len(msgs)))
+        try:
+            if len(msgs) == 1:
+                self.send_message(msgs[0])
+            else:
+                self.send_messages(msgs)
+        except Exception as error:
+            for future in futures:
+                if future is not None:
+                    self._complete(future.message_id, exception=error)
+            raise
+        return futures
+
+    def send_rpc (self, rpc, timeout=None):
+        return self.wait_reply(self.send_rpc_async(rpc, timeout=timeout))
+
+    def is_reply_ready (self, future):
+        """Check whether reply is ready (or session closed)"""
+        return future.done()
 
-        # Mark us as expecting a reply
+    def wait_reply (self, future, timeout=None):
+        """Return the reply of the future from send_rpc_async as (tree,
+        reply, msg), waiting at most timeout seconds"""
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise ReplyTimeoutError("Timeout waiting for reply to message-id {}".format(
+                future.message_id))
+
+    def _complete (self, msg_id, result=None, exception=None):
+        """Complete the future of msg_id if still outstanding, returns False
+        if it is not"""
         with self.cv:
-            self.rpc_out[msg_id] = None
-
-        return msg_id
-
-    def send_rpc (self, rpc):
-        msg_id = self.send_rpc_async(rpc)
-        return self.wait_reply(msg_id)
+            future = self.rpc_out.pop(msg_id, None)
+            self.rpc_streams.pop(msg_id, None)
+        if future is None:
+            return False
+        if future.timer is not None:
+            get_reply_timer().cancel(future.timer)
+        if not future.set_running_or_notify_cancel():
+            return False
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+        return True
+
+    def _reply_done (self, future):
+        if future.cancelled():
+            with self.cv:
+                self.rpc_out.pop(future.message_id, None)
+                self.rpc_streams.pop(future.message_id, None)
+            if future.timer is not None:
+                get_reply_timer().cancel(future.timer)
+
+    def _reply_timeout (self, msg_id, timeout):
+        if self._complete(msg_id, exception=ReplyTimeoutError(
+                "No reply to message-id {} within {} seconds".format(msg_id, timeout))):
+            if self.debug:
+                logger.debug("%s: Timeout waiting for reply to message-id %s", str(self), str(msg_id))
 
-    def is_reply_ready (self, msg_id):
-        """Check whether reply is ready (or session closed)"""
+    def _fail_pending (self, reason):
         with self.cv:
-            if not self.is_active():
-                raise SessionError("Session closed while checking for reply")
-            return self.rpc_out[msg_id] is not None
-
-    def wait_reply (self, msg_id):
-        assert msg_id in self.rpc_out
-
-        self.cv.acquire()
-        # XXX need to make sure the channel doesn't close
-        while self.rpc_out[msg_id] is None and self.is_active():
-            self.cv.wait()
-
-        if not self.is_active():
-            self.cv.release()
-            raise SessionError("Session closed while waiting for reply")
-
-        tree, reply, msg = self.rpc_out[msg_id]
-        del self.rpc_out[msg_id]
-        self.cv.release()
+            msg_ids = list(self.rpc_out)
+        for msg_id in msg_ids:
+            self._complete(msg_id, exception=SessionError(reason))
+
+    def subscribe (self,
+                   events=None,
+                   callback=None,
+                   queue_size=NOTIFICATION_QUEUE_SIZE,
+                   overflow=OVERFLOW_DROP_OLDEST,
+                   stream=None,
+                   timeout=None):
+        """Return a NotificationSubscription receiving the notifications of
+        this session (see NotificationSubscription for the arguments).
+
+        The first subscription sends a create-subscription for stream (the
+        default NETCONF stream if None) which all share, as a session can
+        only have one.
+        """
+        subscription = NotificationSubscription(self, events, callback, queue_size, overflow)
+        with self.subscriptions_lock:
+            self.subscriptions += (subscription, )
+            create = not self.subscription_created
+            self.subscription_created = True
+        if create:
+            rpc = "<stream>{}</stream>".format(stream) if stream else ""
+            try:
+                self.send_rpc('<create-subscription xmlns="{}">{}</create-subscription>'.format(
+                    NC_NOTIFICATION_NS, rpc), timeout)
+            except Exception:
+                with self.subscriptions_lock:
+                    self.subscription_created = False
+                subscription.close()
+                raise
+        return subscription
+
+    def _unsubscribe (self, subscription):
+        with self.subscriptions_lock:
+            self.subscriptions = tuple(x for x in self.subscriptions if x is not subscription)
+
+    def _close_subscriptions (self):
+        with self.subscriptions_lock:
+            subscriptions = self.subscriptions
+        for subscription in subscriptions:
+            subscription.close()
+
+    def _dispatch_notification (self, notif):
+        "Pass the notification element notif to the matching subscriptions"
+        # The event is the element following eventTime.
+        event = None
+        for child in notif:
+            if etree.QName(child).localname != "eventTime":
+                event = child
+                break
+        delivered = False
+        for subscription in self.subscriptions:
+            if event is not None and subscription.matches(event):
+                subscription.deliver(notif)
+                delivered = True
+        if not delivered and self.debug:
+            logger.debug("%s: Dropping notification %s without subscriber", str(self),
+                         event.tag if event is not None else None)
+
+    def _receive_message (self):
+        # Messages are read as they arrive so replies to send_rpc_stream can
+        # be parsed incrementally, other messages are joined and returned.
+        while True:
+            with self.lock:
+                if self.reader_thread and not self.reader_thread.keep_running:
+                    return None
+                pkt_stream = self.pkt_stream
+            with self.cv:
+                streaming = bool(self.rpc_streams)
+            if not streaming:
+                msg = pkt_stream.buffered_pdu(self.new_framing)
+                if msg is not None:
+                    self.last_activity = time.time()
+                    return msg
+
+            fragments = []
+            sniffer = None
+            stream = None
+            end = False
+            while not end:
+                data, end = pkt_stream.receive_fragment(self.new_framing)
+                if not fragments:
+                    if not streaming:
+                        # One may have been sent while we waited.
+                        with self.cv:
+                            streaming = bool(self.rpc_streams)
+                    # Look for a streamed reply only while one is expected.
+                    if streaming:
+                        sniffer = etree.XMLPullParser(events=("start", ))
+                if stream is not None:
+                    stream.feed(data)
+                    continue
+                fragments.append(data)
+                if sniffer is not None and data:
+                    msg_id, stream = self._sniff_reply_stream(sniffer, data)
+                    if msg_id is not None:
+                        sniffer = None
+                    if stream is not None:
+                        for fragment in fragments:
+                            stream.feed(fragment)
+                        fragments = None
+            self.last_activity = time.time()
+
+            if stream is None:
+                return b"".join(fragments).decode('utf-8')
+            self._finish_reply_stream(msg_id, stream)
+
+    def _sniff_reply_stream (self, sniffer, data):
+        """Feed sniffer the start of a message, returns (msg_id, stream)
+        once the root element is seen with stream the _ReplyStream for a
+        send_rpc_stream reply, (None, None) until then"""
+        try:
+            sniffer.feed(data)
+            for unused, root in sniffer.read_events():
+                break
+            else:
+                return None, None
+        except etree.XMLSyntaxError:
+            # Let reader_handle_message report it.
+            return -1, None
+        try:
+            msg_id = int(root.get("message-id"))
+        except (TypeError, ValueError):
+            return -1, None
+        if etree.QName(root).localname != "rpc-reply":
+            return msg_id, None
+        with self.cv:
+            future = self.rpc_out.get(msg_id)
+            stream = self.rpc_streams.get(msg_id)
+        if future is None or stream is None:
+            return msg_id, None
+        return msg_id, _ReplyStream(future, *stream)
 
-        error = reply.xpath("nc:rpc-error", namespaces=NSMAP)
+    def _finish_reply_stream (self, msg_id, stream):
+        if self.debug:
+            logger.debug("%s: Received streamed rpc-reply message-id: %s", str(self), str(msg_id))
+        try:
+            reply = stream.close()
+        except Exception as error:
+            if isinstance(error, etree.XMLSyntaxError):
+                error = SessionError("Invalid XML from server: {}".format(error))
+            self._complete(msg_id, exception=error)
+            return
+        if reply is None:
+            # The future has already completed.
+            return
+        error = get_xpath("nc:rpc-error")(reply)
         if error:
-            raise RPCError(msg, tree, error[0])
-
-        # data = reply.xpath("nc:data", namespaces=self.nsmap)
-        # ok = reply.xpath("nc:ok", namespaces=self.nsmap)
-        return tree, reply, msg
+            self._complete(msg_id, exception=RPCError(etree.tostring(reply).decode('utf-8'),
+                                                      reply.getroottree(),
+                                                      error[0]))
+        else:
+            self._complete(msg_id, result=stream.count)
 
     def reader_exits (self):
         if self.debug:
-            logger.debug("%s: Reader thread exited notifying all.", str(self))
-        with self.cv:
-            self.cv.notify_all()
+            logger.debug("%s: Reader thread exited failing outstanding RPCs.", str(self))
+        self._fail_pending("Session closed while waiting for reply")
+        self._close_subscriptions()
 
     def reader_handle_message (self, msg):
         """Handle a message, lock is already held"""
@@ -143,15 +613,13 @@ class NetconfClientSession (NetconfSession):
         except etree.XMLSyntaxError:
             raise SessionError(msg, "Invalid XML from server.")
 
-        replies = tree.xpath("/nc:rpc-reply", namespaces=NSMAP)
+        replies = get_xpath("/nc:rpc-reply")(tree)
         if not replies:
-            notification = tree.xpath("/*[name()='notification']")
+            notification = get_xpath("/*[name()='notification']")(tree)
             if not notification:
                 raise SessionError(msg, "No rpc-reply or notification found")
-            else:
-                logger.info("* NOTIF received *")
-                logger.info(etree.tostring(tree,pretty_print=True))
-                return
+            self._dispatch_notification(notification[0])
+            return
 
         for reply in replies:
             try:
@@ -164,37 +632,31 @@ class NetconfClientSession (NetconfSession):
                 #     raise RPCError(received, tree, error[0])
                 raise SessionError(msg, "No valid message-id attribute found")
 
-            # Queue the message
-            with self.cv:
-                try:
-                    if msg_id not in self.rpc_out:
-                        if self.debug:
-                            logger.debug("Ignoring unwanted reply for message-id %s",
-                                         str(msg_id))
-                        return
-                    elif self.rpc_out[msg_id] is not None:
-                        logger.warning("Received multiple replies for message-id %s:"
-                                       " before: %s now: %s",
-                                       str(msg_id),
-                                       str(self.rpc_out[msg_id]),
-                                       str(msg))
-
-                    if self.debug:
-                        logger.debug("%s: Received rpc-reply message-id: %s",
-                                     str(self),
-                                     str(msg_id))
-                    self.rpc_out[msg_id] = tree, reply, msg
-                except Exception as error:
-                    logger.debug("%s: Unexpected exception: %s",
-                                 str(self),
-                                 str(error))
-                    raise
-                finally:
-                    self.cv.notify_all()
+            if self.debug:
+                logger.debug("%s: Received rpc-reply message-id: %s", str(self), str(msg_id))
+
+            error = get_xpath("nc:rpc-error")(reply)
+            if error:
+                done = self._complete(msg_id, exception=RPCError(msg, tree, error[0]))
+            else:
+                done = self._complete(msg_id, result=(tree, reply, msg))
+            if not done and self.debug:
+                logger.debug("Ignoring unwanted (cancelled, timed out or repeated) reply for message-id %s",
+                             str(msg_id))
 
 
 class NetconfSSHSession (NetconfClientSession):
-    def __init__ (self, host, port=830, username=None, password=None, debug=False, cache=None, proxycmd=None):
+    def __init__ (self, host, port=830, username=None, password=None, debug=False, cache=None, proxycmd=None,
+                  jumphost=None):
+        """A netconf session to host over SSH.
+
+        Unless cache is given the session is a channel on a connection from
+        the shared get_default_cache(), use sshutil.conn.g_no_cache for a
+        connection of the session's own. With jumphost ([user@]host[:port])
+        the connection is tunneled through a cached connection to it.
+        """
+        if cache is None:
+            cache = get_default_cache()
         if username is None:
             import getpass
             username = getpass.getuser()
@@ -205,7 +667,8 @@ class NetconfSSHSession (NetconfClientSession):
                                                password,
                                                debug,
                                                cache=cache,
-                                               proxycmd=proxycmd)
+                                               proxycmd=proxycmd,
+                                               jumphost=jumphost)
         super(NetconfSSHSession, self).__init__(stream, debug)
 
 
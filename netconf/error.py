@@ -18,7 +18,7 @@
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
 from lxml import etree
-from netconf import NSMAP
+from netconf import get_xpath
 
 
 class NetconfException (Exception):
@@ -37,6 +37,10 @@ class SessionError (NetconfException):
     pass
 
 
+class ReplyTimeoutError (NetconfException):
+    pass
+
+
 class RPCError (NetconfException):
     def __init__ (self, output, tree, error):
         super(RPCError, self).__init__(output)
@@ -45,7 +49,7 @@ class RPCError (NetconfException):
 
     def _get_error_val (self, value):
         try:
-            return self.error.xpath("nc:" + value, namespaces=NSMAP)[0].text
+            return get_xpath("nc:" + value)(self.error)[0].text
         except IndexError:
             return None
 
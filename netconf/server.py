@@ -17,18 +17,27 @@
 # limitations under the License.
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import collections
 import io
 import logging
 import os
+import socket
 import sys
 import threading
+import time
+import traceback
 import paramiko as ssh
 from lxml import etree
 import sshutil.server
+from sshutil.auth import PasswordAuthenticator
+from sshutil.authkeys import AuthorizedKeys
+from sshutil.pool import WorkerPool
+from sshutil.reactor import ChannelReactor
 
 from netconf import base
 import netconf.error as ncerror
 from netconf import NSMAP
+from netconf import get_xpath
 from netconf import qmap
 from netconf import util
 
@@ -37,6 +46,14 @@ if sys.platform == 'win32' and sys.version_info < (3, 5):
 
 logger = logging.getLogger(__name__)
 
+NC_CLOSE_SESSION = qmap('nc') + "close-session"
+NC_KILL_SESSION = qmap('nc') + "kill-session"
+NC_GET = qmap('nc') + "get"
+NC_GET_CONFIG = qmap('nc') + "get-config"
+
+# The maximum number of RPC element tags to remember the method for.
+MAX_RPC_LOOKUP = 1024
+
 try:
     import pam
     have_pam = True
@@ -44,74 +61,69 @@ except ImportError:
     have_pam = False
 
 
+def nonreentrant (method):
+    """Mark an rpc_X server method as non-reentrant.
+
+    Such a method is not run concurrently with other RPCs from the same
+    session, the session waits for any RPCs in progress to complete and then
+    runs it before handling any further RPCs.
+    """
+    method.nc_reentrant = False
+    return method
+
+
+def rpc_namespace (namespace, name=None):
+    """Handle only RPCs in namespace with the decorated rpc_X server method.
+
+    name is the local name of the RPC, by default it is derived from the
+    method name. This allows methods for RPCs with the same local name from
+    different modules, e.g.,::
+
+        @rpc_namespace("urn:example:a", "reset")
+        def rpc_a_reset (self, session, rpc, *params):
+    """
+    def decorate (method):
+        method.nc_namespace = namespace
+        method.nc_name = name
+        return method
+    return decorate
+
+
+def _pam_authenticate (username, password):
+    # A pam object holds the result of its last call so use one per call.
+    return pam.pam().authenticate(username, password)
+
+
 class SSHAuthController (ssh.ServerInterface):
-    def __init__ (self, users=None):
+    def __init__ (self,
+                  users=None,
+                  auth_workers=4,
+                  auth_backlog=32,
+                  auth_timeout=5,
+                  auth_cache_ttl=30):
+        """Authenticate users with their authorized_keys or PAM.
+
+        PAM password checks are run by a pool of auth_workers threads with at
+        most auth_backlog waiting, a check not complete within auth_timeout
+        seconds fails. Successful password logins are remembered for
+        auth_cache_ttl seconds (0 to disable) so they needn't use PAM.
+        """
         self.event = threading.Event()
         self.users = users
-        self.users_keys = {}
+        self.authorized_keys = AuthorizedKeys()
         if have_pam:
-            self.pam = pam.pam()
+            self.pam = PasswordAuthenticator(_pam_authenticate,
+                                             auth_workers,
+                                             auth_backlog,
+                                             auth_timeout,
+                                             auth_cache_ttl)
         else:
             self.pam = None
 
     def get_user_auth_keys (self, username):
-        """Parse the users's authorized_keys file if any to look for authorized keys"""
-        if username in self.users_keys:
-            return self.users_keys[username]
-
-        self.users_keys[username] = []
-
-        userdir = os.path.expanduser("~" + username)
-        if not userdir:
-            return self.users_keys[username]
-
-        keyfile = os.path.join(userdir, ".ssh/authorized_keys")
-        if not keyfile or not os.path.exists(keyfile):
-            return self.users_keys[username]
-
-        with open(keyfile) as f:
-            for line in f.readlines():
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                values = [ x.strip() for x in line.split() ]
-
-                exp = None
-                try:
-                    int(values[0])      # bits value?
-                except ValueError:
-                    # Type 1 or type 2, type 1 is bits in second value
-                    options_ktype = values[0]
-                    try:
-                        int(values[1])  # bits value?
-                    except ValueError:
-                        # type 2 with options
-                        ktype = options_ktype
-                        data = values[1]
-                    else:
-                        # Type 1 no options.
-                        exp = int(values[1])
-                        data = values[2]
-                else:
-                    # Type 1 no options.
-                    exp = int(values[1])
-                    data = values[2]
-
-                # XXX For now skip type 1 keys
-                if exp is not None:
-                    continue
-
-                if data:
-                    import base64
-                    if ktype == "ssh-rsa":
-                        key = ssh.RSAKey(data=base64.decodebytes(data.encode('ascii')))
-                    elif ktype == "ssh-dss":
-                        key = ssh.DSSKey(data=base64.decodebytes(data.encode('ascii')))
-                    else:
-                        key = None
-                    if key:
-                        self.users_keys[username].append(key)
-        return self.users_keys[username]
+        """Return the users's authorized keys from their authorized_keys file,
+        a dictionary of key fingerprint to key blob"""
+        return self.authorized_keys.get_keys(username)
 
     def get_allowed_auths (self, username):
         # This is only called after the user fails some other authentication type.
@@ -129,15 +141,16 @@ class SSHAuthController (ssh.ServerInterface):
         logger.debug("Allowed methods for user %s: %s", str(username), str(allowed))
         return allowed
 
+    def get_auth_stats (self):
+        "Return password authentication counts and latency percentiles"
+        return self.pam.get_stats() if self.pam else {}
+
     def check_auth_none (self, unused_username):
         return ssh.AUTH_FAILED
 
     def check_auth_publickey (self, username, offered_key):
-        if not self.get_user_auth_keys(username):
-            return ssh.AUTH_FAILED
-        for ukey in self.users_keys[username]:
-            if ukey == offered_key:
-                return ssh.AUTH_SUCCESSFUL
+        if self.authorized_keys.is_authorized(username, offered_key):
+            return ssh.AUTH_SUCCESSFUL
         return ssh.AUTH_FAILED
 
     def check_auth_password (self, username, password):
@@ -198,14 +211,20 @@ class NetconfServerSession (base.NetconfSession):
             logger.debug("NetconfServerSession: Creating session-id %s", str(sid))
 
         self.methods = server.server_methods
+        # Pipelined RPC replies waiting to be sent in order, see _rpc_dispatch.
+        self.rpc_cv = threading.Condition()
+        self.rpc_pending = collections.deque()
+        self.rpc_sending = False
+        self.subscription_active = False
         super(NetconfServerSession, self).__init__(channel, debug, sid)
-        super(NetconfServerSession, self)._open_session(True)
+        # Register before the reader starts handling RPCs so a subscription
+        # made straight after the hello gets notifications sent after its reply.
+        server.register_session(self, channel)
+        super(NetconfServerSession, self)._open_session(True, server.hello_timeout)
 
         if self.debug:
             logger.debug("%s: Client session-id %s created", str(self), str(sid))
 
-        self.subscription_active=False
-
     def __del__ (self):
         self.close()
         super(NetconfServerSession, self).__del__()
@@ -219,6 +238,13 @@ class NetconfServerSession (base.NetconfSession):
         if self.debug:
             logger.debug("%s: Closing.", str(self))
 
+        self.server.registry.remove_session(self)
+
+        # The reactor must forget our channel before it is closed.
+        pkt_stream = getattr(self, "pkt_stream", None)
+        if self.server.reactor is not None and pkt_stream is not None and pkt_stream.stream is not None:
+            self.server.reactor.unregister(pkt_stream.stream)
+
         try:
             super(NetconfServerSession, self).close()
         except EOFError:
@@ -228,7 +254,20 @@ class NetconfServerSession (base.NetconfSession):
         if self.debug:
             logger.debug("%s: Closed.", str(self))
 
+    def send_hello (self, caplist, session_id=None):
+        if tuple(caplist) != base.HELLO_CAPABILITIES:
+            super(NetconfServerSession, self).send_hello(caplist, session_id)
+            return
+
+        # Our server serialized the hello when it was created.
+        if self.debug:
+            logger.debug("%s: Sending HELLO", str(self))
+        self.send_message(base.hello_message(self.server.hello_template, session_id))
+
     def send_rpc_reply (self, rpc_reply, origmsg):
+        self.send_message(self._rpc_reply_msg(rpc_reply, origmsg))
+
+    def _rpc_reply_msg (self, rpc_reply, origmsg):
         reply = etree.Element(qmap('nc') + "rpc-reply", attrib=origmsg.attrib, nsmap=origmsg.nsmap)
         try:
             rpc_reply.getchildren                           # pylint: disable=W0104
@@ -238,7 +277,7 @@ class NetconfServerSession (base.NetconfSession):
         ucode = etree.tounicode(reply, pretty_print=True)
         if self.debug:
             logger.debug("%s: Sending RPC-Reply: %s", str(self), str(ucode))
-        self.send_message(ucode)
+        return ucode
 
     def send_rpc_reply_error (self, error):
         self.send_message(error.get_reply_msg())
@@ -252,7 +291,84 @@ class NetconfServerSession (base.NetconfSession):
     def reader_exits (self):
         if self.debug:
             logger.debug("%s: Reader thread exited.", str(self))
-        return
+        self.server.registry.remove_session(self)
+
+    def _start_reader (self):
+        if self.server.reactor is None:
+            super(NetconfServerSession, self)._start_reader()
+            return
+
+        # The servers reactor reads our channel and feeds our decoder, complete
+        # messages are handled in order by the servers message pool.
+        self.message_queue = collections.deque()
+        self.message_scheduled = False
+        self.reader_exited = False
+        self._reactor_data(None)
+        self.server.reactor.register(self.pkt_stream.stream, self._reactor_data)
+
+    def _reactor_data (self, data):
+        # Called from the reactor thread with received data, b"" on EOF. If
+        # data is None we only look for messages already in the decoder.
+        decoder = self.pkt_stream.decoder if self.pkt_stream else None
+        if data:
+            self.last_activity = time.time()
+        messages = []
+        if decoder is None or (data is not None and not data):
+            messages.append(None)
+        else:
+            try:
+                if data:
+                    decoder.feed(data)
+                decoder.new_framing = self.new_framing
+                msg = decoder.next_message()
+                while msg is not None:
+                    messages.append(msg)
+                    msg = decoder.next_message()
+            except ncerror.FramingError as error:
+                logger.error("%s: Framing error [closing session]: %s", str(self), str(error))
+                messages.append(None)
+
+        with self.lock:
+            self.message_queue.extend(messages)
+            if self.message_scheduled or not self.message_queue:
+                return
+            self.message_scheduled = True
+        self.server.message_pool.submit(self._reactor_handle_messages)
+
+    def _reactor_handle_messages (self):
+        # Called from a message pool worker to handle our queued messages in order.
+        while True:
+            with self.lock:
+                if not self.message_queue or self.reader_exited:
+                    self.message_queue.clear()
+                    self.message_scheduled = False
+                    return
+                msg = self.message_queue.popleft()
+
+            if msg:
+                try:
+                    self.reader_handle_message(msg)
+                    continue
+                except ncerror.SessionError as error:
+                    logger.error("%s Session error [closing session]: %s", str(self), str(error))
+                except (ncerror.ChannelClosed, EOFError, socket.error) as error:
+                    # The client closed (e.g., after close-session) before we replied.
+                    if self.debug:
+                        logger.debug("%s: Session channel closed: %s", str(self), str(error))
+                except Exception as error:
+                    logger.error("%s: Unexpected exception handling message [closing session]: %s: %s",
+                                 str(self),
+                                 str(error),
+                                 traceback.format_exc())
+            elif self.debug:
+                logger.debug("%s: Client remote closed.", str(self))
+
+            with self.lock:
+                self.reader_exited = True
+            try:
+                self.close()
+            finally:
+                self.reader_exits()
 
     def reader_handle_message (self, msg):
         """Handle a message, lock is already held"""
@@ -269,7 +385,7 @@ class NetconfServerSession (base.NetconfSession):
             logger.warning("Closing session due to malformed message")
             raise ncerror.SessionError(msg, "Invalid XML from client.")
 
-        rpcs = tree.xpath("/nc:rpc", namespaces=NSMAP)
+        rpcs = get_xpath("/nc:rpc")(tree)
         if not rpcs:
             raise ncerror.SessionError(msg, "No rpc found")
 
@@ -291,33 +407,35 @@ class NetconfServerSession (base.NetconfSession):
                     raise ncerror.RPCSvrErrBadMsg(rpc)
                 rpc_method = rpc_method[0]
 
-                rpcname = rpc_method.tag.replace(qmap('nc'), "")
+                tag = rpc_method.tag
                 params = rpc_method.getchildren()
                 paramslen = len(params)
 
                 if self.debug:
                     logger.debug("%s: RPC: %s: paramslen: %s",
                                  str(self),
-                                 rpcname,
+                                 tag,
                                  str(paramslen))
 
-                if rpcname == "close-session":
+                if tag == NC_CLOSE_SESSION:
                     # XXX should be RPC-unlocking if need be
                     if self.debug:
                         logger.debug("%s: Received close-session msg-id: %s", str(self), msg_id)
+                    self._rpc_drain()
                     self.send_rpc_reply(etree.Element("ok"), rpc)
                     self.close()
                     # XXX should we also call the user method if it exists?
                     return
-                elif rpcname == "kill-session":
+                elif tag == NC_KILL_SESSION:
                     # XXX we are supposed to cleanly abort anything underway
                     if self.debug:
                         logger.debug("%s: Received kill-session msg-id: %s", str(self), msg_id)
+                    self._rpc_drain()
                     self.send_rpc_reply(etree.Element("ok"), rpc)
                     self.close()
                     # XXX should we also call the user method if it exists?
                     return
-                elif rpcname == "get":
+                elif tag == NC_GET:
                     # Validate GET parameters
 
                     if paramslen > 1:
@@ -327,7 +445,7 @@ class NetconfServerSession (base.NetconfSession):
                         raise ncerror.RPCSvrUnknownElement(rpc, params[0])
                     if not params:
                         params = [ None ]
-                elif rpcname == "get-config":
+                elif tag == NC_GET_CONFIG:
                     # Validate GET-CONFIG parameters
 
                     # XXX verify that the source parameter is present
@@ -345,52 +463,119 @@ class NetconfServerSession (base.NetconfSession):
                             raise ncerror.RPCSvrUnknownElement(rpc, unknown_elm)
                     params = [ source_param, filter_param ]
 
-                #------------------
-                # Call the method.
-                #------------------
-
-                try:
-                    # Handle any namespaces or prefixes in the tag, other than
-                    # "nc" which was removed above. Of course, this does not handle
-                    # namespace collisions, but that seems reasonable for now.
-                    rpcname = rpcname.rpartition("}")[-1]
-                    method_name = "rpc_" + rpcname.replace('-', '_')
-                    method = getattr(self.methods, method_name, self._rpc_not_implemented)
-                    if self.debug:
-                        logger.debug("%s: Calling method: %s", str(self), method_name)
-                    reply = method(self, rpc, *params)
-                    self.send_rpc_reply(reply, rpc)
-                except NotImplementedError:
-                    raise ncerror.RPCSvrErrNotImpl(rpc)
-            except ncerror.RPCSvrErrBadMsg as msgerr:
-                if self.new_framing:
-                    if self.debug:
-                        logger.debug("%s: RPCSvrErrBadMsg: %s", str(self), str(msgerr))
-                    self.send_message(msgerr.get_reply_msg())
-                else:
-                    # If we are 1.0 we have to simply close the connection
-                    # as we are not allowed to send this error
-                    logger.warning("Closing 1.0 session due to malformed message")
-                    raise ncerror.SessionError(msg, "Malformed message")
+                method = self.server.get_rpc_method(tag)
+                if method is None:
+                    method = self._rpc_not_implemented
             except ncerror.RPCServerError as error:
+                self._rpc_drain()
+                self._rpc_send_error(msg, error)
+                continue
+
+            #------------------
+            # Call the method.
+            #------------------
+
+            if self.server.rpc_pool is None or not getattr(method, "nc_reentrant", True):
+                # Run in order with all other RPCs on this session.
+                self._rpc_drain()
+                self.send_message(self._rpc_call(msg, method, rpc, params))
+            else:
+                self._rpc_dispatch(msg, method, rpc, params)
+
+    def _rpc_send_error (self, msg, error):
+        # Send the reply for an RPCServerError, this raises a SessionError if
+        # the session must be closed instead.
+        self.send_message(self._rpc_error_reply(msg, error))
+
+    def _rpc_error_reply (self, msg, error):
+        if isinstance(error, ncerror.RPCSvrErrBadMsg) and not self.new_framing:
+            # If we are 1.0 we have to simply close the connection
+            # as we are not allowed to send this error
+            logger.warning("Closing 1.0 session due to malformed message")
+            raise ncerror.SessionError(msg, "Malformed message")
+        if self.debug:
+            logger.debug("%s: RPCServerError: %s", str(self), str(error))
+        return error.get_reply_msg()
+
+    def _rpc_call (self, msg, method, rpc, params):
+        """Call the rpc method returning the reply message to send, raises
+        SessionError if the session should be closed instead."""
+        try:
+            if self.debug:
+                logger.debug("%s: Calling method: %s", str(self), str(method))
+            try:
+                reply = method(self, rpc, *params)
+            except NotImplementedError:
+                raise ncerror.RPCSvrErrNotImpl(rpc)
+            return self._rpc_reply_msg(reply, rpc)
+        except ncerror.RPCServerError as error:
+            return self._rpc_error_reply(msg, error)
+        except EOFError:
+            if self.debug:
+                logger.debug("%s: Got EOF in reader_handle_message", str(self))
+            error = ncerror.RPCSvrException(rpc, EOFError("EOF"))
+            return error.get_reply_msg()
+        except Exception as exception:
+            if self.debug:
+                logger.debug("%s: Got unexpected exception in reader_handle_message: %s",
+                             str(self),
+                             str(exception))
+            error = ncerror.RPCSvrException(rpc, exception)
+            return error.get_reply_msg()
+
+    #------------------------------------------------------------------
+    # Pipelined RPCs, run by the servers rpc_pool. Replies are queued in
+    # arrival order and sent as the RPC at the head of the queue completes.
+    #------------------------------------------------------------------
+
+    def _rpc_dispatch (self, msg, method, rpc, params):
+        # Entries are [done, reply message], wait for a slot in our window.
+        entry = [ False, None ]
+        with self.rpc_cv:
+            while len(self.rpc_pending) >= self.server.rpc_window:
+                self.rpc_cv.wait()
+            self.rpc_pending.append(entry)
+        self.server.rpc_pool.submit(self._rpc_run, entry, msg, method, rpc, params)
+
+    def _rpc_drain (self):
+        "Wait until all dispatched RPCs have been replied to"
+        with self.rpc_cv:
+            while self.rpc_pending or self.rpc_sending:
+                self.rpc_cv.wait()
+
+    def _rpc_run (self, entry, msg, method, rpc, params):
+        # Called from an rpc pool worker.
+        try:
+            reply = self._rpc_call(msg, method, rpc, params)
+        except ncerror.SessionError as error:
+            logger.error("%s Session error [closing session]: %s", str(self), str(error))
+            reply = None
+
+        with self.rpc_cv:
+            entry[0] = True
+            entry[1] = reply
+            # Only one thread sends replies at a time so they stay in order.
+            if self.rpc_sending:
+                return
+            self.rpc_sending = True
+
+        while True:
+            with self.rpc_cv:
+                if not self.rpc_pending or not self.rpc_pending[0][0]:
+                    self.rpc_sending = False
+                    self.rpc_cv.notify_all()
+                    return
+                reply = self.rpc_pending.popleft()[1]
+                self.rpc_cv.notify_all()
+
+            if reply is None:
+                self.close()
+                continue
+            try:
+                self.send_message(reply)
+            except Exception as error:
                 if self.debug:
-                    logger.debug("%s: RPCServerError: %s", str(self), str(error))
-                self.send_message(error.get_reply_msg())
-            except EOFError:
-                if self.debug:
-                    logger.debug("%s: Got EOF in reader_handle_message", str(self))
-                error = ncerror.RPCSvrException(rpc, EOFError("EOF"))
-                self.send_message(error.get_reply_msg())
-            except EOFError:
-                if self.debug:
-                    logger.debug("Got EOF in reader_handle_message")
-            except Exception as exception:
-                if self.debug:
-                    logger.debug("%s: Got unexpected exception in reader_handle_message: %s",
-                                 str(self),
-                                 str(exception))
-                error = ncerror.RPCSvrException(rpc, exception)
-                self.send_message(error.get_reply_msg())
+                    logger.debug("%s: Error sending pipelined reply: %s", str(self), str(error))
 
 
 class NetconfMethods (object):
@@ -452,19 +637,107 @@ class NetconfSSHServer (sshutil.server.SSHServer):
                   server_methods=None,
                   port=830,
                   host_key=None,
-                  debug=False):
+                  debug=False,
+                  hello_timeout=30,
+                  reactor=False,
+                  message_workers=4,
+                  rpc_workers=0,
+                  rpc_window=8,
+                  **kwargs):
         """
         server_methods is a an object that implements the Netconf RPC methods
         for the server. The method names are "rpc_X" where X is the netconf method
-        with dash (-) replaced by underscore (_) e.g., rpc_get_config.
+        with dash (-) replaced by underscore (_) e.g., rpc_get_config. The
+        methods are looked up once here, unless marked with @rpc_namespace
+        they handle RPCs with a matching name in any namespace.
+
+        hello_timeout bounds the wait for the client hello message, other
+        keyword arguments (e.g., handshake_workers) are passed to SSHServer.
+
+        If reactor is True a single thread reads all sessions channels rather
+        than a thread per session, received messages are then handled by a
+        pool of message_workers threads.
+
+        If rpc_workers is not 0 the rpc_X methods are run by a shared pool of
+        rpc_workers threads, allowing up to rpc_window RPCs from a session to
+        be in progress at once. Replies are still sent in the order the RPCs
+        were received. Methods marked with @nonreentrant are always run in
+        order with the sessions other RPCs.
         """
         self.server_methods = server_methods if server_methods is not None else NetconfMethods()
+        self.rpc_methods = {}
+        self.rpc_local_methods = {}
+        self.rpc_lookup = {}
+        self._add_rpc_methods(self.server_methods)
         self.session_id = 1
+        self.hello_timeout = hello_timeout
+        self.rpc_window = max(1, rpc_window)
+        if rpc_workers:
+            self.rpc_pool = WorkerPool("NetconfRPC", rpc_workers)
+        else:
+            self.rpc_pool = None
+        if reactor:
+            self.reactor, self.message_pool = self._create_reactor(message_workers, debug)
+        else:
+            self.reactor = None
+            self.message_pool = None
+
+        # Our capabilities are fixed so serialize the hello message once.
+        self.hello_template = base.hello_template(base.HELLO_CAPABILITIES, self.server_methods)
         super(NetconfSSHServer, self).__init__(server_ctl,
                                                server_session_class=NetconfServerSession,
                                                port=port,
                                                host_key=host_key,
-                                               debug=debug)
+                                               debug=debug,
+                                               **kwargs)
+
+    def _create_reactor (self, message_workers, debug):
+        "Return the reactor reading session channels and the pool handling their messages"
+        return ChannelReactor("NetconfReactor", debug), WorkerPool("NetconfMessage", message_workers)
+
+    def _add_rpc_methods (self, methods):
+        for attr in dir(methods):
+            if not attr.startswith("rpc_"):
+                continue
+            method = getattr(methods, attr)
+            if not callable(method):
+                continue
+            name = getattr(method, "nc_name", None) or attr[4:].replace('_', '-')
+            self.register_rpc_method(name, method, getattr(method, "nc_namespace", None))
+
+    def register_rpc_method (self, name, method, namespace=None):
+        """Register method to handle the RPC with local name name.
+
+        If namespace is given only RPCs in that namespace are handled,
+        otherwise RPCs with the local name in any namespace without a more
+        specific registration are handled.
+        """
+        if namespace is None:
+            self.rpc_local_methods[name] = method
+        else:
+            self.rpc_methods["{" + namespace + "}" + name] = method
+        self.rpc_lookup = {}
+
+    def get_rpc_method (self, tag):
+        "Return the method handling RPCs with element tag (e.g., {namespace}get) or None"
+        try:
+            return self.rpc_lookup[tag]
+        except KeyError:
+            pass
+
+        method = self.rpc_methods.get(tag)
+        if method is None:
+            name = tag.rpartition("}")[-1]
+            method = self.rpc_local_methods.get(name)
+            if method is None:
+                # Methods not visible to dir() (e.g., provided by __getattr__).
+                method = getattr(self.server_methods, "rpc_" + name.replace('-', '_'), None)
+                if method is None:
+                    return None
+        # Clients choose the tags so bound the number remembered.
+        if len(self.rpc_lookup) < MAX_RPC_LOOKUP:
+            self.rpc_lookup[tag] = method
+        return method
 
     def allocate_session_id (self):
         with self.lock:
@@ -475,10 +748,15 @@ class NetconfSSHServer (sshutil.server.SSHServer):
 
     def trigger_notification(self, notif):
         logger.info("Notifications triggered")
-        for sckt in self.sockets:
-            for session in sckt.sessions:
-                if session.is_active() and session.subscription_active:
+        for session in self.registry.get_sessions():
+            if session.is_active() and session.subscription_active:
+                try:
                     session.send_message(notif)
+                except (ncerror.ChannelClosed, EOFError, socket.error) as error:
+                    logger.info("%s: Error sending notification to %s: %s",
+                                str(self),
+                                str(session),
+                                str(error))
 
 
 
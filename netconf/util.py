@@ -18,7 +18,7 @@
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
 import copy
-from netconf import NSMAP
+from netconf import NSMAP, get_xpath
 from lxml import etree
 
 # Tries to somewhat implement RFC6241 filtering
@@ -241,7 +241,7 @@ def filter_leaf_allows (filter_elm, xpath, value):
         return True
 
     # No match or multiple matches not allowed for leaf.
-    flist = filter_elm.xpath(xpath, namespaces=NSMAP)
+    flist = get_xpath(xpath)(filter_elm)
     if not flist or len(flist) > 1:
         return False
     felm = flist[0]
@@ -272,7 +272,7 @@ def filter_list_iter (filter_list, key_xpath, keys):
         pass
 
     for filter_elm in filter_list:
-        filter_elms = [ x for x in filter_elm.xpath(key_xpath, namespaces=NSMAP) ]
+        filter_elms = [ x for x in get_xpath(key_xpath)(filter_elm) ]
         filter_keys = [ x.text for x in filter_elms ]
         if not filter_keys:
             for key in keys:
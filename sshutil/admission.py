@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import logging
+import threading
+import time
+from sshutil.stats import Counters
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket (object):
+    """Allow rate events per second on average with bursts of up to burst events"""
+    def __init__ (self, rate, burst=None):
+        self.lock = threading.Lock()
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(1, rate))
+        self.tokens = self.burst
+        self.last = time.time()
+
+    def take (self):
+        "Return True and consume a token if one is available"
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class AdmissionControl (object):
+    """Decide whether to admit new client connections.
+
+    Connections are refused when the server is in overload mode, when there
+    are max_sessions connections (or max_per_ip from the same address), or
+    when handshakes arrive faster than handshake_rate per second (with bursts
+    of handshake_burst). A value of 0 means no limit.
+    """
+    def __init__ (self, max_sessions=0, max_per_ip=0, handshake_rate=0, handshake_burst=None):
+        self.lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self.max_per_ip = max_per_ip
+        self.bucket = TokenBucket(handshake_rate, handshake_burst) if handshake_rate else None
+        self.sessions = 0
+        self.ip_sessions = {}
+        self.overload_reason = None
+        self.counters = Counters("admitted",
+                                 "rejected_overload",
+                                 "rejected_sessions",
+                                 "rejected_per_ip",
+                                 "rejected_rate")
+
+    def set_overload (self, reason):
+        """Enter overload mode, new connections are refused with reason until
+        clear_overload() is called."""
+        logger.warning("Entering overload mode: %s", reason)
+        with self.lock:
+            self.overload_reason = reason
+
+    def clear_overload (self):
+        logger.info("Leaving overload mode")
+        with self.lock:
+            self.overload_reason = None
+
+    def admit (self, ip, overload_reason=None):
+        """Admit a new connection from ip returning None, or return the reason it
+        is refused. overload_reason if not None is a transient overload
+        detected by the caller. Admitted connections must be release()d."""
+        with self.lock:
+            if overload_reason is None:
+                overload_reason = self.overload_reason
+            if overload_reason is not None:
+                reason, counter = "Server overloaded: " + overload_reason, "rejected_overload"
+            elif self.max_sessions and self.sessions >= self.max_sessions:
+                reason, counter = "Too many sessions", "rejected_sessions"
+            elif self.max_per_ip and self.ip_sessions.get(ip, 0) >= self.max_per_ip:
+                reason, counter = "Too many sessions from {}".format(ip), "rejected_per_ip"
+            elif self.bucket is not None and not self.bucket.take():
+                reason, counter = "Handshake rate exceeded", "rejected_rate"
+            else:
+                self.sessions += 1
+                self.ip_sessions[ip] = self.ip_sessions.get(ip, 0) + 1
+                reason, counter = None, "admitted"
+        self.counters.incr(counter)
+        return reason
+
+    def release (self, ip):
+        "Release a connection from ip that was admitted"
+        with self.lock:
+            self.sessions -= 1
+            count = self.ip_sessions.get(ip, 0) - 1
+            if count > 0:
+                self.ip_sessions[ip] = count
+            else:
+                self.ip_sessions.pop(ip, None)
+
+    def get_stats (self):
+        stats = self.counters.get_stats()
+        stats["rejected"] = sum(v for k, v in stats.items() if k.startswith("rejected_"))
+        with self.lock:
+            stats["sessions"] = self.sessions
+            stats["addresses"] = len(self.ip_sessions)
+            stats["overload"] = self.overload_reason
+        return stats
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
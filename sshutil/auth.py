@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from sshutil.pool import WorkerPool
+from sshutil.stats import Counters, Histogram
+
+logger = logging.getLogger(__name__)
+
+# PBKDF2 rounds used to hash cached passwords.
+CACHE_HASH_ROUNDS = 10000
+
+
+def _hash_password (password, salt):
+    return hashlib.pbkdf2_hmac("sha256", password.encode('utf-8'), salt, CACHE_HASH_ROUNDS)
+
+
+class PasswordAuthenticator (object):
+    """Check passwords with a possibly slow backend (e.g., PAM using LDAP).
+
+    check_func(username, password) is run by a pool of workers threads with
+    at most backlog checks waiting, a check not complete within timeout
+    seconds fails. Successful logins are remembered for cache_ttl seconds
+    (0 disables this) as a salted hash of the password so repeated logins
+    don't call check_func.
+    """
+    def __init__ (self, check_func, workers=4, backlog=32, timeout=5, cache_ttl=30, cache_size=1024):
+        self.check_func = check_func
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+        self.pool = WorkerPool("SSHAuth", workers, backlog)
+        self.latency = Histogram()
+        self.counters = Counters("success", "failure", "timeout", "rejected", "cache_hit")
+
+    def authenticate (self, username, password):
+        "Return True if password is correct for username"
+        start = time.time()
+        if self._cache_check(username, password, start):
+            self.counters.incr("cache_hit")
+            self.latency.add(time.time() - start)
+            return True
+
+        result = [ None ]
+        done = threading.Event()
+
+        def check ():
+            try:
+                result[0] = bool(self.check_func(username, password))
+            finally:
+                done.set()
+
+        if not self.pool.submit(check):
+            logger.warning("Too many authentications pending, failing login for %s", username)
+            self.counters.incr("rejected")
+            return False
+        if not done.wait(self.timeout):
+            logger.warning("Authentication of %s timed out", username)
+            self.counters.incr("timeout")
+            return False
+
+        self.latency.add(time.time() - start)
+        if result[0]:
+            self.counters.incr("success")
+            self._cache_add(username, password, time.time())
+            return True
+        self.counters.incr("failure")
+        return False
+
+    def _cache_check (self, username, password, now):
+        if not self.cache_ttl:
+            return False
+        with self.lock:
+            entry = self.cache.get(username)
+        if entry is None:
+            return False
+        salt, digest, expires = entry
+        if expires <= now:
+            with self.lock:
+                if self.cache.get(username) is entry:
+                    del self.cache[username]
+            return False
+        return hmac.compare_digest(digest, _hash_password(password, salt))
+
+    def _cache_add (self, username, password, now):
+        if not self.cache_ttl:
+            return
+        salt = os.urandom(16)
+        entry = (salt, _hash_password(password, salt), now + self.cache_ttl)
+        with self.lock:
+            self.cache.pop(username, None)
+            self.cache[username] = entry
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def flush (self, username=None):
+        "Forget the cached login of username or of all users if None"
+        with self.lock:
+            if username is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(username, None)
+
+    def get_stats (self):
+        stats = self.counters.get_stats()
+        stats["latency"] = self.latency.get_stats()
+        stats["pending"] = self.pool.pending()
+        with self.lock:
+            stats["cached"] = len(self.cache)
+        return stats
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
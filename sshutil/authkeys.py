@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Prefixes of the public key types that may appear in authorized_keys
+# (ssh-rsa, ssh-dss, ssh-ed25519, ecdsa-sha2-nistp*, sk-* security keys).
+KEY_TYPE_PREFIXES = ("ssh-", "ecdsa-sha2-", "sk-")
+
+
+def key_fingerprint (blob):
+    "Return the SHA256 fingerprint (digest bytes) of the public key blob"
+    return hashlib.sha256(blob).digest()
+
+
+def _blob_key_type (blob):
+    "Return the key type named at the start of a public key blob"
+    if len(blob) < 4:
+        return None
+    length, = struct.unpack(">I", blob[:4])
+    return blob[4:4 + length].decode('ascii', 'replace')
+
+
+def parse_authorized_keys (lines):
+    """Return a list of (key type, key blob) from the lines of an
+    authorized_keys file.
+
+    SSH1 keys, certificates, malformed lines and keys with options (which
+    are not enforced) are skipped.
+    """
+    keys = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        values = line.split()
+        ktype = values[0]
+        if not ktype.startswith(KEY_TYPE_PREFIXES) or "-cert-" in ktype:
+            logger.debug("Skipping unsupported authorized key: %s", line[:40])
+            continue
+        if len(values) < 2:
+            continue
+        try:
+            blob = base64.b64decode(values[1].encode('ascii'))
+        except (binascii.Error, ValueError, UnicodeError):
+            logger.debug("Skipping invalid authorized key: %s", line[:40])
+            continue
+        if _blob_key_type(blob) != ktype:
+            logger.debug("Skipping authorized key with wrong type: %s", line[:40])
+            continue
+        keys.append((ktype, blob))
+    return keys
+
+
+def user_authorized_keys_file (username):
+    "Return the path of the authorized_keys file of username"
+    return os.path.join(os.path.expanduser("~" + username), ".ssh/authorized_keys")
+
+
+class AuthorizedKeys (object):
+    """Index of each user's authorized keys by key fingerprint.
+
+    A user's index is rebuilt when their authorized_keys file changes (its
+    mtime, inode or size), checking a key is then a single lookup.
+    keyfile_func(username) returns the path of a users authorized_keys file.
+    """
+    def __init__ (self, keyfile_func=None):
+        self.keyfile_func = keyfile_func or user_authorized_keys_file
+        self.lock = threading.Lock()
+        self.users = {}
+
+    def get_keys (self, username):
+        "Return the user's authorized keys as a dictionary of fingerprint to key blob"
+        keyfile = self.keyfile_func(username)
+        try:
+            st = os.stat(keyfile)
+        except OSError:
+            with self.lock:
+                self.users.pop(username, None)
+            return {}
+        version = (st.st_mtime, st.st_ino, st.st_size)
+
+        with self.lock:
+            entry = self.users.get(username)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        try:
+            with open(keyfile) as f:
+                keys = parse_authorized_keys(f)
+        except (IOError, OSError) as error:
+            logger.warning("Error reading %s: %s", keyfile, str(error))
+            return {}
+        index = { key_fingerprint(blob): blob for unused, blob in keys }
+        logger.debug("Indexed %d authorized keys for %s", len(index), username)
+
+        with self.lock:
+            self.users[username] = (version, index)
+        return index
+
+    def is_authorized (self, username, key):
+        "Return True if key (a paramiko PKey) is an authorized key of username"
+        blob = key.asbytes()
+        return self.get_keys(username).get(key_fingerprint(blob)) == blob
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
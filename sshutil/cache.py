@@ -17,24 +17,88 @@
 # limitations under the License.
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import collections
+import getpass
+import heapq
+import itertools
 import logging
 import os
-import select
 import socket
 import threading
+import time
 import traceback
 import paramiko as ssh
+try:
+    import selectors
+except ImportError:
+    import selectors34 as selectors         # pylint: disable=E0401
+from sshutil.clientauth import AgentKeys, AuthMemo, auth_method_id, credential_id
+from sshutil.connect import Resolver, connect_addrinfo
+from sshutil.stats import Counters
+from sshutil.timer import TimerQueue
 
 logger = logging.getLogger(__name__)
 
 # Used by travis-ci testing
 private_key = None
 
+# Host addresses looked up for new connections.
+resolver = Resolver()
+
+# The SSH agent's keys and the authentication that last succeeded per
+# host:port@user.
+agent_keys = AgentKeys()
+auth_memo = AuthMemo()
+
+# Expires idle connections and checks connection health for every cache.
+_timer = TimerQueue("SSHCacheTimer")
+
+# Connections tunneled through one jump host connection.
+JUMP_MAX_CHANNELS = 64
+
+_jump_cache = None
+_jump_cache_lock = threading.Lock()
+
+
+def get_jump_cache ():
+    "Return the cache of connections to jump hosts"
+    global _jump_cache                                      # pylint: disable=W0603
+    with _jump_cache_lock:
+        if _jump_cache is None:
+            _jump_cache = SSHConnectionCache("SSH Jump Host Cache", max_channels=JUMP_MAX_CHANNELS)
+        return _jump_cache
+
+
+def parse_jump_host (jumphost):
+    """Return (username, host, port, jumphost) for the last hop of jumphost, a
+    comma separated list of [user@]host[:port] as for ssh_config ProxyJump.
+    The returned jumphost is the hops in front of it or None."""
+    hops = jumphost.split(",")
+    spec = hops.pop().strip()
+    username, unused, hostport = spec.rpartition("@")
+    if hostport.startswith("["):
+        host, unused, port = hostport[1:].partition("]")
+        port = port.lstrip(":")
+    elif hostport.count(":") == 1:
+        host, unused, port = hostport.partition(":")
+    else:
+        host, port = hostport, ""
+    return (username or None,
+            host,
+            int(port) if port else 22,
+            ",".join(hops) if hops else None)
+
 
 def socket_is_remote_closed (sock):
-    rfds, unused, unused = select.select([sock], [], [], 0)
+    # Not select(), the process may have more than FD_SETSIZE descriptors open.
+    selector = selectors.DefaultSelector()
     try:
-        if sock in rfds:
+        selector.register(sock, selectors.EVENT_READ)
+        readable = selector.select(0)
+    finally:
+        selector.close()
+    try:
+        if readable:
             buf = sock.recv(1, socket.MSG_PEEK)
             if len(buf) == 0:
                 logger.debug("****** read 0 on peek assuming closed")
@@ -45,6 +109,55 @@ def socket_is_remote_closed (sock):
         return True
 
 
+def _candidate_id (method, cred):
+    "Return the id auth_memo records for authenticating with method and cred"
+    return auth_method_id(method, cred if method == "publickey" else None)
+
+
+class JumpSocket (object):
+    """A direct-tcpip channel through a jump host connection used as the
+    socket of another SSH connection.
+
+    Closing it releases the jump host connection back to its cache.
+    """
+    def __init__ (self, cache, jumpsock, chan):
+        self.cache = cache
+        self.jumpsock = jumpsock
+        self.chan = chan
+        self.lock = threading.Lock()
+
+    def __getattr__ (self, name):
+        return getattr(self.chan, name)
+
+    def __str__ (self):
+        return "JumpSocket({})".format(str(self.chan))
+
+    def close (self):
+        # Both the transport using us and its cache entry close us.
+        self.chan.close()
+        with self.lock:
+            jumpsock, self.jumpsock = self.jumpsock, None
+        if jumpsock is not None:
+            self.cache.release_ssh_socket(jumpsock, False)
+
+    @classmethod
+    def open (cls, jumphost, host, port, timeout=None, debug=False):
+        "Return a JumpSocket connected to host:port through jumphost"
+        username, jhost, jport, jjumphost = parse_jump_host(jumphost)
+        if username is None:
+            username = getpass.getuser()
+        cache = get_jump_cache()
+        jumpsock = cache.get_ssh_socket(jhost, jport, username, None, debug, jumphost=jjumphost)
+        try:
+            if debug:
+                logger.debug("Opening direct-tcpip channel to %s:%s via %s", host, str(port), jumphost)
+            chan = jumpsock.open_channel("direct-tcpip", (host, port), ("", 0), timeout=timeout)
+        except:
+            cache.release_ssh_socket(jumpsock, debug)
+            raise
+        return cls(cache, jumpsock, chan)
+
+
 class _SSHConnectionCache (object):
     ssh_config = None
 
@@ -59,11 +172,27 @@ class _SSHConnectionCache (object):
                     cls.ssh_config.parse(f)
 
     @classmethod
-    def open_os_socket (cls, host, port, use_config=True, debug=False, proxycmd=None):
+    def open_os_socket (cls, host, port, use_config=True, debug=False, proxycmd=None, timeout=None,
+                        jumphost=None):
+        """Return a socket connected to host:port (or a ProxyCommand).
+
+        The host's addresses are tried in parallel (see
+        sshutil.connect.connect_addrinfo) for up to timeout seconds,
+        defaulting to sshutil.connect.CONNECT_TIMEOUT. With jumphost (or an
+        ssh_config ProxyJump) the socket is a JumpSocket channel through
+        a cached connection to the jump host.
+        """
+        if jumphost:
+            return JumpSocket.open(jumphost, host, port, timeout, debug)
+
         if use_config:
             cls.init_class_config()
             config = cls.ssh_config.lookup(host)
 
+            if not proxycmd and 'proxyjump' in config and config['proxyjump'].lower() != "none":
+                return JumpSocket.open(config['proxyjump'], config.get('hostname', host), port, timeout,
+                                       debug)
+
             # If we have a proxy command use that.
             if proxycmd or 'proxycommand' in config:
                 if proxycmd:
@@ -98,31 +227,20 @@ class _SSHConnectionCache (object):
         if debug:
             logger.debug("Opening os socket to %s on port %s", str(host), str(port))
 
-        attempt = 0
         try:
-            error = None
-            for addrinfo in socket.getaddrinfo(host,
-                                               port,
-                                               socket.AF_UNSPEC,
-                                               socket.SOCK_STREAM):
-                af, socktype, proto, unused_name, sa = addrinfo
-                try:
-                    ossock = socket.socket(af, socktype, proto)
-                    ossock.connect(sa)
-                    if attempt:
-                        logger.debug("Succeeded after %s attempts to : %s", str(attempt), str(addrinfo))
-                    return ossock
-                except socket.error as ex:
-                    logger.debug("Got socket error connecting to: %s: %s", str(addrinfo), str(ex))
-                    attempt += 1
-                    error = ex
-                    continue
-            if error is not None:
-                logger.debug("Got error connecting to: %s: %s (no addr)",
-                             str(addrinfo),                 # pylint: disable=W0631
-                             str(error))
-                raise error                                 # pylint: disable=E0702
-            raise Exception("Couldn't connect to any resolution for {}:{}".format(host, port))
+            addrinfos = resolver.getaddrinfo(host, port)
+            try:
+                ossock, addrinfo = connect_addrinfo(addrinfos, timeout)
+            except socket.error:
+                # The host may have moved, look it up again next time.
+                resolver.invalidate(host, port)
+                raise
+            if debug:
+                logger.debug("Connected to %s", str(addrinfo))
+            # SSH exchanges many small packets (e.g., channel opens on
+            # cached connections) which Nagle would delay.
+            ossock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return ossock
         except Exception as ex:
             logger.error("Got unexpected socket error connecting to: %s:%s: %s",
                          str(host),
@@ -131,8 +249,9 @@ class _SSHConnectionCache (object):
             raise
 
     @classmethod
-    def _open_ssh_socket (cls, host, port, username, password, use_config, debug, proxy):
-        ossock = cls.open_os_socket(host, port, use_config, debug, proxy)
+    def _open_ssh_socket (cls, host, port, username, password, use_config, debug, proxy, timeout=None,
+                          jumphost=None):
+        ossock = cls.open_os_socket(host, port, use_config, debug, proxy, timeout, jumphost)
         try:
             if debug:
                 logger.debug("Opening SSH socket to %s:%s", str(host), str(port))
@@ -161,42 +280,7 @@ class _SSHConnectionCache (object):
             # except (ssh.AuthenticationException, ssh.BadAuthenticationType):
             #     pass
 
-            logger.debug("Trying to authenticate with username: %s", str(username))
-            if not sshsock.is_authenticated() and password is not None:
-                try:
-                    sshsock.auth_password(username, password, event, False)
-                except (ssh.AuthenticationException, ssh.BadAuthenticationType) as error:
-                    logger.debug("Password auth failed (cont): %s: %s", str(username), str(error))
-                else:
-                    if not sshsock.is_authenticated():
-                        logger.warning("Password auth failed no error (cont) for %s",
-                                       str(username))
-
-            if not sshsock.is_authenticated() and passkey is not None:
-                try:
-                    sshsock.auth_publickey(username, passkey, event)
-                except ssh.AuthenticationException as error:
-                    logger.debug("Pubkey auth failed (cont): %s", str(error))
-                else:
-                    if not sshsock.is_authenticated():
-                        logger.warning("Pubkey auth failed no error (cont)")
-
-            if not sshsock.is_authenticated():
-                ssh_keys = ssh.Agent().get_keys()
-                if private_key:
-                    # Used by travis-ci
-                    ssh_keys += ( private_key, )
-                lastkey = len(ssh_keys) - 1
-                for idx, ssh_key in enumerate(ssh_keys):
-                    if sshsock.is_authenticated():
-                        break
-                    try:
-                        sshsock.auth_publickey(username, ssh_key, event)
-                    except ssh.AuthenticationException as error:
-                        if idx == lastkey:
-                            raise
-                        logger.debug("Pubkey auth failed (cont): %s", str(error))
-                        # Try next key
+            cls._authenticate(sshsock, host, port, username, password, passkey, event)
             assert sshsock.is_authenticated()
 
             # nextauth (rval from above) would be a secondary authentication e.g., google authenticator.
@@ -211,6 +295,87 @@ class _SSHConnectionCache (object):
             logger.error("Authentication failed: %s", str(error))
             raise
 
+    @classmethod
+    def _agent_candidates (cls):
+        "Yield the (method, credential) of the agent's keys"
+        ssh_keys = agent_keys.get_keys()
+        if private_key:
+            # Used by travis-ci
+            ssh_keys += ( private_key, )
+        for ssh_key in ssh_keys:
+            yield "publickey", ssh_key
+
+    @classmethod
+    def _auth_candidates (cls, password, passkey, remembered):
+        """Yield the (method, credential) to authenticate with in order, the
+        remembered method first. The agent is only asked for its keys when
+        they are reached."""
+        given = []
+        if password is not None:
+            given.append(("password", password))
+        if passkey is not None:
+            given.append(("publickey", passkey))
+        if remembered is None:
+            agent = None
+        else:
+            for idx, (method, cred) in enumerate(given):
+                if _candidate_id(method, cred) == remembered:
+                    yield given.pop(idx)
+                    agent = None
+                    break
+            else:
+                # It may be one of the agent's keys.
+                agent = list(cls._agent_candidates())
+                for idx, (method, cred) in enumerate(agent):
+                    if _candidate_id(method, cred) == remembered:
+                        yield agent.pop(idx)
+                        break
+        for candidate in given:
+            yield candidate
+        for candidate in agent if agent is not None else cls._agent_candidates():
+            yield candidate
+
+    @classmethod
+    def _authenticate (cls, sshsock, host, port, username, password, passkey, event):
+        """Authenticate with password, passkey or the agent keys, trying
+        whichever last succeeded for host:port@username first."""
+        candidates = cls._auth_candidates(password, passkey, auth_memo.get(host, port, username))
+
+        logger.debug("Trying to authenticate with username: %s", str(username))
+        allowed = None
+        error = None
+        for method, cred in candidates:
+            if allowed is not None and method not in allowed:
+                continue
+            try:
+                if method == "password":
+                    sshsock.auth_password(username, cred, event, False)
+                else:
+                    sshsock.auth_publickey(username, cred, event)
+            except ssh.BadAuthenticationType as ex:
+                logger.debug("%s auth not allowed (cont): %s: %s", method, str(username), str(ex))
+                allowed = ex.allowed_types
+                error = ex
+                continue
+            except ssh.AuthenticationException as ex:
+                logger.debug("%s auth failed (cont): %s: %s", method, str(username), str(ex))
+                error = ex
+                continue
+            except ssh.SSHException:
+                if isinstance(cred, ssh.AgentKey):
+                    # The agent may have gone away or lost the key.
+                    agent_keys.invalidate()
+                raise
+            if sshsock.is_authenticated():
+                auth_memo.set(host, port, username, _candidate_id(method, cred))
+                return
+            logger.warning("%s auth failed no error (cont) for %s", method, str(username))
+
+        auth_memo.forget(host, port, username)
+        if error is not None:
+            raise error                                     # pylint: disable=E0702
+        raise ssh.AuthenticationException("No authentication methods available")
+
     def release_ssh_socket (self, ssh_socket, debug):
         raise NotImplementedError("release_ssh_socket")
 
@@ -220,12 +385,15 @@ class _SSHConnectionCache (object):
 
 class SSHNoConnectionCache (_SSHConnectionCache):
     "Simple non-caching cache class"
+    def __init__ (self, connect_timeout=None):
+        self.connect_timeout = connect_timeout
+
     def release_ssh_socket (self, ssh_socket, debug=False):
         ossock = ssh_socket.os_socket
         ssh_socket.close()
         ossock.close()
 
-    def get_ssh_socket (self, host, port, username, password, debug=False, proxycmd=None):
+    def get_ssh_socket (self, host, port, username, password, debug=False, proxycmd=None, jumphost=None):
         # True below is to use users ssh config, should this be part of get_ssh_socket API?
         ossock, sshsock = _SSHConnectionCache._open_ssh_socket(host,
                                                                port,
@@ -233,192 +401,396 @@ class SSHNoConnectionCache (_SSHConnectionCache):
                                                                password,
                                                                True,
                                                                debug,
-                                                               proxycmd)
+                                                               proxycmd,
+                                                               self.connect_timeout,
+                                                               jumphost)
         sshsock.os_socket = ossock
         return sshsock
 
+    def close (self, debug=False):          # pylint: disable=W0613
+        return
+
     def flush (self, debug=False):          # pylint: disable=W0613
         return
 
 
-class SSHConnectionCache (_SSHConnectionCache):
-    def __init__ (self, desc="", close_timeout=1, max_channels=8):
-        self.close_timeout = close_timeout
-        self.max_channels = max_channels
-        self.desc = desc
-        self.ssh_sockets = {}
-        self.ssh_socket_keys = {}
-        self.ssh_socket_timeout = {}
-        self.ssh_sockets_lock = threading.Lock()
+class _CacheEntry (object):
+    """A cached SSH connection and the number of channels in use on it"""
+    __slots__ = ("key", "ossock", "sshsock", "count", "timer", "dead", "closed")
 
-    def flush (self, debug=False):
-        "Flush entries waiting for timeout."
-        # XXX change this when we create a class
-        with self.ssh_sockets_lock:
-            for key in self.ssh_sockets:
-                for entry in self.ssh_sockets[key]:
-                    ssh_socket = entry[1]
-                    try:
-                        timer = self.ssh_socket_timeout[ssh_socket]
-                    except KeyError:
-                        continue
-                    if timer is None:
-                        continue
-                    if debug:
-                        logger.debug("Flush: canceling and releasing ssh socket: %s",
-                                     str(ssh_socket))
-                    timer.cancel()
-                    del self.ssh_socket_timeout[ssh_socket]
-                    self._close_socket(ssh_socket, debug)
-
-    def get_ssh_socket (self, host, port, username, password, debug, proxycmd=None):
-        # Return an open ssh socket if we have one.
-        key = "{}:{}@{}:{}".format(host, port, username, proxycmd)
-        with self.ssh_sockets_lock:
-            if debug:
-                logger.debug("Searching for \"%s\" in open ssh socket cache", key)
-            if key in self.ssh_sockets:
-                for entry in self.ssh_sockets[key]:
-                    # Check if we have too many open channels on this socket or if the socket is
-                    if entry[2] >= self.max_channels:
-                        continue
+    def __init__ (self, key, ossock, sshsock):
+        self.key = key
+        self.ossock = ossock
+        self.sshsock = sshsock
+        self.count = 1
+        self.timer = None
+        self.dead = False
+        self.closed = False
 
-                    # Make sure the session is still active, the remote side may have closed.
-                    # XXX Hard to tell if the OS socket is closed on us. I'm not sure if
-                    # is_active() here covers this. If the remote side closes the socket
-                    # (e.g., the server exits) we don't want to use it anymore, but I'm not
-                    # sure how to handle this case.
-                    if not entry[1].is_active():
-                        logger.debug("entry is not active")
-                        continue
 
-                    if socket_is_remote_closed(entry[0]):
-                        logger.debug("entry's socket is remote closed")
-                        continue
+class _CacheKey (object):
+    """The connections to one host:port@user.
 
-                    sshsock = entry[1]
-                    entry[2] += 1
-                    if debug:
-                        logger.debug("Incremented SSH socket use to %s", str(entry[2]))
+    free is a heap of (channel count, sequence, entry) used to find the
+    least used connection with a free channel. Records are not updated in
+    place, a record whose count no longer matches its entry is stale and
+    discarded when found, or when free grows past compact_at.
 
-                    # Cancel any timeout for closing, only really need to do this on count == 1.
-                    self.cancel_close_socket_expire(sshsock, debug)
+    refs is the number of open connections and lookups in progress for the
+    key, it is dropped from the cache when this reaches 0 (protected by the
+    cache's lock).
+    """
+    __slots__ = ("key", "lock", "free", "compact_at", "refs")
 
-                    return sshsock
+    def __init__ (self, key):
+        self.key = key
+        self.lock = threading.Lock()
+        self.free = []
+        self.compact_at = 16
+        self.refs = 0
 
-                # This means there are no entries with free channels
-                if debug:
-                    logger.debug("Entries for %s are maxed or closed", key)
 
-            # True below is to use users ssh config, should this be part of get_ssh_socket
-            # API?
-            ossock, sshsock = _SSHConnectionCache._open_ssh_socket(host,
-                                                                   port,
-                                                                   username,
-                                                                   password,
-                                                                   True,
-                                                                   debug,
-                                                                   proxycmd)
-
-            if key not in self.ssh_sockets:
-                self.ssh_sockets[key] = []
-            # Add this socket to the list of sockets for this key
-            self.ssh_sockets[key].append([ossock, sshsock, 1])
-            self.ssh_socket_keys[sshsock] = key
-            return sshsock
+class SSHConnectionCache (_SSHConnectionCache):
+    """Cache SSH connections for reuse, up to max_channels at a time.
+
+    A connection no longer in use is closed after close_timeout seconds
+    unless it is reused before then. The expiry of all unused connections
+    (of all caches) is handled by a single timer thread, started when first
+    needed. close() closes the unused connections and stops the cache's
+    timers, connections still in use are then closed when released.
+
+    Connections are cached by host:port@user and the identity of the
+    password or key (see sshutil.clientauth.credential_id) so a session is
+    never given a connection authenticated with another credential.
+
+    Each host:port@user has its own lock so lookups (and the opening of new
+    connections) for different hosts don't wait on each other. If
+    max_sockets is not 0 at most that many connections are open, the least
+    recently used unused connection is closed to make room, if there are
+    none the lookup waits up to socket_wait seconds for one. Every
+    health_interval seconds connections are checked for having been closed
+    by the remote side, this is not done when looking them up. New
+    connections must connect within connect_timeout seconds (default
+    sshutil.connect.CONNECT_TIMEOUT).
+    """
+    def __init__ (self,
+                  desc="",
+                  close_timeout=1,
+                  max_channels=8,
+                  max_sockets=0,
+                  socket_wait=30,
+                  health_interval=10,
+                  connect_timeout=None):
+        self.close_timeout = close_timeout
+        self.connect_timeout = connect_timeout
+        self.max_channels = max_channels
+        self.max_sockets = max_sockets
+        self.socket_wait = socket_wait
+        self.health_interval = health_interval
+        self.desc = desc
+        self.sequence = itertools.count()
+        # The lock (and condition) protects the following.
+        self.cv = threading.Condition()
+        self.keys = {}
+        self.entries = {}
+        self.lru = collections.OrderedDict()
+        self.reserved = 0
+        self.health_timer = None
+        self.closed = False
+
+        self.timer = _timer
+        self.counters = Counters("hits", "misses", "expired", "evictions", "unhealthy")
 
-    def cancel_close_socket_expire (self, ssh_socket, debug):
-        """Must enter locked"""
-        if not ssh_socket:
-            return
-        if ssh_socket not in self.ssh_socket_timeout:
-            return
-        if debug:
-            logger.debug("Canceling timer to release ssh socket: %s", str(ssh_socket))
-        timer = self.ssh_socket_timeout[ssh_socket]
-        del self.ssh_socket_timeout[ssh_socket]
-        timer.cancel()
+    def __str__ (self):
+        "Return a nice string for the cache object"
+        return "SSHConnectionCache(\"{}\", close_timeout={}, max_channels={})".format(
+            self.desc,
+            self.close_timeout,
+            self.max_channels)
 
-    def _close_socket_expire (self, ssh_socket, debug):
-        if not ssh_socket:
-            return
+    def get_stats (self):
+        """Return cache hits, misses, connections closed when expired,
+        evicted or found closed, and the number of open and idle sockets"""
+        stats = self.counters.get_stats()
+        with self.cv:
+            stats["sockets"] = len(self.entries)
+            stats["idle"] = len(self.lru)
+            stats["keys"] = len(self.keys)
+        # Of the timer shared by all caches.
+        stats["timers"] = self.timer.pending()
+        return stats
+
+    def close (self, debug=False):
+        "Close the connections not in use and stop our timers"
+        with self.cv:
+            self.closed = True
+            if self.health_timer is not None:
+                self.timer.cancel(self.health_timer)
+                self.health_timer = None
+        self.flush(debug)
 
-        with self.ssh_sockets_lock:
-            # If we aren't present anymore must have been canceled
-            if ssh_socket not in self.ssh_socket_timeout:
-                return
+    def flush (self, debug=False):
+        "Close all connections not in use."
+        with self.cv:
+            entries = list(self.lru)
+            for entry in entries:
+                self._remove_idle(entry)
+        for entry in entries:
+            if debug:
+                logger.debug("Flush: releasing ssh socket: %s", str(entry.sshsock))
+            self._close_entry(entry, debug)
+
+    def get_ssh_socket (self, host, port, username, password, debug, proxycmd=None, jumphost=None):
+        # Return an open ssh socket if we have one, connections are only
+        # shared by users of the same credentials.
+        key = (host, port, username, credential_id(password), proxycmd, jumphost)
+        with self.cv:
+            ckey = self.keys.get(key)
+            if ckey is None:
+                ckey = self.keys[key] = _CacheKey(key)
+            ckey.refs += 1
+        try:
+            return self._get_ssh_socket(ckey, host, port, username, password, debug, proxycmd, jumphost)
+        finally:
+            with self.cv:
+                self._unref_key(ckey)
 
+    def _get_ssh_socket (self, ckey, host, port, username, password, debug, proxycmd, jumphost):
+        key = ckey.key
+        with ckey.lock:
+            if debug:
+                logger.debug("Searching for \"%s\" in open ssh socket cache", str(key))
+            entry = self._take_free(ckey)
+        if entry is not None:
             if debug:
-                logger.debug("Timer expired, releasing ssh socket: %s", str(ssh_socket))
+                logger.debug("Incremented SSH socket use to %s", str(entry.count))
+            self.counters.incr("hits")
+            return entry.sshsock
 
-            # Remove any timeout
-            del self.ssh_socket_timeout[ssh_socket]
-            self._close_socket(ssh_socket, debug)
+        # This means there are no entries with free channels, make room for
+        # a new one (this may wait for other keys to release theirs).
+        if debug:
+            logger.debug("Entries for %s are maxed or closed", str(key))
+        self._reserve_socket(debug)
+
+        # Only one new connection to a key is opened at a time, others
+        # waiting may then use it.
+        with ckey.lock:
+            entry = self._take_free(ckey)
+            if entry is not None:
+                with self.cv:
+                    self.reserved -= 1
+                    self.cv.notify()
+                self.counters.incr("hits")
+                return entry.sshsock
+            self.counters.incr("misses")
+
+            # True below is to use users ssh config, should this be part of get_ssh_socket
+            # API?
+            try:
+                ossock, sshsock = _SSHConnectionCache._open_ssh_socket(host,
+                                                                       port,
+                                                                       username,
+                                                                       password,
+                                                                       True,
+                                                                       debug,
+                                                                       proxycmd,
+                                                                       self.connect_timeout,
+                                                                       jumphost)
+            except Exception:
+                with self.cv:
+                    self.reserved -= 1
+                    self.cv.notify()
+                raise
+
+            entry = _CacheEntry(ckey, ossock, sshsock)
+            with self.cv:
+                self.reserved -= 1
+                self.entries[sshsock] = entry
+                ckey.refs += 1
+                self._schedule_health()
+            if entry.count < self.max_channels:
+                heapq.heappush(ckey.free, (entry.count, next(self.sequence), entry))
+            return sshsock
 
     def release_ssh_socket (self, ssh_socket, debug):
         if not ssh_socket:
             return
 
-        with self.ssh_sockets_lock:
-            key = self.ssh_socket_keys[ssh_socket]
+        with self.cv:
+            entry = self.entries.get(ssh_socket)
+        if entry is None:
+            raise KeyError("Can't find {} in cache entries".format(ssh_socket))
 
-            assert key in self.ssh_sockets
-            entry = None
-            for entry in self.ssh_sockets[key]:
-                if entry[1] == ssh_socket:
-                    break
-            else:
-                raise KeyError("Can't find {} in list of entries".format(key))
-
-            entry[2] -= 1
-            if entry[2]:
+        ckey = entry.key
+        with ckey.lock:
+            entry.count -= 1
+            if entry.count:
                 if debug:
-                    logger.debug("Decremented SSH socket use to %s", str(entry[2]))
+                    logger.debug("Decremented SSH socket use to %s", str(entry.count))
+                if not entry.dead:
+                    self._push_free(ckey, entry)
                 return
-
-            # We are all done with this socket
-            # Setup a timer to actually close the socket.
-            if ssh_socket not in self.ssh_socket_timeout:
+            if entry.dead or self.closed:
+                with self.cv:
+                    del self.entries[ssh_socket]
+                    self._unref_key(ckey)
+                    self.cv.notify()
+                close = True
+            else:
+                # We are all done with this socket
+                # Setup a timer to actually close the socket.
+                close = False
+                self._push_free(ckey, entry)
+                with self.cv:
+                    self.lru[entry] = None
+                    self.cv.notify()
                 if debug:
                     logger.debug("Setting up timer to release ssh socket: %s", str(ssh_socket))
-                self.ssh_socket_timeout[ssh_socket] = threading.Timer(1,
-                                                                      self._close_socket_expire,
-                                                                      [ssh_socket, debug])
-                self.ssh_socket_timeout[ssh_socket].start()
-
-    def _close_socket (self, ssh_socket, debug):
-        entry = None
+                entry.timer = self.timer.schedule(self.close_timeout,
+                                                  self._close_socket_expire,
+                                                  entry,
+                                                  debug)
+        if close:
+            self._close_entry(entry, debug)
+
+    def _push_free (self, ckey, entry):
+        """Must enter with ckey locked"""
+        heapq.heappush(ckey.free, (entry.count, next(self.sequence), entry))
+        # Drop stale records if they have built up, the threshold follows the
+        # live records so the cost of this is constant per push.
+        if len(ckey.free) > ckey.compact_at:
+            records = {}
+            for record in ckey.free:
+                count, unused, rentry = record
+                if not rentry.closed and rentry.count == count:
+                    records[id(rentry)] = record
+            ckey.free = list(records.values())
+            heapq.heapify(ckey.free)
+            ckey.compact_at = 2 * len(ckey.free) + 16
+
+    def _take_free (self, ckey):
+        """Return the least used entry with a free channel or None, must
+        enter with ckey locked"""
+        while ckey.free:
+            count, unused, entry = heapq.heappop(ckey.free)
+            if entry.closed or entry.dead or entry.count != count or count >= self.max_channels:
+                continue
+            # Make sure the session is still active, the remote side may have closed.
+            if not entry.sshsock.is_active():
+                logger.debug("entry is not active")
+                entry.dead = True
+                continue
+            if not entry.count:
+                # Claim it from the idle list unless it was just evicted.
+                with self.cv:
+                    if entry not in self.lru:
+                        continue
+                    del self.lru[entry]
+                self.timer.cancel(entry.timer)
+                entry.timer = None
+            entry.count += 1
+            if entry.count < self.max_channels:
+                heapq.heappush(ckey.free, (entry.count, next(self.sequence), entry))
+            return entry
+        return None
+
+    def _reserve_socket (self, debug):
+        """Reserve room for a new connection, closing the least recently used
+        idle connection or waiting for one if we are at max_sockets."""
+        victims = []
+        deadline = time.time() + self.socket_wait
+        with self.cv:
+            while self.max_sockets and len(self.entries) + self.reserved >= self.max_sockets:
+                if self.lru:
+                    victim = next(iter(self.lru))
+                    self._remove_idle(victim)
+                    victims.append(victim)
+                    self.counters.incr("evictions")
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise ssh.SSHException("All {} cached SSH connections are in use".format(
+                        self.max_sockets))
+                self.cv.wait(remaining)
+            self.reserved += 1
+        for victim in victims:
+            if debug:
+                logger.debug("Evicting least recently used ssh socket: %s", str(victim.sshsock))
+            self._close_entry(victim, debug)
+
+    def _remove_idle (self, entry):
+        """Remove an idle entry so it can be closed, must enter with cv locked"""
+        del self.lru[entry]
+        del self.entries[entry.sshsock]
+        self._unref_key(entry.key)
+        entry.closed = True
+        self.timer.cancel(entry.timer)
+        entry.timer = None
+        self.cv.notify()
+
+    def _unref_key (self, ckey):
+        """Drop a reference to ckey, removing it once it has no connections
+        or lookups, must enter with cv locked"""
+        ckey.refs -= 1
+        if not ckey.refs:
+            del self.keys[ckey.key]
+
+    def _close_socket_expire (self, entry, debug):
+        with self.cv:
+            # If we aren't idle anymore we were reused or closed.
+            if entry not in self.lru:
+                return
+            self._remove_idle(entry)
+        if debug:
+            logger.debug("Timer expired, releasing ssh socket: %s", str(entry.sshsock))
+        self.counters.incr("expired")
+        self._close_entry(entry, debug)
+
+    def _schedule_health (self):
+        """Schedule the next health check while we have connections, must
+        enter with cv locked"""
+        if self.health_interval and self.health_timer is None and self.entries and not self.closed:
+            self.health_timer = self.timer.schedule(self.health_interval, self._check_health)
+
+    def _check_health (self):
+        "Called from our timer to find connections closed by the remote side"
         try:
-            key = self.ssh_socket_keys[ssh_socket]
-            for entry in self.ssh_sockets[key]:
-                if entry[1] == ssh_socket:
-                    break
-            else:
-                assert False
+            self._close_unhealthy()
+        finally:
+            with self.cv:
+                self.health_timer = None
+                self._schedule_health()
+
+    def _close_unhealthy (self):
+        with self.cv:
+            entries = list(self.entries.values())
+        for entry in entries:
+            if entry.closed or entry.dead:
+                continue
+            if entry.sshsock.is_active() and not (isinstance(entry.ossock, socket.socket) and
+                                                  socket_is_remote_closed(entry.ossock)):
+                continue
+            logger.debug("%s: Connection %s closed by remote", str(self), str(entry.sshsock))
+            self.counters.incr("unhealthy")
+            entry.dead = True
+            with self.cv:
+                if entry not in self.lru:
+                    # In use, it's closed when released.
+                    continue
+                self._remove_idle(entry)
+            self._close_entry(entry, False)
 
+    def _close_entry (self, entry, debug):
+        entry.closed = True
+        try:
             if debug:
-                logger.debug("Closing SSH socket to %s", str(key))
-            if entry[1]:
-                entry[1].close()
-                entry[1] = None
-
-            if entry[0]:
-                entry[0].close()
-                entry[0] = None
+                logger.debug("Closing SSH socket to %s", str(entry.key))
+            entry.sshsock.close()
+            entry.ossock.close()
         except Exception as error:
             logger.info("%s: Unexpected exception: %s: %s", str(self), str(error), traceback.format_exc())
             logger.error("%s: Unexpected error closing socket:  %s", str(self), str(error))
-        finally:
-            del self.ssh_socket_keys[ssh_socket]
-            if entry:
-                self.ssh_sockets[key].remove(entry)
-
-    def __str__ (self):
-        "Return a nice string for the cache object"
-        return "SSHConnectionCache(\"{}\", close_timeout={}, max_channels={})".format(
-            self.desc,
-            self.close_timeout,
-            self.max_channels)
 
 
 def setup_travis ():
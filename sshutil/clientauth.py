@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Client authentication state kept between connections.
+
+Every failed authentication attempt costs a round trip to the server (and
+for agent keys the agent is asked for its keys), so the method and key that
+last worked for a host and user are remembered and tried first.
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import collections
+import hashlib
+import logging
+import os
+import threading
+import time
+import paramiko as ssh
+from sshutil.authkeys import key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Salts the password hashes of credential_id, they are only compared within
+# this process.
+_CREDENTIAL_SALT = os.urandom(16)
+
+
+def auth_method_id (method, key=None):
+    "Return the id recorded for a successful authentication with method and key"
+    if key is None:
+        return (method, None)
+    return (method, key_fingerprint(key.asbytes()))
+
+
+def credential_id (password):
+    """Return an id of the password or key (a paramiko PKey) a connection
+    is authenticated with, or None for none (the agent's keys). Connections
+    are only shared between users of the same credential. Passwords are
+    hashed so they aren't kept in (or logged with) cache keys."""
+    if password is None:
+        return None
+    try:
+        password.get_name
+    except AttributeError:
+        if not isinstance(password, bytes):
+            password = password.encode('utf-8')
+        return ("password", hashlib.sha256(_CREDENTIAL_SALT + password).digest())
+    return ("publickey", key_fingerprint(password.asbytes()))
+
+
+class AgentKeys (object):
+    """The keys of the SSH agent, cached for ttl seconds.
+
+    The keys are fetched again if SSH_AUTH_SOCK changes or after
+    invalidate() (e.g., when the agent fails to sign).
+    """
+    def __init__ (self, ttl=60):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.keys = None
+        self.expires = 0
+        self.auth_sock = None
+        self.fetches = 0
+
+    def get_keys (self):
+        "Return a tuple of the agent's keys"
+        auth_sock = os.environ.get("SSH_AUTH_SOCK")
+        now = time.time()
+        with self.lock:
+            if self.keys is not None and self.expires > now and self.auth_sock == auth_sock:
+                return self.keys
+            # The keys use the agent connection to sign so it's left open
+            # for connections still using them.
+            self.keys = tuple(ssh.Agent().get_keys())
+            self.expires = now + self.ttl
+            self.auth_sock = auth_sock
+            self.fetches += 1
+            logger.debug("Fetched %d keys from SSH agent", len(self.keys))
+            return self.keys
+
+    def invalidate (self):
+        with self.lock:
+            self.keys = None
+
+
+class AuthMemo (object):
+    """Remember the authentication method (and key) that last succeeded for
+    each host:port@user, for at most max_entries of them."""
+    def __init__ (self, max_entries=1024):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.methods = collections.OrderedDict()
+
+    def get (self, host, port, username):
+        "Return the id (see auth_method_id) of the method that last succeeded or None"
+        with self.lock:
+            return self.methods.get((host, port, username))
+
+    def set (self, host, port, username, method_id):
+        key = (host, port, username)
+        with self.lock:
+            self.methods.pop(key, None)
+            self.methods[key] = method_id
+            while len(self.methods) > self.max_entries:
+                self.methods.popitem(last=False)
+
+    def forget (self, host, port, username):
+        with self.lock:
+            self.methods.pop((host, port, username), None)
+
+    def flush (self):
+        with self.lock:
+            self.methods.clear()
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -43,7 +43,10 @@ def shell_escape_single_quote (command):
 
 class SSHConnection (object):
     """A connection to an SSH server"""
-    def __init__ (self, host, port=22, username=None, password=None, debug=False, cache=None, proxycmd=None):
+    def __init__ (self, host, port=22, username=None, password=None, debug=False, cache=None, proxycmd=None,
+                  jumphost=None):
+        """Open a channel to host:port, connecting through jumphost ([user@]host[:port]
+        as for ssh_config ProxyJump) if given."""
         if cache is None:
             cache = g_no_cache
 
@@ -60,7 +63,7 @@ class SSHConnection (object):
 
         self.username = username
 
-        self.ssh = cache.get_ssh_socket(host, port, username, password, debug, proxycmd)
+        self.ssh = cache.get_ssh_socket(host, port, username, password, debug, proxycmd, jumphost)
 
         # Open a session.
         try:
@@ -118,8 +121,9 @@ class SSHSession (SSHConnection):
 
 class SSHClientSession (SSHSession):
     """A client session to a host using a subsystem"""
-    def __init__ (self, host, port, subsystem, username=None, password=None, debug=False, cache=None, proxycmd=None):
-        super(SSHClientSession, self).__init__(host, port, username, password, debug, cache, proxycmd)
+    def __init__ (self, host, port, subsystem, username=None, password=None, debug=False, cache=None, proxycmd=None,
+                  jumphost=None):
+        super(SSHClientSession, self).__init__(host, port, username, password, debug, cache, proxycmd, jumphost)
         try:
             self.chan.invoke_subsystem(subsystem)
         except:
@@ -129,10 +133,12 @@ class SSHClientSession (SSHSession):
 
 class SSHCommandSession (SSHSession):
     """A client session to a host using a command i.e., like a remote pipe"""
-    def __init__ (self, host, port, command, username=None, password=None, debug=False, cache=None, proxycmd=None):
+    def __init__ (self, host, port, command, username=None, password=None, debug=False, cache=None, proxycmd=None,
+                  jumphost=None):
         if cache is None:
             cache = g_cmd_cache
-        super(SSHCommandSession, self).__init__(host, port, username, password, debug, cache, proxycmd)
+        super(SSHCommandSession, self).__init__(host, port, username, password, debug, cache, proxycmd,
+                                                jumphost)
         try:
             self.chan.exec_command(command)
         except:
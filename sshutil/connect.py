@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Resolve and connect TCP sockets.
+
+Addresses are raced as in RFC 8305 ("Happy Eyeballs"): attempts alternate
+between address families and a new attempt is started every delay seconds
+(or as soon as one fails) while the earlier ones continue, the first to
+connect is used. An unreachable address then costs delay rather than the
+system's TCP connect timeout.
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import collections
+import errno
+import logging
+import os
+import socket
+import threading
+import time
+try:
+    import selectors
+except ImportError:
+    import selectors34 as selectors         # pylint: disable=E0401
+
+logger = logging.getLogger(__name__)
+
+# Seconds to allow for connecting to any of a host's addresses.
+CONNECT_TIMEOUT = 30
+
+# Seconds to wait on a connection attempt before also trying the next address.
+CONNECT_DELAY = .25
+
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN)
+
+
+class Resolver (object):
+    """Cache getaddrinfo results for TCP connections for ttl seconds.
+
+    The system resolver does not tell us the DNS TTL so a fixed one is
+    used, at most max_entries host:port results are kept. Failed lookups
+    are not cached.
+    """
+    def __init__ (self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+
+    def getaddrinfo (self, host, port):
+        "Return the getaddrinfo list for a TCP connection to host:port"
+        key = (host, port)
+        now = time.time()
+        if self.ttl:
+            with self.lock:
+                entry = self.cache.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        addrinfos = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+        if self.ttl:
+            with self.lock:
+                self.cache.pop(key, None)
+                self.cache[key] = (now + self.ttl, addrinfos)
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+        return addrinfos
+
+    def invalidate (self, host, port):
+        "Forget the cached addresses of host:port (e.g., none could be connected to)"
+        with self.lock:
+            self.cache.pop((host, port), None)
+
+    def flush (self):
+        with self.lock:
+            self.cache.clear()
+
+
+def interleave_addrinfo (addrinfos):
+    """Return addrinfos reordered to alternate between address families,
+    keeping the resolver's order within each family and starting with the
+    family of its first address"""
+    families = collections.OrderedDict()
+    for addrinfo in addrinfos:
+        families.setdefault(addrinfo[0], collections.deque()).append(addrinfo)
+    ordered = []
+    while families:
+        for family in list(families):
+            ordered.append(families[family].popleft())
+            if not families[family]:
+                del families[family]
+    return ordered
+
+
+def connect_addrinfo (addrinfos, timeout=None, delay=None):
+    """Connect to the first reachable of addrinfos (as from getaddrinfo).
+
+    Attempts are started delay seconds apart, or as soon as the previous one
+    fails, and run in parallel. Returns the connected (blocking) socket and
+    its addrinfo. If none connect within timeout seconds socket.timeout is
+    raised, if all fail the last error is raised.
+    """
+    if timeout is None:
+        timeout = CONNECT_TIMEOUT
+    if delay is None:
+        delay = CONNECT_DELAY
+    deadline = time.time() + timeout
+    pending = collections.deque(interleave_addrinfo(addrinfos))
+    attempts = {}
+    error = None
+    next_start = 0
+    # Not select(), the process may have more than FD_SETSIZE descriptors open.
+    selector = selectors.DefaultSelector()
+    try:
+        while pending or attempts:
+            now = time.time()
+            if now >= deadline:
+                raise socket.timeout("timed out connecting to {}".format(
+                    ", ".join(str(x[4][0]) for x in attempts.values())))
+
+            # Start the next attempt.
+            if pending and now >= next_start:
+                addrinfo = pending.popleft()
+                af, socktype, proto, unused_name, sa = addrinfo
+                try:
+                    sock = socket.socket(af, socktype, proto)
+                except socket.error as ex:
+                    logger.debug("Got socket error creating socket for: %s: %s", str(addrinfo), str(ex))
+                    error = ex
+                    continue
+                sock.setblocking(False)
+                err = sock.connect_ex(sa)
+                if err == 0:
+                    sock.setblocking(True)
+                    return sock, addrinfo
+                if err not in _IN_PROGRESS:
+                    logger.debug("Got socket error connecting to: %s: %s", str(addrinfo), os.strerror(err))
+                    error = socket.error(err, os.strerror(err))
+                    sock.close()
+                    continue
+                attempts[sock] = addrinfo
+                selector.register(sock, selectors.EVENT_WRITE)
+                next_start = now + delay
+
+            wait = deadline - now
+            if pending:
+                wait = min(wait, max(0, next_start - now))
+            for key, unused in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                addrinfo = attempts.pop(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    sock.setblocking(True)
+                    return sock, addrinfo
+                logger.debug("Got socket error connecting to: %s: %s", str(addrinfo), os.strerror(err))
+                error = socket.error(err, os.strerror(err))
+                sock.close()
+                # Don't wait out the delay to try the next address.
+                next_start = 0
+    finally:
+        selector.close()
+        for sock in attempts:
+            sock.close()
+
+    if error is not None:
+        raise error                                         # pylint: disable=E0702
+    raise socket.error("No addresses to connect to")
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import logging
+import threading
+import traceback
+try:
+    import queue
+except ImportError:
+    import Queue as queue                   # pylint: disable=E0401
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool (object):
+    """A fixed number of worker threads servicing a bounded queue of work"""
+    def __init__ (self, name, workers=4, maxqueue=0):
+        """Create a pool of workers threads, if maxqueue is not 0 then at most
+        maxqueue items of work can be waiting for a worker."""
+        self.name = name
+        self.queue = queue.Queue(maxqueue)
+        self.threads = []
+        for idx in range(0, workers):
+            thread = threading.Thread(None,
+                                      self._worker_thread,
+                                      name="{} {}".format(name, idx))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def __str__ (self):
+        return "WorkerPool(\"{}\", workers={})".format(self.name, len(self.threads))
+
+    def submit (self, func, *args):
+        """Queue func(*args) to be run by a worker thread.
+
+        Returns False if the queue is full and the work was not queued.
+        """
+        try:
+            self.queue.put_nowait((func, args))
+        except queue.Full:
+            return False
+        return True
+
+    def pending (self):
+        "Return the (approximate) number of queued items waiting for a worker"
+        return self.queue.qsize()
+
+    def close (self):
+        "Stop the worker threads once the queued work has been run"
+        for unused in self.threads:
+            self.queue.put((None, None))
+        self.threads = []
+
+    def _worker_thread (self):
+        while True:
+            func, args = self.queue.get()
+            if func is None:
+                return
+            try:
+                func(*args)
+            except Exception as error:
+                logger.error("%s: Unexpected exception in worker: %s: %s",
+                             str(self),
+                             str(error),
+                             traceback.format_exc())
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
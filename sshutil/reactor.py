@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import logging
+import socket
+import threading
+import traceback
+try:
+    import selectors
+except ImportError:
+    import selectors34 as selectors         # pylint: disable=E0401
+
+logger = logging.getLogger(__name__)
+
+MAXSSHBUF = 16 * 1024
+
+
+class ChannelReactor (object):
+    """Read from many paramiko channels using a single thread.
+
+    Channels provide a file descriptor (see Channel.fileno()) that is readable
+    while the channel has buffered data or is closed, this is used to wait on
+    all registered channels with one selector.
+
+    Closing a channel closes its file descriptor without notifying us, so
+    a channel must be unregistered before the owner closes it.
+    """
+    def __init__ (self, name="SSHReactor", debug=False):
+        self.name = name
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.channel_fds = {}
+        self.changes = []
+        self.running = True
+
+        # Used to wake the reactor thread when the registered channels change.
+        self.wake_rsocket, self.wake_wsocket = socket.socketpair()
+        self.wake_rsocket.setblocking(False)
+        self.selector.register(self.wake_rsocket, selectors.EVENT_READ, None)
+
+        self.thread = threading.Thread(None, self._reactor_thread, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__ (self):
+        return "ChannelReactor(\"{}\")".format(self.name)
+
+    def count (self):
+        "Return the number of registered channels"
+        with self.lock:
+            return len(self.channel_fds)
+
+    def register (self, channel, callback):
+        """Call callback(data) from the reactor thread with data read from channel.
+
+        On EOF or close callback is passed an empty bytes object and the channel
+        is unregistered.
+        """
+        fd = channel.fileno()
+        with self.lock:
+            self.channel_fds[channel] = fd
+            self._change(fd, (channel, callback))
+
+    def unregister (self, channel):
+        with self.lock:
+            fd = self.channel_fds.pop(channel, None)
+            if fd is not None:
+                self._change(fd, None)
+
+    def close (self):
+        with self.lock:
+            self.running = False
+        self.wake_wsocket.send(b"!")
+        self.thread.join()
+
+    def _change (self, fd, data):
+        """Must enter locked"""
+        # The selector is only modified by the reactor thread, data of None
+        # means unregister. Changes are applied in order so an unregister
+        # is always applied before a new registration of a re-used fd.
+        self.changes.append((fd, data))
+        if len(self.changes) == 1:
+            self.wake_wsocket.send(b"!")
+
+    def _apply_changes (self):
+        try:
+            while self.wake_rsocket.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+        with self.lock:
+            changes = self.changes
+            self.changes = []
+
+        for fd, data in changes:
+            try:
+                if data is not None:
+                    self.selector.register(fd, selectors.EVENT_READ, data)
+                else:
+                    self.selector.unregister(fd)
+            except (KeyError, ValueError, IOError, OSError) as error:
+                if self.debug:
+                    logger.debug("%s: Ignoring change for fd %s: %s",
+                                 str(self),
+                                 str(fd),
+                                 str(error))
+
+    def _remove (self, channel, fd):
+        with self.lock:
+            if self.channel_fds.get(channel) == fd:
+                del self.channel_fds[channel]
+        try:
+            self.selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+    def _read_channel (self, channel, callback, fd):
+        if channel.recv_ready():
+            data = channel.recv(MAXSSHBUF)
+        elif channel.closed or channel.eof_received:
+            data = b""
+        else:
+            return
+
+        if not data:
+            self._remove(channel, fd)
+        callback(data)
+
+    def _reactor_thread (self):
+        if self.debug:
+            logger.debug("%s: Starting reactor thread.", str(self))
+
+        while True:
+            with self.lock:
+                if not self.running:
+                    break
+
+            for key, unused in self.selector.select():
+                if key.data is None:
+                    self._apply_changes()
+                    continue
+
+                channel, callback = key.data
+                try:
+                    self._read_channel(channel, callback, key.fd)
+                except Exception as error:
+                    logger.error("%s: Unexpected exception reading %s: %s: %s",
+                                 str(self),
+                                 str(channel),
+                                 str(error),
+                                 traceback.format_exc())
+                    self._remove(channel, key.fd)
+
+        self.selector.close()
+        self.wake_rsocket.close()
+        self.wake_wsocket.close()
+        if self.debug:
+            logger.debug("%s: Exiting reactor thread.", str(self))
+
+
+class AsyncioChannelReactor (object):
+    """The ChannelReactor interface implemented with an asyncio event loop.
+
+    Registered channels are read by callbacks run from the loop, register and
+    unregister may be called from any thread.
+    """
+    def __init__ (self, loop, debug=False):
+        self.loop = loop
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.channel_fds = {}
+
+    def __str__ (self):
+        return "AsyncioChannelReactor({})".format(str(self.loop))
+
+    def count (self):
+        "Return the number of registered channels"
+        with self.lock:
+            return len(self.channel_fds)
+
+    def register (self, channel, callback):
+        """Call callback(data) from the event loop with data read from channel.
+
+        On EOF or close callback is passed an empty bytes object and the channel
+        is unregistered.
+        """
+        fd = channel.fileno()
+        with self.lock:
+            self.channel_fds[channel] = fd
+        # Callbacks are run in order so a remove is always done before a new
+        # add of a re-used fd.
+        self.loop.call_soon_threadsafe(self._add_reader, channel, callback, fd)
+
+    def unregister (self, channel):
+        with self.lock:
+            fd = self.channel_fds.pop(channel, None)
+        if fd is not None:
+            self.loop.call_soon_threadsafe(self.loop.remove_reader, fd)
+
+    def close (self):
+        with self.lock:
+            fds = list(self.channel_fds.values())
+            self.channel_fds = {}
+        for fd in fds:
+            self.loop.call_soon_threadsafe(self.loop.remove_reader, fd)
+
+    def _add_reader (self, channel, callback, fd):
+        with self.lock:
+            if self.channel_fds.get(channel) != fd:
+                return
+        try:
+            self.loop.add_reader(fd, self._read_channel, channel, callback, fd)
+        except (ValueError, IOError, OSError) as error:
+            logger.debug("%s: Ignoring add for fd %s: %s", str(self), str(fd), str(error))
+
+    def _read_channel (self, channel, callback, fd):
+        try:
+            if channel.recv_ready():
+                data = channel.recv(MAXSSHBUF)
+            elif channel.closed or channel.eof_received:
+                data = b""
+            else:
+                return
+        except Exception as error:
+            logger.error("%s: Unexpected exception reading %s: %s", str(self), str(channel), str(error))
+            data = b""
+
+        if not data:
+            with self.lock:
+                if self.channel_fds.get(channel) == fd:
+                    del self.channel_fds[channel]
+            self.loop.remove_reader(fd)
+        callback(data)
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import itertools
+import os
+import threading
+from sshutil.stats import Counters
+
+
+def open_fd_count ():
+    "Return the number of open file descriptors of this process or None if unknown"
+    try:
+        return len(os.listdir("/proc/self/fd")) - 1     # less the one listdir used
+    except OSError:
+        return None
+
+
+class SessionRegistry (object):
+    """The open connections of a server and the sessions on each.
+
+    Connections and sessions are keyed by an id assigned when they are added
+    (saved as their registry_id attribute) so removal is O(1). Removing
+    something not present (e.g., a second close()) is harmless.
+    """
+    def __init__ (self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.connections = {}
+        self.connection_sessions = {}
+        self.sessions = {}
+        self.counters = Counters("connections_opened",
+                                 "connections_closed",
+                                 "sessions_opened",
+                                 "sessions_closed")
+
+    def add_connection (self, conn):
+        with self.lock:
+            conn.registry_id = next(self.ids)
+            self.connections[conn.registry_id] = conn
+            self.connection_sessions[conn.registry_id] = {}
+        self.counters.incr("connections_opened")
+
+    def remove_connection (self, conn):
+        """Remove conn and any of its sessions, returning the sessions removed"""
+        conn_id = getattr(conn, "registry_id", None)
+        with self.lock:
+            if self.connections.pop(conn_id, None) is None:
+                return []
+            sessions = self.connection_sessions.pop(conn_id)
+            for session_id in sessions:
+                del self.sessions[session_id]
+        self.counters.incr("connections_closed")
+        if sessions:
+            self.counters.incr("sessions_closed", len(sessions))
+        return list(sessions.values())
+
+    def add_session (self, session, conn):
+        """Add session on connection conn, returns False if conn has already
+        been removed. Adding a session again returns whether it is still
+        present (it isn't re-added once removed)."""
+        conn_id = getattr(conn, "registry_id", None)
+        with self.lock:
+            session_id = getattr(session, "registry_id", None)
+            if session_id is not None:
+                return session_id in self.sessions
+            sessions = self.connection_sessions.get(conn_id)
+            if sessions is None:
+                return False
+            session.registry_id = next(self.ids)
+            sessions[session.registry_id] = session
+            self.sessions[session.registry_id] = conn_id
+        self.counters.incr("sessions_opened")
+        return True
+
+    def remove_session (self, session):
+        session_id = getattr(session, "registry_id", None)
+        with self.lock:
+            conn_id = self.sessions.pop(session_id, None)
+            if conn_id is None:
+                return
+            del self.connection_sessions[conn_id][session_id]
+        self.counters.incr("sessions_closed")
+
+    def get_connections (self):
+        with self.lock:
+            return list(self.connections.values())
+
+    def get_sessions (self, conn=None):
+        "Return the sessions on conn or on all connections if conn is None"
+        with self.lock:
+            if conn is None:
+                return [ session
+                         for sessions in self.connection_sessions.values()
+                         for session in sessions.values() ]
+            sessions = self.connection_sessions.get(getattr(conn, "registry_id", None))
+            return list(sessions.values()) if sessions else []
+
+    def get_stats (self):
+        stats = self.counters.get_stats()
+        with self.lock:
+            stats["connections"] = len(self.connections)
+            stats["sessions"] = len(self.sessions)
+        stats["threads"] = threading.active_count()
+        stats["fds"] = open_fd_count()
+        return stats
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
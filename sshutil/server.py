@@ -23,12 +23,58 @@ import os
 import select
 import socket
 import threading
+import time
 import traceback
 import paramiko as ssh
+from sshutil.admission import AdmissionControl
+from sshutil.pool import WorkerPool
+from sshutil.registry import SessionRegistry
+from sshutil.stats import Counters, Histogram, RateMeter
+from sshutil.timer import TimerQueue
 
 
 logger = logging.getLogger(__name__)
 
+# Channels a client may have open that it hasn't yet asked for a subsystem,
+# shell or command on, further channel opens are refused.
+MAX_PENDING_CHANNELS = 16
+
+# Host keys looked for when none are given, the cheaper to sign with first.
+HOST_KEY_PATHS = ("/etc/ssh/ssh_host_ed25519_key",
+                  "/etc/ssh/ssh_host_ecdsa_key",
+                  "/etc/ssh/ssh_host_rsa_key",
+                  "/etc/ssh/ssh_host_dsa_key")
+
+# The key classes this paramiko supports (DSS was removed in paramiko 4).
+HOST_KEY_CLASSES = [ getattr(ssh, name)
+                     for name in ("Ed25519Key", "ECDSAKey", "RSAKey", "DSSKey")
+                     if hasattr(ssh, name) ]
+
+
+def load_host_key (path):
+    """Load the private key in the file path whatever its type"""
+    # PKey.from_path (paramiko >= 3.2) determines the type from the file.
+    if hasattr(ssh.PKey, "from_path"):
+        return ssh.PKey.from_path(path)
+    for key_class in HOST_KEY_CLASSES:
+        try:
+            return key_class.from_private_key_file(path)
+        except (ssh.SSHException, ValueError):
+            continue
+    raise ssh.SSHException("Unsupported key type in {}".format(path))
+
+
+def _check_algorithms (kind, names, supported):
+    """Return names as a tuple, raising ValueError if any is not supported"""
+    if names is None:
+        return None
+    names = tuple(names)
+    if supported is not None:
+        unknown = [ name for name in names if name not in supported ]
+        if unknown:
+            raise ValueError("Unsupported {}: {}".format(kind, ", ".join(unknown)))
+    return names
+
 
 class SSHUserPassController (ssh.ServerInterface):
     def __init__ (self, username=None, password=None):
@@ -57,13 +103,75 @@ class SSHUserPassController (ssh.ServerInterface):
         return name == "netconf"
 
 
+class _ConnectionController (object):
+    """The server_ctl of one connection, passing each channel to the
+    connection when the client starts it (asks for a subsystem, shell or
+    command on it and server_ctl allows this).
+
+    paramiko also queues new channels for Transport.accept(), they are taken
+    from there and kept until started, at most MAX_PENDING_CHANNELS at a
+    time. Only used from the connection's transport thread.
+    """
+    def __init__ (self, server_ctl, server_socket, transport):
+        self.server_ctl = server_ctl
+        self.server_socket = server_socket
+        self.transport = transport
+        self.pending = {}
+
+    def __getattr__ (self, name):
+        return getattr(self.server_ctl, name)
+
+    def _take_accepts (self):
+        while True:
+            channel = self.transport.accept(0)
+            if channel is None:
+                return
+            self.pending[channel.get_id()] = channel
+
+    def _start (self, channel, ok):
+        if not ok:
+            return False
+        self._take_accepts()
+        if self.pending.pop(channel.get_id(), None) is None:
+            # Already started.
+            return False
+        return self.server_socket._channel_started(channel)             # pylint: disable=W0212
+
+    def check_channel_request (self, kind, chanid):
+        reason = self.server_ctl.check_channel_request(kind, chanid)
+        if reason != ssh.OPEN_SUCCEEDED:
+            return reason
+        self._take_accepts()
+        for channel in list(self.pending.values()):
+            if channel.closed:
+                del self.pending[channel.get_id()]
+        if len(self.pending) >= MAX_PENDING_CHANNELS:
+            logger.warning("%s: %d channels not started, refusing new channel",
+                           str(self.server_socket),
+                           len(self.pending))
+            return ssh.OPEN_FAILED_RESOURCE_SHORTAGE
+        return reason
+
+    def check_channel_subsystem_request (self, channel, name):
+        return self._start(channel, self.server_ctl.check_channel_subsystem_request(channel, name))
+
+    def check_channel_shell_request (self, channel):
+        return self._start(channel, self.server_ctl.check_channel_shell_request(channel))
+
+    def check_channel_exec_request (self, channel, command):
+        return self._start(channel, self.server_ctl.check_channel_exec_request(channel, command))
+
+
 class SSHServerSession (object):
-    def __init__ (self, stream, unused_server, unused_extra_args, debug):
+    def __init__ (self, stream, server, unused_extra_args, debug):
         self.stream = stream
+        self.server = server
         self.debug = debug
 
         self.reader_thread = None
         self.lock = threading.Lock()
+        # Time data was last sent or received, used to find idle sessions.
+        self.last_activity = time.time()
 
     def __del__ (self):
         if hasattr(self, "stream") and self.stream is not None:
@@ -79,6 +187,7 @@ class SSHServerSession (object):
     def send (self, data):
         with self.lock:
             stream = self.stream
+        self.last_activity = time.time()
         return stream.send(data)
 
     def recv (self, rlen):
@@ -86,12 +195,17 @@ class SSHServerSession (object):
             if not self.reader_thread or not self.reader_thread.keep_running:
                 return None
             stream = self.stream
-        return stream.recv(rlen)
+        data = stream.recv(rlen)
+        self.last_activity = time.time()
+        return data
 
     def close (self):
         if self.debug:
             logger.debug("%s: Closing.", str(self))
 
+        if self.server is not None:
+            self.server.registry.remove_session(self)
+
         with self.lock:
             if self.reader_thread:
                 self.reader_thread.keep_running = False
@@ -115,6 +229,8 @@ class SSHServerSession (object):
         # Called from reader thread when our reader thread exits
         if self.debug:
             logger.debug("%s: Reader thread exited.", str(self))
+        if self.server is not None:
+            self.server.registry.remove_session(self)
 
     def reader_handle_data (self, data):
         # Called from reader thread after receiving a framed message
@@ -179,7 +295,12 @@ class SSHServerSession (object):
 
 
 class SSHServerSocket (object):
-    """An SSH socket connection from a client"""
+    """An SSH socket connection from a client.
+
+    Sessions are opened on channels as the client starts them, from
+    server_ctl's checks of the client's requests (see _ConnectionController).
+    A thread per connection waits for the connection to end to release it.
+    """
     def __init__ (self,
                   server_ctl,
                   session_class,
@@ -195,123 +316,203 @@ class SSHServerSocket (object):
         self.client_addr = addr
         self.debug = debug
         self.server_ctl = server_ctl
-        self.sessions = []
+        self.ssh = None
+        self.running = False
+        self.lock = threading.Lock()
+        # Channels started while the connection is being setup, then None.
+        self.started = []
+        self.started_cv = threading.Condition(self.lock)
 
         try:
             if self.debug:
                 logger.debug("%s: Opening SSH connection", str(self))
 
+            start = time.time()
+            # Don't delay small packets (e.g., channel open confirmations)
+            # waiting on ACKs of the previous ones.
+            self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.ssh = ssh.Transport(self.client_socket)
-            self.ssh.add_server_key(self.server.host_key)
-            self.ssh.start_server(server=self.server_ctl)
-        except ssh.AuthenticationException as error:
+            # Lets sessions find their connection, see SSHServer.register_session.
+            self.ssh.server_socket = self
+            if server.handshake_timeout:
+                self.ssh.banner_timeout = server.handshake_timeout
+                self.ssh.handshake_timeout = server.handshake_timeout
+            for host_key in self.server.host_keys:
+                self.ssh.add_server_key(host_key)
+            self.server.set_security_options(self.ssh)
+            self.running = True
+            self.ssh.start_server(server=_ConnectionController(self.server_ctl, self, self.ssh))
+            if server.keepalive:
+                self.ssh.set_keepalive(server.keepalive)
+            server.handshake_latency.add(time.time() - start)
+            server.handshake_meter.mark()
+            server.registry.add_connection(self)
+
+            # The first channel can only be started after the client has
+            # authenticated, so this bounds the authentication stage.
+            channel = self._wait_started(server.auth_timeout)
+            if channel is None:
+                server.handshake_counters.incr("auth_timeout")
+                raise ssh.AuthenticationException("No channel started within {}s".format(
+                    server.auth_timeout))
+        except Exception as error:
+            self.running = False
+            server.registry.remove_connection(self)
+            if self.ssh:
+                self.ssh.close()
+                self.ssh = None
             self.client_socket.close()
             self.client_socket = None
-            logger.error("Authentication failed:  %s", str(error))
+            if isinstance(error, ssh.AuthenticationException):
+                logger.error("Authentication failed:  %s", str(error))
             raise
 
-        self.lock = threading.Lock()
-        self.running = True
+        self._open_channel_session(channel)
+
+        # Channels started from now on go straight to the handshake pool.
+        with self.lock:
+            started, self.started = self.started, None
+        for channel in started:
+            if not self._submit_channel(channel):
+                channel.close()
+
         self.thread = threading.Thread(None,
-                                       self._accept_chan_thread,
-                                       name="SSHAcceptThread")
+                                       self._connection_thread,
+                                       name="SSHConnectionThread")
         self.thread.daemon = True
         self.thread.start()
 
     def __str__ (self):
         return "SSHServerSocket(client: {})".format(self.client_addr)
 
+    @property
+    def sessions (self):
+        "The open sessions on this connection"
+        return self.server.registry.get_sessions(self)
+
+    def _wait_started (self, timeout):
+        "Return the first channel the client starts within timeout seconds or None"
+        deadline = time.time() + timeout
+        with self.lock:
+            while not self.started:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.started_cv.wait(remaining)
+            return self.started.pop(0)
+
+    def _channel_started (self, channel):
+        """Called from the transport thread when the client starts a channel,
+        returns False if it is refused."""
+        with self.lock:
+            if not self.running:
+                return False
+            if self.started is not None:
+                self.started.append(channel)
+                self.started_cv.notify()
+                return True
+        return self._submit_channel(channel)
+
+    def _submit_channel (self, channel):
+        if self.server.handshake_pool.submit(self._open_channel_session, channel):
+            return True
+        logger.warning("%s: Handshake pool full, refusing new channel", str(self))
+        self.server.handshake_counters.incr("rejected")
+        return False
+
+    def _open_channel_session (self, channel):
+        """Create a session for a new channel, this may block (e.g., exchanging
+        hello messages) so is run from the servers handshake pool."""
+        start = time.time()
+        try:
+            session = self.session_class(channel, self.server, self.extra_args, self.debug)
+        except Exception as error:
+            self.server.handshake_counters.incr("session_failed")
+            logger.error("%s: Failed to open session: %s", str(self), str(error))
+            channel.close()
+            return
+        self.server.session_open_latency.add(time.time() - start)
+        # The session may have already closed, or we may have been closed.
+        if not self.server.register_session(session, channel):
+            session.close()
+        elif not session.is_active():
+            self.server.registry.remove_session(session)
+
     def close (self):
 
         with self.lock:
             logger.debug("%s: close socket", str(self))
             self.running = False
 
-            sessions = self.sessions
-            for session in sessions:
+            for session in self.server.registry.remove_connection(self):
                 session.close()
-            self.sessions = []
-
-            # Closing one of these should cause a blocking accept to exit
-            if self.ssh:
-                logger.debug("%s: close closing ssh conn %s", str(self), str(self.ssh))
-                self.ssh.close()
-                self.ssh = None
 
-            if self.client_socket:
-                logger.debug("%s: close closing client socket %s",
-                             str(self),
-                             str(self.client_socket))
-                self.client_socket.close()
-                self.client_socket = None
+            thread = getattr(self, "thread", None)
+            if thread is not None and thread is not threading.current_thread() and thread.is_alive():
+                # The connection's thread is waiting for the transport to end.
+                # Shutting down the socket ends it, and the thread then
+                # closes the transport and socket calling us.
+                if self.client_socket:
+                    try:
+                        self.client_socket.shutdown(socket.SHUT_RDWR)
+                    except socket.error:
+                        pass
+            else:
+                if self.ssh:
+                    logger.debug("%s: close closing ssh conn %s", str(self), str(self.ssh))
+                    self.ssh.close()
+                    self.ssh = None
+
+                if self.client_socket:
+                    logger.debug("%s: close closing client socket %s",
+                                 str(self),
+                                 str(self.client_socket))
+                    self.client_socket.close()
+                    self.client_socket = None
 
         # wait on the thread to quit?
-        logger.debug("%s: close joining thread", str(self))
+        if thread is not None and thread is not threading.current_thread():
+            logger.debug("%s: close joining thread", str(self))
+            thread.join()
+            logger.debug("%s: close *** joined *** thread", str(self))
 
-        self.thread.join()
-        logger.debug("%s: close *** joined *** thread", str(self))
-
-    def _accept_chan_thread (self):
+    def is_active (self):
+        with self.lock:
+            return self.running and self.ssh is not None and self.ssh.is_active()
+
+    def reap (self, now, idle_timeout):
+        """Remove closed sessions and close sessions idle for idle_timeout
+        seconds (if not 0). Returns the number of (reaped, leaked) sessions,
+        leaked sessions are those already closed."""
+        reaped = []
+        leaked = 0
+        for session in self.sessions:
+            if not session.is_active():
+                leaked += 1
+                self.server.registry.remove_session(session)
+            elif idle_timeout and now - getattr(session, "last_activity", now) >= idle_timeout:
+                reaped.append(session)
+
+        for session in reaped:
+            logger.info("%s: Closing idle session %s", str(self), str(session))
+            session.close()
+        return len(reaped), leaked
+
+    def _connection_thread (self):
+        """Wait for the transport to end, which close() also causes, and
+        release the connection."""
         try:
-            while True:
-                with self.lock:
-                    if not self.running:
-                        logger.debug("%s: Exiting thread", str(self))
-                        break
-
-                    # grab this while we have the lock
-                    ssh_conn = self.ssh
-
-                if self.debug:
-                    logger.debug("%s: Accepting channel connections", str(self))
-
-                # accept with 1s timeout, this doesn't return when we close the connection for some
-                # reason so we cannot just simply wait forever which would be preferable.
-                channel = ssh_conn.accept(timeout=1)
-
-                with self.lock:
-                    if not self.running:
-                        if channel:
-                            logger.debug("%s: Closing channel after shutdown %s",
-                                         str(self),
-                                         str(channel))
-                            channel.close()
-                        logger.debug("%s: Exiting thread", str(self))
-                        return
-
-                    if channel is None:
-                        if not self.ssh.is_active():
-                            logger.info("%s: Got channel as None not active so exiting", str(self))
-                            self.running = False
-                            return
-
-                        # We can't warn here if we are doing timeouts see above.
-                        # logger.warn("%s: Got channel as None still active.", str(self))
-                        if self.debug:
-                            logger.debug("%s: Got channel as None must be timeout.", str(self))
-                        continue
-
-                session = self.session_class(channel, self.server, self.extra_args, self.debug)
-                with self.lock:
-                    self.sessions.append(session)
-
-        except Exception as error:
-            if self.debug:
-                logger.error("%s: Unexpected exception: %s: %s",
-                             str(self),
-                             str(error),
-                             traceback.format_exc())
-            else:
-                logger.error("%s: Unexpected exception: %s closing",
-                             str(self),
-                             str(error))
-
-            self.client_socket.close()
-            self.client_socket = None
-            self.server.remove_socket(self)
-        except:
-            logger.error("%s: ********** Unexpected exception")
-            raise
+            with self.lock:
+                ssh_conn = self.ssh
+            if ssh_conn is not None:
+                # Transport is the thread running the connection.
+                ssh_conn.join()
+            logger.debug("%s: Connection ended", str(self))
+        finally:
+            # The connection is finished, release everything now rather
+            # than waiting on the reaper.
+            self.close()
+            self.server.admission.release(self.client_addr[0])
 
 
 class SSHServer (object):
@@ -326,8 +527,56 @@ class SSHServer (object):
                   extra_args=None,
                   port=None,
                   host_key=None,
-                  debug=False):
-
+                  debug=False,
+                  handshake_workers=8,
+                  handshake_backlog=100,
+                  handshake_timeout=15,
+                  auth_timeout=30,
+                  listen_backlog=100,
+                  max_sessions=0,
+                  max_sessions_per_ip=0,
+                  handshake_rate=0,
+                  handshake_burst=None,
+                  overload_backlog=0,
+                  keepalive=0,
+                  idle_timeout=0,
+                  reap_interval=60,
+                  reuse_port=False,
+                  kex_algorithms=None,
+                  ciphers=None,
+                  macs=None):
+        """
+        host_key is the path of a private host key file or a list of them
+        (e.g., one each of Ed25519, ECDSA and RSA), the type of each key is
+        found from the file. If not given the keys in HOST_KEY_PATHS that
+        exist are used. kex_algorithms, ciphers and macs if given are the
+        names of the algorithms to allow in order of preference, by default
+        paramiko's preferences are used.
+
+        Handshakes, authentication and session setup for new connections are
+        run by a pool of handshake_workers threads with at most
+        handshake_backlog connections waiting, further connections are closed.
+        handshake_timeout bounds the SSH version exchange and key exchange and
+        auth_timeout the time allowed for the client to authenticate and start
+        its first channel.
+
+        New connections are refused before any handshake work is done if
+        there are max_sessions client connections (max_sessions_per_ip from
+        the same address), if they arrive faster than handshake_rate per
+        second (with bursts of handshake_burst), or while in overload mode.
+        Overload mode is entered using set_overload() or while overload_backlog
+        connections are waiting for a handshake worker. 0 means no limit.
+
+        If keepalive is not 0 an SSH keepalive is sent after that many
+        seconds without traffic so dead peers are found. Every reap_interval
+        seconds closed sessions are removed, as are sessions without any
+        traffic for idle_timeout seconds (if not 0) and connections left
+        without sessions by this.
+
+        If reuse_port is True the listening sockets are opened with
+        SO_REUSEPORT so several processes can each run a server on the same
+        port, the kernel spreading new connections among them.
+        """
         if server_ctl is None:
             server_ctl = SSHUserPassController()
         self.server_ctl = server_ctl
@@ -345,25 +594,53 @@ class SSHServer (object):
         if port is None:
             port = 0
         self.port = port
-        self.host_key = None
-
-        # Load the host key for our ssh server.
+        self.handshake_timeout = handshake_timeout
+        self.auth_timeout = auth_timeout
+
+        self.handshake_meter = RateMeter()
+        self.handshake_latency = Histogram()
+        self.session_open_latency = Histogram()
+        self.handshake_counters = Counters("accepted", "rejected", "failed", "auth_timeout", "session_failed")
+        self.handshake_pool = WorkerPool("SSHHandshake", handshake_workers, handshake_backlog)
+        self.overload_backlog = overload_backlog
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.session_counters = Counters("reaped", "leaked")
+        self.registry = SessionRegistry()
+        self.timer = TimerQueue("SSHReaper")
+        if reap_interval:
+            self.timer.schedule(reap_interval, self._reap_sessions)
+        self.admission = AdmissionControl(max_sessions,
+                                          max_sessions_per_ip,
+                                          handshake_rate,
+                                          handshake_burst)
+
+        self.kex_algorithms = _check_algorithms("key exchange", kex_algorithms,
+                                                getattr(ssh.Transport, "_kex_info", None))
+        self.ciphers = _check_algorithms("ciphers", ciphers,
+                                         getattr(ssh.Transport, "_cipher_info", None))
+        self.macs = _check_algorithms("MACs", macs, getattr(ssh.Transport, "_mac_info", None))
+
+        # Load the host keys for our ssh server.
         if host_key:
-            assert os.path.exists(host_key)
-            self.host_key = ssh.RSAKey.from_private_key_file(host_key)
+            paths = list(host_key) if isinstance(host_key, (list, tuple)) else [ host_key ]
+            for keypath in paths:
+                assert os.path.exists(keypath)
         else:
-            for keypath in [ "/etc/ssh/ssh_host_rsa_key",
-                             "/etc/ssh/ssh_host_dsa_key"]:
-                # XXX check we have access
-                if os.path.exists(keypath):
-                    self.host_key = ssh.RSAKey.from_private_key_file(keypath)
-                    break
+            paths = [ keypath for keypath in HOST_KEY_PATHS if os.access(keypath, os.R_OK) ]
+        self.host_keys = [ load_host_key(keypath) for keypath in paths ]
+        self.host_key = self.host_keys[0] if self.host_keys else None
+        if self.debug:
+            logger.debug("Server host keys: %s", ", ".join(k.get_name() for k in self.host_keys))
 
         # Bind first to IPv6, if the OS supports binding per AF then the IPv4
         # will succeed, otherwise the IPv6 will support both AF.
         for pname, host, proto in [ ("IPv6", '::', socket.AF_INET6), ("IPv4", '', socket.AF_INET) ]:
             protosocket = socket.socket(proto, socket.SOCK_STREAM)
             protosocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                protosocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             if self.debug:
                 logger.debug("Server binding to proto %s port %s", str(pname), str(port))
             if proto == socket.AF_INET:
@@ -389,22 +666,26 @@ class SSHServer (object):
 
             if self.debug:
                 logger.debug("Server listening on proto %s port %s", str(pname), str(port))
-            protosocket.listen(100)
+            protosocket.listen(listen_backlog)
 
             # Create a socket to cause closure.
             self.close_wsocket, self.close_rsocket = socket.socketpair()
 
             self.lock = threading.Lock()
-            self.sockets = []
 
-            self.thread = threading.Thread(None,
-                                           self._accept_socket_thread,
-                                           name="SSHAcceptThread " + pname,
-                                           args=[protosocket])
-            self.thread.daemon = True
-            self.thread.start()
+            self._start_accept(pname, protosocket)
+
+    def _start_accept (self, pname, protosocket):
+        "Start accepting connections on the listening socket protosocket"
+        self.thread = threading.Thread(None,
+                                       self._accept_socket_thread,
+                                       name="SSHAcceptThread " + pname,
+                                       args=[protosocket])
+        self.thread.daemon = True
+        self.thread.start()
 
     def close (self):
+        self.timer.close()
         with self.lock:
             logger.info("Sending close signal to accept socket")
             assert self.thread.is_alive()
@@ -416,9 +697,147 @@ class SSHServer (object):
         self.thread.join()
         self.thread = None
 
+    def set_security_options (self, transport):
+        "Apply our algorithm preferences to transport before it is started"
+        options = transport.get_security_options()
+        if self.kex_algorithms:
+            options.kex = self.kex_algorithms
+        if self.ciphers:
+            options.ciphers = self.ciphers
+        if self.macs:
+            options.digests = self.macs
+
+    @property
+    def sockets (self):
+        "The open client connections"
+        return self.registry.get_connections()
+
     def remove_socket (self, serversocket):
-        with self.lock:
-            self.sockets.remove(serversocket)
+        self.registry.remove_connection(serversocket)
+
+    def register_session (self, session, channel):
+        """Add session on channel to the registry, returns False if its
+        connection has closed. Sessions that handle requests before their
+        constructor returns call this first so they are visible (e.g., to
+        notifications) as soon as they are."""
+        serversocket = getattr(channel.get_transport(), "server_socket", None)
+        return self.registry.add_session(session, serversocket)
+
+    def get_stats (self):
+        "Return a dictionary of statistics on the handshakes performed by the server"
+        return {
+            "handshake_meter": self.handshake_meter.get_stats(),
+            "handshake_latency": self.handshake_latency.get_stats(),
+            "session_open_latency": self.session_open_latency.get_stats(),
+            "handshakes": self.handshake_counters.get_stats(),
+            "handshake_pending": self.handshake_pool.pending(),
+            "admission": self.admission.get_stats(),
+            "sessions": self.get_session_stats(),
+            "registry": self.registry.get_stats(),
+        }
+
+    def get_session_stats (self):
+        "Return the number of live sessions and those reaped or found leaked"
+        stats = self.session_counters.get_stats()
+        stats["live"] = sum(1 for session in self.registry.get_sessions() if session.is_active())
+        stats["connections"] = len(self.registry.connections)
+        return stats
+
+    def _reap_sessions (self):
+        """Called from our timer to remove closed and idle sessions and the
+        connections left without any."""
+        try:
+            now = time.time()
+            for sock in self.sockets:
+                try:
+                    self._reap_socket(sock, now)
+                except Exception as error:
+                    logger.error("%s: Unexpected exception reaping %s: %s: %s",
+                                 str(self),
+                                 str(sock),
+                                 str(error),
+                                 traceback.format_exc())
+        finally:
+            # Whatever happened above keep reaping.
+            self.timer.schedule(self.reap_interval, self._reap_sessions)
+
+    def _reap_socket (self, sock, now):
+        reaped, leaked = sock.reap(now, self.idle_timeout)
+        if reaped:
+            self.session_counters.incr("reaped", reaped)
+        if leaked:
+            self.session_counters.incr("leaked", leaked)
+        if sock.sessions or (sock.is_active() and not reaped):
+            return
+        if self.debug:
+            logger.debug("%s: Removing connection %s", str(self), str(sock))
+        sock.close()
+
+    def set_overload (self, reason):
+        "Refuse new connections with reason until clear_overload() is called"
+        self.admission.set_overload(reason)
+
+    def clear_overload (self):
+        self.admission.clear_overload()
+
+    def _handshake (self, client, addr):
+        """Called from a handshake pool worker to setup a new client connection."""
+        try:
+            sock = self.server_socket_class(self.server_ctl,
+                                            self.server_session_class,
+                                            self.extra_args,
+                                            self,
+                                            client,
+                                            addr,
+                                            self.debug)
+            if self.debug:
+                logger.debug("%s: Client connection open: %s", str(self), str(sock))
+        except ssh.AuthenticationException as error:
+            self.handshake_counters.incr("failed")
+            self.admission.release(addr[0])
+            logger.debug("%s: Client auth failed: %s: %s: %s",
+                         str(self),
+                         str(client),
+                         str(addr),
+                         str(error))
+        except Exception as error:
+            self.handshake_counters.incr("failed")
+            self.admission.release(addr[0])
+            logger.info("%s: Client handshake failed: %s: %s",
+                        str(self),
+                        str(addr),
+                        str(error))
+
+    def _accept_client (self, client, addr):
+        """Hand a newly accepted client to the handshake pool, or close it if
+        the pool is full."""
+        logger.debug("%s: Client accepted: %s: %s", str(self), str(client), str(addr))
+        overload = None
+        if self.overload_backlog and self.handshake_pool.pending() >= self.overload_backlog:
+            overload = "handshake backlog"
+        reason = self.admission.admit(addr[0], overload)
+        if reason is not None:
+            logger.info("%s: Refusing client %s: %s", str(self), str(addr), reason)
+            self._refuse_client(client, reason)
+        elif self.handshake_pool.submit(self._handshake, client, addr):
+            self.handshake_counters.incr("accepted")
+        else:
+            logger.warning("%s: Handshake pool full, closing client: %s",
+                           str(self),
+                           str(addr))
+            self.handshake_counters.incr("rejected")
+            self.admission.release(addr[0])
+            client.close()
+
+    def _refuse_client (self, client, reason):
+        # The server may send lines before its version string (RFC 4253 4.2),
+        # so clients can report why they were refused.
+        try:
+            client.setblocking(False)
+            client.send("{}\r\n".format(reason).encode('utf-8'))
+        except socket.error:
+            pass
+        client.close()
 
     def _accept_socket_thread (self, proto_sock):
         """Call from within a thread to accept connections."""
@@ -432,17 +851,14 @@ class SSHServer (object):
                     if self.debug:
                         logger.debug("%s: Got close notification closing down server", str(self))
 
-                    # with self.lock:
-                    #     sockets = list(self.sockets)
-                    sockets = list(self.sockets)
+                    sockets = self.sockets
                     logger.debug("%s: closing %d server socket[s]", str(self), len(sockets))
 
                     # These sockets are channels
                     for sock in sockets:
-                        if sock in self.sockets:
-                            if self.debug:
-                                logger.debug("%s: closing server socket %s", str(self), str(sock))
-                            sock.close()
+                        if self.debug:
+                            logger.debug("%s: closing server socket %s", str(self), str(sock))
+                        sock.close()
 
                     # Not until we have a real shutdown
                     # assert not self.sockets
@@ -466,23 +882,7 @@ class SSHServer (object):
 
                 if proto_sock in rfds:
                     client, addr = proto_sock.accept()
-                    logger.debug("%s: Client accepted: %s: %s", str(self), str(client), str(addr))
-                    try:
-                        sock = self.server_socket_class(self.server_ctl,
-                                                        self.server_session_class,
-                                                        self.extra_args,
-                                                        self,
-                                                        client,
-                                                        addr,
-                                                        self.debug)
-                        with self.lock:
-                            self.sockets.append(sock)
-                    except ssh.AuthenticationException as error:
-                        logger.debug("%s: Client auth failed: %s: %s: %s",
-                                     str(self),
-                                     str(client),
-                                     str(addr),
-                                     str(error))
+                    self._accept_client(client, addr)
 
         except Exception as error:
             if self.debug:
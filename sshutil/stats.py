@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import bisect
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                   0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counters (object):
+    """A thread safe set of named counters"""
+    def __init__ (self, *names):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(names, 0)
+
+    def incr (self, name, value=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def get (self, name):
+        with self.lock:
+            return self.counts.get(name, 0)
+
+    def get_stats (self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class Histogram (object):
+    """A thread safe histogram of values (e.g., latencies in seconds) using fixed buckets"""
+    def __init__ (self, buckets=LATENCY_BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [ 0 ] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add (self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.total += value
+            if value > self.maximum:
+                self.maximum = value
+
+    def percentile (self, pct):
+        """Return the upper bound of the bucket containing the pct percentile
+        or the maximum value if it lies beyond the last bucket"""
+        with self.lock:
+            if not self.count:
+                return None
+            want = self.count * pct / 100.0
+            seen = 0
+            for idx, count in enumerate(self.counts):
+                seen += count
+                if seen >= want and count:
+                    if idx < len(self.buckets):
+                        return min(self.buckets[idx], self.maximum)
+                    break
+            return self.maximum
+
+    def get_stats (self):
+        with self.lock:
+            count = self.count
+            buckets = list(zip(self.buckets + (float("inf"),), self.counts))
+            mean = self.total / count if count else None
+            maximum = self.maximum
+        return {
+            "count": count,
+            "mean": mean,
+            "max": maximum,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": buckets,
+        }
+
+
+class RateMeter (object):
+    """Track the rate of events per second over a sliding window of 1 second slots"""
+    def __init__ (self, window=10):
+        self.lock = threading.Lock()
+        self.window = window
+        self.slots = [ 0 ] * window
+        self.slot_time = [ 0 ] * window
+        self.total = 0
+
+    def mark (self, count=1):
+        now = int(time.time())
+        idx = now % self.window
+        with self.lock:
+            if self.slot_time[idx] != now:
+                self.slot_time[idx] = now
+                self.slots[idx] = 0
+            self.slots[idx] += count
+            self.total += count
+
+    def rate (self):
+        "Return the average events per second over the window"
+        now = int(time.time())
+        with self.lock:
+            count = sum(c for c, t in zip(self.slots, self.slot_time) if now - t < self.window)
+        return count / self.window
+
+    def get_stats (self):
+        with self.lock:
+            total = self.total
+        return { "total": total, "per_second": self.rate() }
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import heapq
+import itertools
+import logging
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class TimerQueue (object):
+    """Run callbacks at given times from a single thread.
+
+    Timers are kept in a heap ordered by expiry so any number of timers cost
+    one thread that only wakes when the earliest timer expires. The thread
+    is started by the first schedule() so an unused queue costs nothing.
+    Cancelled timers are left in the heap until they expire or make up half
+    of it, when it is rebuilt without them.
+    """
+    def __init__ (self, name="SSHTimer"):
+        self.name = name
+        self.cv = threading.Condition()
+        self.heap = []
+        self.sequence = itertools.count()
+        # Cancelled timers still in heap.
+        self.cancelled = 0
+        self.running = True
+        self.thread = None
+
+    def __str__ (self):
+        return "TimerQueue(\"{}\")".format(self.name)
+
+    def schedule (self, delay, func, *args):
+        """Call func(*args) after delay seconds, returns a timer for cancel()"""
+        timer = [ time.time() + delay, next(self.sequence), func, args ]
+        with self.cv:
+            if self.thread is None and self.running:
+                self.thread = threading.Thread(None, self._timer_thread, name=self.name)
+                self.thread.daemon = True
+                self.thread.start()
+            heapq.heappush(self.heap, timer)
+            # Only wake the thread if this is the new earliest timer.
+            if self.heap[0] is timer:
+                self.cv.notify()
+        return timer
+
+    def cancel (self, timer):
+        "Cancel a timer returned by schedule(), it's harmless if it already ran"
+        with self.cv:
+            if timer[2] is None:
+                return
+            timer[2] = None
+            timer[3] = None
+            self.cancelled += 1
+            if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):
+                self.heap = [ t for t in self.heap if t[2] is not None ]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+
+    def pending (self):
+        "Return the number of scheduled timers"
+        with self.cv:
+            return len(self.heap) - self.cancelled
+
+    def close (self):
+        with self.cv:
+            self.running = False
+            self.heap = []
+            self.cancelled = 0
+            self.cv.notify()
+
+    def _timer_thread (self):
+        while True:
+            with self.cv:
+                while self.running:
+                    if not self.heap:
+                        self.cv.wait()
+                        continue
+                    delay = self.heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self.cv.wait(delay)
+                if not self.running:
+                    return
+                timer = heapq.heappop(self.heap)
+                unused, unused, func, args = timer
+                if func is None:
+                    self.cancelled -= 1
+                    continue
+                # Ran, a later cancel() is a no-op.
+                timer[2] = None
+                timer[3] = None
+
+            try:
+                func(*args)
+            except Exception as error:
+                logger.error("%s: Unexpected exception in timer: %s: %s",
+                             str(self),
+                             str(error),
+                             traceback.format_exc())
+
+
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"